@@ -0,0 +1,247 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Benchmarks SQL item graph and autodetector hot paths on synthetic configurations.
+
+Runs offline, no database is required. Results (scaling curves) are saved as JSON, so that
+they can be compared across versions:
+
+    $ python benchmarks/bench_graph.py --sizes 100,1000,10000
+    $ python benchmarks/bench_graph.py --compare benchmarks/results/graph-0.1.1.json
+"""
+from __future__ import unicode_literals, print_function
+
+import argparse
+import gc
+import json
+import os
+import platform
+import sys
+import time
+from timeit import default_timer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import django
+from django.conf import settings
+
+settings.configure(INSTALLED_APPS=['migrate_sql'])
+django.setup()
+
+from django.db.migrations.state import ProjectState
+
+import migrate_sql
+from migrate_sql.autodetector import MigrationAutodetector, is_sql_equal
+from migrate_sql.graph import SQLStateGraph
+
+import synthetic
+
+DEFAULT_SIZES = (100, 1000, 5000, 10000, 50000)
+FUNCTIONS = ('build_graph', 'ensure_not_cyclic', 'assemble_changes',
+             'generate_sql_changes', 'is_sql_equal')
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results')
+
+
+def make_graph(items, build=True):
+    graph = SQLStateGraph()
+    for app_label, sql_item in items:
+        key = (app_label, sql_item.name)
+        graph.add_node(key, sql_item)
+        for dep in sql_item.dependencies:
+            graph.add_lazy_dependency(key, dep)
+    if build:
+        graph.build_graph()
+    return graph
+
+
+def make_autodetector(old_items, new_items):
+    from_state = ProjectState()
+    from_state.sql_state = make_graph(old_items, build=False)
+    autodetector = MigrationAutodetector(
+        from_state, ProjectState(), to_sql_graph=make_graph(new_items))
+    autodetector.generated_operations = {}
+    return autodetector
+
+
+def timed(func, setup, repeat):
+    """
+    Best of `repeat` runs of `func(setup())`, `setup` is not timed.
+    """
+    best = None
+    for _ in range(repeat):
+        arg = setup()
+        gc.collect()
+        start = default_timer()
+        func(arg)
+        elapsed = default_timer() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def bench_build_graph(old_items, new_items, repeat):
+    return timed(lambda graph: graph.build_graph(),
+                 lambda: make_graph(new_items, build=False), repeat)
+
+
+def bench_ensure_not_cyclic(old_items, new_items, repeat):
+    def run(graph):
+        graph.ensure_not_cyclic(None, lambda x: (p.key for p in graph.node_map[x].parents))
+    return timed(run, lambda: make_graph(new_items), repeat)
+
+
+def bench_assemble_changes(old_items, new_items, repeat):
+    old_keys = set((app_label, sql_item.name) for app_label, sql_item in old_items)
+    old_sql = dict(((app_label, sql_item.name), sql_item.sql) for app_label, sql_item in old_items)
+    new_keys = set()
+    changed_keys = set()
+    for app_label, sql_item in new_items:
+        key = (app_label, sql_item.name)
+        if key not in old_keys:
+            new_keys.add(key)
+        elif old_sql[key] != sql_item.sql:
+            changed_keys.add(key)
+
+    def run(autodetector):
+        autodetector.assemble_changes(set(new_keys), set(changed_keys), autodetector.to_sql_graph)
+    return timed(run, lambda: make_autodetector(old_items, new_items), repeat)
+
+
+def bench_generate_sql_changes(old_items, new_items, repeat):
+    return timed(lambda autodetector: autodetector.generate_sql_changes(),
+                 lambda: make_autodetector(old_items, new_items), repeat)
+
+
+def bench_is_sql_equal(old_items, new_items, repeat):
+    old_sql = dict(((app_label, sql_item.name), sql_item.sql) for app_label, sql_item in old_items)
+    pairs = [(old_sql[(app_label, sql_item.name)], sql_item.sql)
+             for app_label, sql_item in new_items if (app_label, sql_item.name) in old_sql]
+
+    def run(pairs):
+        for sql1, sql2 in pairs:
+            is_sql_equal(sql1, sql2)
+    return timed(run, lambda: pairs, repeat)
+
+
+BENCHMARKS = {
+    'build_graph': bench_build_graph,
+    'ensure_not_cyclic': bench_ensure_not_cyclic,
+    'assemble_changes': bench_assemble_changes,
+    'generate_sql_changes': bench_generate_sql_changes,
+    'is_sql_equal': bench_is_sql_equal,
+}
+
+
+def run(shapes, sizes, functions, apps, change_ratio, repeat, max_seconds, seed):
+    """
+    Run benchmarks and return list of measurements.
+
+    Once a measurement of a function on some shape exceeds `max_seconds`, bigger sizes of
+    that shape are skipped for that function.
+    """
+    results = []
+    for shape in shapes:
+        slow = set()
+        for size in sizes:
+            old_items = synthetic.generate(shape, size, apps=apps, seed=seed)
+            new_items = synthetic.mutate(old_items, change_ratio=change_ratio, apps=apps,
+                                         seed=seed)
+            edges = sum(len(sql_item.dependencies) for _, sql_item in new_items)
+            for function in functions:
+                result = {'shape': shape, 'size': size, 'edges': edges, 'function': function,
+                          'seconds': None, 'error': None}
+                if function in slow:
+                    result['error'] = 'skipped'
+                else:
+                    try:
+                        result['seconds'] = BENCHMARKS[function](old_items, new_items, repeat)
+                    except RuntimeError as ex:
+                        # RecursionError on deep graphs is a RuntimeError subclass.
+                        result['error'] = ex.__class__.__name__
+                    if result['error'] or result['seconds'] > max_seconds:
+                        slow.add(function)
+                results.append(result)
+                print_result(result)
+    return results
+
+
+def print_result(result, baseline=None):
+    if result['seconds'] is None:
+        timing = result['error']
+    else:
+        timing = '{:.6f}s'.format(result['seconds'])
+    line = '{shape:>8} {size:>7} {function:>22}  {timing}'.format(timing=timing, **result)
+    if baseline and baseline.get('seconds') and result['seconds']:
+        line += '  (x{:.2f} vs baseline)'.format(result['seconds'] / baseline['seconds'])
+    print(line)
+
+
+def compare(results, path):
+    """
+    Print ratios of current results to the ones saved in `path`.
+    """
+    with open(path) as baseline_file:
+        baseline = json.load(baseline_file)
+    index = dict(((r['shape'], r['size'], r['function']), r) for r in baseline['results'])
+    print('\nCompared to version {} ({}):'.format(baseline['version'], path))
+    for result in results:
+        print_result(result, index.get((result['shape'], result['size'], result['function'])))
+
+
+def save(results, path, options):
+    directory = os.path.dirname(path)
+    if directory and not os.path.isdir(directory):
+        os.makedirs(directory)
+    data = {
+        'version': migrate_sql.__version__,
+        'django': django.get_version(),
+        'python': platform.python_version(),
+        'timestamp': int(time.time()),
+        'options': options,
+        'results': results,
+    }
+    with open(path, 'w') as output:
+        json.dump(data, output, indent=2, sort_keys=True)
+    print('\nResults saved to {}'.format(path))
+
+
+def comma_list(convert):
+    return lambda value: [convert(v) for v in value.split(',') if v]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--shapes', type=comma_list(str), default=list(synthetic.SHAPES))
+    parser.add_argument('--sizes', type=comma_list(int), default=list(DEFAULT_SIZES))
+    parser.add_argument('--functions', type=comma_list(str), default=list(FUNCTIONS))
+    parser.add_argument('--apps', type=int, default=4,
+                        help='Number of applications items are distributed among.')
+    parser.add_argument('--change-ratio', type=float, default=0.1,
+                        help='Share of items changed between compared versions.')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--max-seconds', type=float, default=30.0,
+                        help='Skip bigger sizes once a measurement takes longer.')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default=None,
+                        help='JSON file to save results to. '
+                             'Default is results/graph-<version>.json.')
+    parser.add_argument('--compare', default=None, help='JSON results file to compare with.')
+    args = parser.parse_args(argv)
+
+    for name in args.shapes:
+        if name not in synthetic.SHAPES:
+            parser.error('Unknown shape {!r}, choose from {}.'.format(name, synthetic.SHAPES))
+    for name in args.functions:
+        if name not in BENCHMARKS:
+            parser.error('Unknown function {!r}, choose from {}.'.format(name, FUNCTIONS))
+
+    results = run(args.shapes, args.sizes, args.functions, args.apps, args.change_ratio,
+                  args.repeat, args.max_seconds, args.seed)
+    output = args.output or os.path.join(
+        RESULTS_DIR, 'graph-{}.json'.format(migrate_sql.__version__))
+    save(results, output, vars(args))
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,278 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Benchmarks execution of generated SQL item migrations.
+
+Generates migrations with hundreds of SQL items (views) using the autodetector, then applies
+and rolls them back, timing `state_forwards` and `database_forwards`/`database_backwards` of
+every operation. Uses in-memory SQLite by default (Django needs `sqlparse` to run SQL scripts
+on it), or a local PostgreSQL database:
+
+    $ python benchmarks/bench_migrate.py --items 500
+    $ python benchmarks/bench_migrate.py --items 500 --postgres migrate_sql_bench --db-user postgres
+"""
+from __future__ import unicode_literals, print_function
+
+import argparse
+import gc
+import json
+import os
+import platform
+import sys
+import time
+from collections import defaultdict
+from timeit import default_timer
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import django
+from django.conf import settings
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results')
+
+
+def configure(args):
+    if args.postgres:
+        database = {
+            'ENGINE': 'django.db.backends.postgresql_psycopg2',
+            'NAME': args.postgres,
+            'USER': args.db_user,
+            'PASSWORD': args.db_password,
+            'HOST': args.db_host,
+            'PORT': args.db_port,
+        }
+    else:
+        database = {'ENGINE': 'django.db.backends.sqlite3', 'NAME': ':memory:'}
+    settings.configure(INSTALLED_APPS=['migrate_sql'], DATABASES={'default': database})
+    django.setup()
+
+
+def generate_migrations(args):
+    """
+    Generate migrations of a single app: creation of all items, changes to some of them and
+    removal of all of them.
+
+    Returns:
+        (list) Django migrations.
+    """
+    from django.db.migrations import Migration
+    from django.db.migrations.state import ProjectState
+
+    from migrate_sql.autodetector import MigrationAutodetector
+    from migrate_sql.graph import SQLStateGraph
+
+    import synthetic
+
+    def make_graph(items):
+        graph = SQLStateGraph()
+        for app_label, sql_item in items:
+            key = (app_label, sql_item.name)
+            graph.add_node(key, sql_item)
+            for dep in sql_item.dependencies:
+                graph.add_lazy_dependency(key, dep)
+        graph.build_graph()
+        return graph
+
+    def diff(old_items, new_items, name):
+        from_state = ProjectState()
+        from_state.sql_state = make_graph(old_items)
+        autodetector = MigrationAutodetector(
+            from_state, ProjectState(), to_sql_graph=make_graph(new_items))
+        autodetector.generated_operations = {}
+        autodetector.generate_sql_changes()
+        autodetector._sort_migrations()
+        migration = Migration(name, 'app0')
+        migration.operations = autodetector.generated_operations.get('app0', [])
+        return migration
+
+    v1 = synthetic.generate(args.shape, args.items, seed=args.seed,
+                            factory=synthetic.make_view_item)
+    v2 = synthetic.mutate(v1, change_ratio=args.change_ratio, dep_change_ratio=0.05,
+                          seed=args.seed, factory=synthetic.make_view_item)
+    return [
+        diff([], v1, '0001_create'),
+        diff(v1, v2, '0002_alter'),
+        diff(v2, [], '0003_delete'),
+    ]
+
+
+class Stats(object):
+    """
+    Accumulates timings per (phase, operation class).
+    """
+    def __init__(self):
+        self.data = defaultdict(lambda: {'count': 0, 'clone': 0.0, 'state': 0.0, 'database': 0.0})
+
+    def add(self, phase, operation, clone, state, database):
+        entry = self.data[(phase, operation.__class__.__name__)]
+        entry['count'] += 1
+        entry['clone'] += clone
+        entry['state'] += state
+        entry['database'] += database
+
+    def rows(self):
+        for (phase, name), entry in sorted(self.data.items()):
+            total = entry['clone'] + entry['state'] + entry['database']
+            row = dict(entry, phase=phase, operation=name, total=total)
+            row['ops_per_second'] = entry['count'] / total if total else None
+            yield row
+
+
+def apply_migration(migration, state, schema_editor, stats):
+    """
+    Same as `Migration.apply`, but timed.
+    """
+    for operation in migration.operations:
+        start = default_timer()
+        old_state = state.clone()
+        cloned = default_timer()
+        operation.state_forwards(migration.app_label, state)
+        forwarded = default_timer()
+        operation.database_forwards(migration.app_label, schema_editor, old_state, state)
+        stats.add('apply', operation, cloned - start, forwarded - cloned,
+                  default_timer() - forwarded)
+    return state
+
+
+def unapply_migration(migration, state, schema_editor, stats):
+    """
+    Same as `Migration.unapply`, but timed.
+    """
+    to_run = []
+    new_state = state
+    for operation in migration.operations:
+        start = default_timer()
+        new_state = new_state.clone()
+        old_state = new_state.clone()
+        cloned = default_timer()
+        operation.state_forwards(migration.app_label, new_state)
+        forwarded = default_timer()
+        to_run.insert(0, (operation, old_state, new_state, cloned - start, forwarded - cloned))
+    for operation, to_state, from_state, clone, state_time in to_run:
+        start = default_timer()
+        operation.database_backwards(migration.app_label, schema_editor, from_state, to_state)
+        stats.add('rollback', operation, clone, state_time, default_timer() - start)
+
+
+def run_phase(phase, migrations, stats):
+    """
+    Applies or rolls back migrations, returns elapsed time and peak memory allocated in bytes.
+    """
+    from django.db import connection
+    from django.db.migrations.state import ProjectState
+
+    gc.collect()
+    if tracemalloc:
+        tracemalloc.start()
+    start = default_timer()
+    if phase == 'apply':
+        state = ProjectState()
+        for migration in migrations:
+            with connection.schema_editor() as schema_editor:
+                state = apply_migration(migration, state, schema_editor, stats)
+    else:
+        # states before every migration are needed to roll it back.
+        states = []
+        state = ProjectState()
+        for migration in migrations:
+            states.append(state)
+            state = migration.mutate_state(state)
+        for migration, state in reversed(list(zip(migrations, states))):
+            with connection.schema_editor() as schema_editor:
+                unapply_migration(migration, state, schema_editor, stats)
+    elapsed = default_timer() - start
+    peak = None
+    if tracemalloc:
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return elapsed, peak
+
+
+def max_rss():
+    try:
+        import resource
+    except ImportError:
+        return None
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def report(stats, phases):
+    print('{:>8} {:>16} {:>6} {:>10} {:>10} {:>10} {:>10} {:>10}'.format(
+        'phase', 'operation', 'count', 'clone', 'state', 'database', 'total', 'ops/s'))
+    for row in stats.rows():
+        print('{phase:>8} {operation:>16} {count:>6} {clone:>10.4f} {state:>10.4f} '
+              '{database:>10.4f} {total:>10.4f} {ops:>10.1f}'.format(
+                  ops=row['ops_per_second'] or 0, **row))
+    for phase, (operations, elapsed, peak) in sorted(phases.items()):
+        line = '{}: {} operations in {:.3f}s, {:.1f} ops/s'.format(
+            phase, operations, elapsed, operations / elapsed if elapsed else 0)
+        if peak is not None:
+            line += ', peak traced memory {:.1f} KiB'.format(peak / 1024.0)
+        print(line)
+    rss = max_rss()
+    if rss is not None:
+        print('max RSS: {} KiB'.format(rss))
+
+
+def main(argv=None):
+    import synthetic
+
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--items', type=int, default=300)
+    parser.add_argument('--shape', default='random', choices=synthetic.SHAPES)
+    parser.add_argument('--change-ratio', type=float, default=0.1)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--postgres', metavar='NAME', default=None,
+                        help='Run against local PostgreSQL database NAME instead of SQLite.')
+    parser.add_argument('--db-host', default='localhost')
+    parser.add_argument('--db-port', default='5432')
+    parser.add_argument('--db-user', default='')
+    parser.add_argument('--db-password', default='')
+    parser.add_argument('--output', default=None,
+                        help='JSON file to save results to. '
+                             'Default is results/migrate-<version>-<vendor>.json.')
+    args = parser.parse_args(argv)
+
+    configure(args)
+
+    import migrate_sql
+    from django.db import connection
+
+    migrations = generate_migrations(args)
+    stats = Stats()
+    phases = {}
+    for phase in ('apply', 'rollback'):
+        elapsed, peak = run_phase(phase, migrations, stats)
+        operations = sum(len(migration.operations) for migration in migrations)
+        phases[phase] = (operations, elapsed, peak)
+    report(stats, phases)
+
+    output = args.output or os.path.join(RESULTS_DIR, 'migrate-{}-{}.json'.format(
+        migrate_sql.__version__, connection.vendor))
+    directory = os.path.dirname(output)
+    if directory and not os.path.isdir(directory):
+        os.makedirs(directory)
+    data = {
+        'version': migrate_sql.__version__,
+        'django': django.get_version(),
+        'python': platform.python_version(),
+        'vendor': connection.vendor,
+        'timestamp': int(time.time()),
+        'options': vars(args),
+        'operations': list(stats.rows()),
+        'phases': dict((phase, {'operations': operations, 'seconds': elapsed,
+                                'peak_memory': peak})
+                       for phase, (operations, elapsed, peak) in phases.items()),
+    }
+    with open(output, 'w') as output_file:
+        json.dump(data, output_file, indent=2, sort_keys=True)
+    print('\nResults saved to {}'.format(output))
+
+
+if __name__ == '__main__':
+    main()
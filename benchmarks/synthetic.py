@@ -0,0 +1,159 @@
+# -*- coding: utf-8 -*-
+"""
+Generators of synthetic SQL configurations used by benchmarks.
+
+Every generator returns a list of `(app_label, SQLItem)` pairs, ordered so that
+dependencies are always defined before their dependents. By default items are PostgreSQL
+composite types, the same shape `tests.test_app.test_migrations.item` builds. Views are
+available for benchmarks that execute SQL, since they are supported by any database.
+"""
+
+from __future__ import unicode_literals
+
+import random
+
+from migrate_sql.config import SQLItem
+
+SHAPES = ('chain', 'fan', 'diamond', 'random')
+
+
+def item_key(index, apps):
+    """
+    Key of the `index`-th synthetic item, spreading items among `apps` applications.
+    """
+    return ('app{}'.format(index % apps), 'item{}'.format(index))
+
+
+def make_item(key, version, dependencies):
+    """
+    Creates composite type SQL item, similar to tests' `item()` helper.
+    Dependencies become typed attributes, `version` is the number of extra int attributes.
+    """
+    args = ['{dep}_{ver} {dep}'.format(dep=dep[1], ver=version) for dep in dependencies]
+    args += ['arg{} int'.format(i + 1) for i in range(version)]
+    sql = 'CREATE TYPE {name} AS ({args}); -- {ver}'.format(
+        name=key[1], args=', '.join(args), ver=version)
+    reverse_sql = 'DROP TYPE {}'.format(key[1])
+    return SQLItem(key[1], sql, reverse_sql, dependencies=list(dependencies))
+
+
+def make_view_item(key, version, dependencies):
+    """
+    Creates view SQL item, selecting a column from every dependency.
+    `version` is a constant selected by the view.
+    """
+    columns = ['{} AS v'.format(version)]
+    columns += ['(SELECT COUNT(*) FROM {dep}) AS d{i}'.format(dep=dep[1], i=i)
+                for i, dep in enumerate(dependencies)]
+    sql = 'CREATE VIEW {name} AS SELECT {columns}'.format(name=key[1], columns=', '.join(columns))
+    reverse_sql = 'DROP VIEW {}'.format(key[1])
+    return SQLItem(key[1], sql, reverse_sql, dependencies=list(dependencies))
+
+
+def chain_parents(index, size, rnd):
+    """
+    Deep chain: every item depends on the previous one.
+    """
+    return [index - 1] if index else []
+
+
+def fan_parents(index, size, rnd):
+    """
+    Wide fan: every item depends on the single root.
+    """
+    return [0] if index else []
+
+
+def diamond_parents(index, size, rnd):
+    """
+    Stacked diamonds: a -> (b, c) -> d, where `d` becomes `a` of the next diamond.
+    """
+    position = index % 3
+    if not index:
+        return []
+    if position in (1, 2):
+        return [index - position]
+    return [index - 2, index - 1]
+
+
+def random_parents(index, size, rnd, max_parents=3):
+    """
+    Random DAG: every item depends on up to `max_parents` randomly chosen previous items.
+    """
+    if not index:
+        return []
+    count = rnd.randint(0, min(index, max_parents))
+    return sorted(rnd.sample(range(index), count))
+
+
+PARENTS = {
+    'chain': chain_parents,
+    'fan': fan_parents,
+    'diamond': diamond_parents,
+    'random': random_parents,
+}
+
+
+def generate(shape, size, apps=1, version=1, seed=0, factory=make_item):
+    """
+    Generate synthetic SQL configuration.
+
+    Args:
+        shape (str): One of `SHAPES`.
+        size (int): Number of items.
+        apps (int): Number of applications items are distributed among.
+        version (int): Version of every item, affects SQL text only.
+        seed (int): Seed of random generator used by `random` shape.
+        factory (callable): Item constructor, `make_item` or `make_view_item`.
+    Returns:
+        (list) Pairs `(app_label, SQLItem)`.
+    """
+    rnd = random.Random(seed)
+    get_parents = PARENTS[shape]
+    items = []
+    for index in range(size):
+        key = item_key(index, apps)
+        deps = [item_key(parent, apps) for parent in get_parents(index, size, rnd)]
+        items.append((key[0], factory(key, version, deps)))
+    return items
+
+
+def mutate(items, change_ratio=0.1, delete_ratio=0.01, add_ratio=0.01, dep_change_ratio=0.0,
+           apps=1, seed=0, factory=make_item):
+    """
+    Produce next version of synthetic configuration: changes SQL of some items, deletes
+    some leaves and adds new items on top of existing ones. Items, which dependencies change,
+    get an extra dependency on one of the preceding items while keeping SQL as is.
+
+    Returns:
+        (list) Pairs `(app_label, SQLItem)`.
+    """
+    rnd = random.Random(seed)
+    keys = [(app_label, sql_item.name) for app_label, sql_item in items]
+    parents = set(dep for _, sql_item in items for dep in sql_item.dependencies)
+    leaves = [key for key in keys if key not in parents]
+    deleted = set(rnd.sample(leaves, int(len(leaves) * delete_ratio)))
+    changed = set(rnd.sample(keys, int(len(keys) * change_ratio))) - deleted
+    dep_changed = set(rnd.sample(keys, int(len(keys) * dep_change_ratio))) - deleted - changed
+
+    result = []
+    for index, (app_label, sql_item) in enumerate(items):
+        key = (app_label, sql_item.name)
+        if key in deleted:
+            continue
+        if key in changed:
+            sql_item = factory(key, 2, sql_item.dependencies)
+        elif key in dep_changed:
+            extra = [k for k in keys[:index]
+                     if k not in deleted and k not in sql_item.dependencies]
+            if extra:
+                sql_item = SQLItem(sql_item.name, sql_item.sql, sql_item.reverse_sql,
+                                   dependencies=sql_item.dependencies + [rnd.choice(extra)])
+        result.append((app_label, sql_item))
+
+    alive = [key for key in keys if key not in deleted]
+    for index in range(len(keys), len(keys) + int(len(keys) * add_ratio)):
+        key = item_key(index, apps)
+        deps = [rnd.choice(alive)] if alive else []
+        result.append((key[0], factory(key, 1, deps)))
+    return result
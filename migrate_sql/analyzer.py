@@ -0,0 +1,216 @@
+# -*- coding: utf-8 -*-
+"""
+Inference of SQL item dependencies from their SQL.
+
+Every item defines objects (found in its `CREATE` statements and `DROP` statement of its
+`reverse_sql`) and references identifiers in its SQL. Comments and string literals are
+skipped, bodies of dollar-quoted strings (functions) are scanned. An item depends on items
+defining objects it references. Inferred dependencies are reduced to minimal sets: edges
+implied by other edges are dropped.
+"""
+
+from __future__ import unicode_literals
+
+import re
+
+from migrate_sql.config import resolve_sql
+from migrate_sql.planner import parse_drop
+from migrate_sql.splitter import split_sql
+
+_TOKENS = re.compile(r"""
+    (?P<comment>--[^\n]*|/\*.*?\*/)
+  | (?P<string>[eE]'(?:[^'\\]|\\.|'')*'|'(?:[^']|'')*')
+  | \$(?P<tag>(?:[^\W\d]\w*)?)\$(?P<body>.*?)\$(?P=tag)\$
+  | (?P<quoted>"(?:[^"]|"")*")
+  | (?P<word>[^\W\d][\w$]*)
+""", re.VERBOSE | re.DOTALL | re.UNICODE)
+
+_NAME = r'(?:"(?:[^"]|"")*"|[^\W\d][\w$]*)'
+
+_CREATE = re.compile(
+    r'^CREATE\s+(?:OR\s+REPLACE\s+)?(?:(?:TEMP|TEMPORARY|UNLOGGED|MATERIALIZED|RECURSIVE|'
+    r'UNIQUE|CONSTRAINT)\s+)*(?:FUNCTION|PROCEDURE|AGGREGATE|TYPE|DOMAIN|TABLE|VIEW|SEQUENCE|'
+    r'INDEX|TRIGGER|OPERATOR\s+CLASS|OPERATOR\s+FAMILY)\s+(?:CONCURRENTLY\s+)?'
+    r'(?:IF\s+NOT\s+EXISTS\s+)?(?P<name>' + _NAME + r'(?:\s*\.\s*' + _NAME + r')?)',
+    re.IGNORECASE | re.UNICODE,
+)
+
+
+def _normalize(name):
+    """
+    Unqualified name of object as database sees it: quoted names are case sensitive,
+    unquoted ones are folded to lower case.
+    """
+    name = name.split('(', 1)[0].strip()
+    parts = re.findall(_NAME, name, re.UNICODE)
+    if not parts:
+        return None
+    name = parts[-1]
+    if name.startswith('"'):
+        return name[1:-1].replace('""', '"')
+    return name.lower()
+
+
+def _texts(sqls):
+    """
+    SQL texts of SQL in format supported by Django's RunSQL operation.
+    """
+    sqls = resolve_sql(sqls)
+    if not sqls:
+        return []
+    if not isinstance(sqls, (list, tuple)):
+        sqls = [sqls]
+    return [sql[0] if isinstance(sql, (list, tuple)) else sql for sql in sqls]
+
+
+def referenced_names(sql):
+    """
+    Names of objects SQL text references, including itself defines.
+
+    Returns:
+        (set) Normalized names.
+    """
+    names = set()
+    texts = [sql]
+    while texts:
+        for match in _TOKENS.finditer(texts.pop()):
+            if match.group('body') is not None:
+                texts.append(match.group('body'))
+            elif match.group('quoted') is not None:
+                names.add(_normalize(match.group('quoted')))
+            elif match.group('word') is not None:
+                names.add(match.group('word').lower())
+    return names
+
+
+def find_created_name(statement):
+    """
+    Find name of object `CREATE` statement defines.
+
+    Returns:
+        (tuple) `(start, end, name)`: position of name in statement and the name normalized,
+            or `None`, if statement is not `CREATE` statement.
+    """
+    match = _CREATE.match(statement)
+    if not match:
+        return None
+    return match.start('name'), match.end('name'), _normalize(match.group('name'))
+
+
+def defined_names(sql_item):
+    """
+    Names of objects SQL item defines, found in its `CREATE` statements and `DROP` statement of
+    its reverse SQL. Item name is used, if none are found.
+
+    Returns:
+        (set) Normalized names.
+    """
+    names = set()
+    for text in _texts(sql_item.sql):
+        for statement in split_sql(text):
+            # leading comments are skipped.
+            statement = _TOKENS.sub(
+                lambda m: ' ' if m.group('comment') is not None else m.group(), statement)
+            match = _CREATE.match(statement.strip())
+            if match:
+                names.add(_normalize(match.group('name')))
+    drop = parse_drop(sql_item.reverse_sql)
+    if drop is not None:
+        names.update(_normalize(name) for name in drop.names)
+    names.discard(None)
+    return names or {sql_item.name.lower()}
+
+
+def _closure(key, edges, memo):
+    """
+    All keys reachable from `key` by `edges`. Results are memoized in `memo`; in case of
+    cycles they're incomplete, which is fine for detecting redundant edges.
+    """
+    stack = [key]
+    visiting = set()
+    while stack:
+        current = stack[-1]
+        if current in memo:
+            stack.pop()
+            continue
+        visiting.add(current)
+        pending = [dep for dep in edges.get(current, ())
+                   if dep not in memo and dep not in visiting]
+        if pending:
+            stack.extend(pending)
+            continue
+        result = set()
+        for dep in edges.get(current, ()):
+            result.add(dep)
+            result |= memo.get(dep, set())
+        memo[current] = result
+        visiting.discard(current)
+        stack.pop()
+    return memo[key]
+
+
+class DependencyReport(object):
+    """
+    Declared and inferred dependencies of SQL item.
+    """
+    def __init__(self, key, declared, referenced, inferred, missing):
+        self.key = key
+        # dependencies declared by item.
+        self.declared = declared
+        # items defining objects referenced by item.
+        self.referenced = referenced
+        # minimal set of dependencies, implying all referenced items.
+        self.inferred = inferred
+        # referenced items, that declared dependencies don't imply.
+        self.missing = missing
+
+    @property
+    def unused(self):
+        """
+        Declared dependencies, that item does not reference.
+        """
+        return self.declared - self.referenced
+
+    @property
+    def ok(self):
+        return not self.unused and not self.missing
+
+
+def infer_dependencies(items):
+    """
+    Infer dependencies of SQL items from their SQL.
+
+    Args:
+        items (dict): SQL items by their keys, `(app_label, name)`.
+    Returns:
+        (dict) `DependencyReport` by keys of items.
+    """
+    definitions = {}
+    for key, sql_item in items.items():
+        for name in defined_names(sql_item):
+            definitions.setdefault(name, set()).add(key)
+
+    referenced = {}
+    for key, sql_item in items.items():
+        names = set()
+        for text in _texts(sql_item.sql):
+            names |= referenced_names(text)
+        # names item defines itself (e.g. recursive functions) are not dependencies.
+        names -= defined_names(sql_item)
+        referenced[key] = {dep for name in names for dep in definitions.get(name, ())
+                           if dep != key}
+
+    declared = {key: set(tuple(dep) for dep in sql_item.dependencies)
+                for key, sql_item in items.items()}
+    referenced_memo = {}
+    declared_memo = {}
+    reports = {}
+    for key in items:
+        deps = referenced[key]
+        # dependency is redundant, if it's implied by another one.
+        inferred = {dep for dep in deps
+                    if not any(dep in _closure(other, referenced, referenced_memo)
+                               for other in deps if other != dep)}
+        missing = deps - _closure(key, declared, declared_memo)
+        reports[key] = DependencyReport(key, declared[key], deps, inferred, missing)
+    return reports
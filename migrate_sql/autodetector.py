@@ -1,11 +1,18 @@
 # -*- coding: utf-8 -*-
 from __future__ import unicode_literals
 
+from collections import OrderedDict
+
+from django.conf import settings
+from django.db.migrations import Migration
 from django.db.migrations.autodetector import MigrationAutodetector as DjangoMigrationAutodetector
 from django.db.migrations.operations import RunSQL
 
-from migrate_sql.operations import (AlterSQL, ReverseAlterSQL, CreateSQL, DeleteSQL, AlterSQLState)
+from migrate_sql.config import resolve_sql, sql_fingerprint
+from migrate_sql.operations import (AlterSQL, ReverseAlterSQL, CreateSQL, DeleteSQL, AlterSQLState,
+                                    BaseAlterSQL, StageSQL)
 from migrate_sql.graph import SQLStateGraph
+from migrate_sql.planner import DropBatch, plan_drops
 
 
 class SQLBlob(object):
@@ -30,6 +37,37 @@ def _sql_params(sql):
     return sql, params
 
 
+def _sql_list(sqls):
+    """
+    List of SQL statements of `sqls`, in the format supported by Django's RunSQL operation.
+    """
+    return list(sqls) if isinstance(sqls, (list, tuple)) else [sqls]
+
+
+def _normalize_params(params):
+    """
+    Params with tuples turned into lists, since params loaded from JSON (SQL manifest) are
+    lists, while configuration may use tuples.
+    """
+    if isinstance(params, (list, tuple)):
+        return [_normalize_params(param) for param in params]
+    if isinstance(params, dict):
+        return {key: _normalize_params(value) for key, value in params.items()}
+    return params
+
+
+def _is_single_sql_equal(sql1, sql2):
+    """
+    Compare two SQL strings, either of which may be a lazy SQL source (e.g. `SQLFile`).
+    Lazy sources are compared by fingerprints, so their content is not read.
+    """
+    if sql1 == sql2:
+        return True
+    if not hasattr(sql1, 'fingerprint') and not hasattr(sql2, 'fingerprint'):
+        return False
+    return sql_fingerprint(sql1) == sql_fingerprint(sql2)
+
+
 def is_sql_equal(sqls1, sqls2):
     """
     Find out equality of two SQL items.
@@ -37,6 +75,7 @@ def is_sql_equal(sqls1, sqls2):
     See https://docs.djangoproject.com/en/1.8/ref/migration-operations/#runsql.
     Args:
         sqls1, sqls2: SQL items, have the same format as supported by Django's RunSQL operation.
+            `SQLFile` may be used in place of any SQL string.
     Returns:
         (bool) `True` if equal, otherwise `False`.
     """
@@ -54,7 +93,8 @@ def is_sql_equal(sqls1, sqls2):
     for sql1, sql2 in zip(sqls1, sqls2):
         sql1, params1 = _sql_params(sql1)
         sql2, params2 = _sql_params(sql2)
-        if sql1 != sql2 or params1 != params2:
+        if (_normalize_params(params1) != _normalize_params(params2) or
+                not _is_single_sql_equal(sql1, sql2)):
             return False
     return True
 
@@ -63,12 +103,33 @@ class MigrationAutodetector(DjangoMigrationAutodetector):
     """
     Substitutes Django's MigrationAutodetector class, injecting SQL migrations logic.
     """
-    def __init__(self, from_state, to_state, questioner=None, to_sql_graph=None):
+    def __init__(self, from_state, to_state, questioner=None, to_sql_graph=None,
+                 batch_drops=None, split_layers=None, consolidate=None):
+        """
+        Args:
+            to_sql_graph (graph.SQLStateGraph): Target state of SQL items.
+            batch_drops (bool): Combine drops of items into multi-object statements, see
+                `planner.plan_drops`. Default is `SQL_BATCH_DROPS` setting.
+            split_layers (bool): Put every dependency layer of SQL item operations into its
+                own migration, see `split_sql_layers`. Default is `SQL_SPLIT_LAYERS` setting.
+            consolidate (bool): Regroup operations into as few migrations as dependencies
+                allow, see `consolidate_sql_migrations`. Default is `SQL_CONSOLIDATE` setting.
+        """
         super(MigrationAutodetector, self).__init__(from_state, to_state, questioner)
         self.to_sql_graph = to_sql_graph
+        if batch_drops is None:
+            batch_drops = getattr(settings, 'SQL_BATCH_DROPS', False)
+        self.batch_drops = batch_drops
+        if split_layers is None:
+            split_layers = getattr(settings, 'SQL_SPLIT_LAYERS', False)
+        self.split_layers = split_layers
+        if consolidate is None:
+            consolidate = getattr(settings, 'SQL_CONSOLIDATE', False)
+        self.consolidate = consolidate
         self.from_sql_graph = getattr(self.from_state, 'sql_state', None) or SQLStateGraph()
         self.from_sql_graph.build_graph()
         self._sql_operations = []
+        self._consolidated_operations = []
 
     def assemble_changes(self, keys, resolve_keys, sql_state):
         """
@@ -87,24 +148,14 @@ class MigrationAutodetector(DjangoMigrationAutodetector):
         Returns:
             (list) Sorted sequence of migration keys, enriched with dependencies.
         """
-        result_keys = []
         all_keys = keys | resolve_keys
-        for key in all_keys:
-            node = sql_state.node_map[key]
-            sql_item = sql_state.nodes[key]
-            ancs = node.ancestors()[:-1]
-            ancs.reverse()
-            pos = next((i for i, k in enumerate(result_keys) if k in ancs), len(result_keys))
-            result_keys.insert(pos, key)
-
-            if key in resolve_keys and not sql_item.replace:
-                # ancestors() and descendants() include key itself, need to cut it out.
-                descs = reversed(node.descendants()[:-1])
-                for desc in descs:
-                    if desc not in all_keys and desc not in result_keys:
-                        result_keys.insert(pos, desc)
-                        # these items added may also need reverse operations.
-                        resolve_keys.add(desc)
+        reachability = sql_state.get_reachability()
+        # items depending on changed ones are recreated too, unless changed ones are replaced.
+        cascade = [key for key in resolve_keys if not sql_state.nodes[key].replace]
+        mask = reachability.mask(all_keys) | reachability.descendants(cascade)
+        result_keys = reachability.keys(mask, leaves_first=True)
+        # these items added may also need reverse operations.
+        resolve_keys.update(key for key in result_keys if key not in all_keys)
         return result_keys
 
     def add_sql_operation(self, app_label, sql_name, operation, dependencies):
@@ -114,29 +165,117 @@ class MigrationAutodetector(DjangoMigrationAutodetector):
         """
         deps = [(dp[0], SQL_BLOB, dp[1], self._sql_operations.get(dp)) for dp in dependencies]
 
-        self.add_operation(app_label, operation, dependencies=deps)
+        if self.consolidate:
+            # migrations are made of them by `consolidate_sql_migrations`.
+            operation._auto_deps = deps
+            self._consolidated_operations.append((app_label, operation))
+        else:
+            self.add_operation(app_label, operation, dependencies=deps)
         self._sql_operations[(app_label, sql_name)] = operation
 
-    def _generate_reversed_sql(self, keys, changed_keys):
+    def _add_drop_operations(self, operation_cls, keys, get_sql, get_reverse_sql):
         """
-        Generate reversed operations for changes, that require full rollback and creation.
+        Add operations dropping SQL items from `from_sql_graph`. If batching is enabled,
+        the first operation of a batch drops all items of it, others don't run any SQL, but
+        alter state and keep reverse SQL of their items.
+
+        Args:
+            operation_cls (type): Class of operations, `DeleteSQL` or `ReverseAlterSQL`.
+            keys (list): Keys of items to drop, starting with leaves.
+            get_sql, get_reverse_sql (callable): Return (reverse) SQL of operation by key.
+        """
+        if self.batch_drops:
+            batches = plan_drops(keys, self.from_sql_graph, get_sql)
+        else:
+            batches = [DropBatch([key]) for key in keys]
+
+        node_map = self.from_sql_graph.node_map
+        for batch in batches:
+            leader = batch.keys[0]
+            for key in batch.keys:
+                app_label, sql_name = key
+                if batch.statement is None:
+                    sql = get_sql(key)
+                else:
+                    sql = batch.statement if key == leader else RunSQL.noop
+                operation = operation_cls(sql_name, sql, reverse_sql=get_reverse_sql(key))
+                if key == leader:
+                    # dependents of all items of batch are dropped before it.
+                    sql_deps = [n.key for k in batch.keys for n in node_map[k].children]
+                else:
+                    sql_deps = [n.key for n in node_map[key].children] + [leader]
+                sql_deps.append(key)
+                self.add_sql_operation(app_label, sql_name, operation, sql_deps)
+
+    def _get_swapped(self, keys, changed_keys):
         """
+        Changed SQL items, which new versions are created alongside the old ones and swapped
+        in, instead of being dropped and created from scratch. Items having parents created or
+        altered at the same time are not swapped, since new version should be built on them.
+
+        Returns:
+            (dict) `config.SwapSQL` by keys.
+        """
+        swapped = {}
+        altered = set(keys)
         for key in keys:
             if key not in changed_keys:
                 continue
-            app_label, sql_name = key
+            swap_sql = self.to_sql_graph.nodes[key].get_swap_sql()
+            parents = self.to_sql_graph.node_map[key].parents
+            if swap_sql is not None and not any(n.key in altered for n in parents):
+                swapped[key] = swap_sql
+        return swapped
+
+    def _generate_staged_sql(self, keys, swapped):
+        """
+        Generate operations creating new versions of swapped SQL items. These go first, so
+        items are not locked while new versions are being built.
+        """
+        for key in reversed(keys):
+            if key in swapped:
+                app_label, sql_name = key
+                operation = StageSQL(sql_name, resolve_sql(swapped[key].stage),
+                                     reverse_sql=resolve_sql(swapped[key].unstage))
+                self.add_sql_operation(app_label, sql_name, operation, [key])
+
+    def _generate_reversed_sql(self, keys, changed_keys, swapped=()):
+        """
+        Generate reversed operations for changes, that require full rollback and creation.
+        """
+        reversed_keys = []
+        for key in keys:
+            if key not in changed_keys or key in swapped:
+                continue
             old_item = self.from_sql_graph.nodes[key]
             new_item = self.to_sql_graph.nodes[key]
             if not old_item.reverse_sql or old_item.reverse_sql == RunSQL.noop or new_item.replace:
                 continue
+            reversed_keys.append(key)
 
-            # migrate backwards
-            operation = ReverseAlterSQL(sql_name, old_item.reverse_sql, reverse_sql=old_item.sql)
-            sql_deps = [n.key for n in self.from_sql_graph.node_map[key].children]
-            sql_deps.append(key)
-            self.add_sql_operation(app_label, sql_name, operation, sql_deps)
+        # migrate backwards
+        self._add_drop_operations(
+            ReverseAlterSQL, reversed_keys,
+            lambda key: resolve_sql(self.from_sql_graph.nodes[key].reverse_sql),
+            lambda key: resolve_sql(self.from_sql_graph.nodes[key].sql),
+        )
 
-    def _generate_sql(self, keys, changed_keys):
+    def _get_swap_operation(self, key, swap_sql):
+        """
+        Operation dropping old version of SQL item and putting new one, created by `StageSQL`
+        operation, in its place. Backwards, new version is moved back and old one is created.
+        """
+        old_item = self.from_sql_graph.nodes[key]
+        new_item = self.to_sql_graph.nodes[key]
+        return AlterSQL(
+            key[1],
+            _sql_list(resolve_sql(old_item.reverse_sql)) + swap_sql.swap,
+            reverse_sql=swap_sql.unswap + _sql_list(resolve_sql(old_item.sql)),
+            state_sql=resolve_sql(new_item.sql),
+            state_reverse_sql=resolve_sql(new_item.reverse_sql),
+        )
+
+    def _generate_sql(self, keys, changed_keys, swapped=()):
         """
         Generate forward operations for changing/creating SQL items.
         """
@@ -144,23 +283,29 @@ class MigrationAutodetector(DjangoMigrationAutodetector):
             app_label, sql_name = key
             new_item = self.to_sql_graph.nodes[key]
             sql_deps = [n.key for n in self.to_sql_graph.node_map[key].parents]
-            reverse_sql = new_item.reverse_sql
-
-            if key in changed_keys:
-                operation_cls = AlterSQL
-                kwargs = {}
-                # in case of replace mode, AlterSQL will hold sql, reverse_sql and
-                # state_reverse_sql, the latter one will be used for building state forward
-                # instead of reverse_sql.
-                if new_item.replace:
-                    kwargs['state_reverse_sql'] = reverse_sql
-                    reverse_sql = self.from_sql_graph.nodes[key].sql
-            else:
-                operation_cls = CreateSQL
-                kwargs = {'dependencies': list(sql_deps)}
+            # SQL files are persisted into migrations as text.
+            reverse_sql = resolve_sql(new_item.reverse_sql)
 
-            operation = operation_cls(
-                sql_name, new_item.sql, reverse_sql=reverse_sql, **kwargs)
+            if key in swapped:
+                operation = self._get_swap_operation(key, swapped[key])
+                # old version is dropped, once its dependents are.
+                sql_deps.extend(n.key for n in self.from_sql_graph.node_map[key].children)
+            else:
+                if key in changed_keys:
+                    operation_cls = AlterSQL
+                    kwargs = {}
+                    # in case of replace mode, AlterSQL will hold sql, reverse_sql and
+                    # state_reverse_sql, the latter one will be used for building state forward
+                    # instead of reverse_sql.
+                    if new_item.replace:
+                        kwargs['state_reverse_sql'] = reverse_sql
+                        reverse_sql = resolve_sql(self.from_sql_graph.nodes[key].sql)
+                else:
+                    operation_cls = CreateSQL
+                    kwargs = {'dependencies': list(sql_deps)}
+
+                operation = operation_cls(
+                    sql_name, resolve_sql(new_item.sql), reverse_sql=reverse_sql, **kwargs)
             sql_deps.append(key)
             self.add_sql_operation(app_label, sql_name, operation, sql_deps)
 
@@ -187,21 +332,26 @@ class MigrationAutodetector(DjangoMigrationAutodetector):
         """
         Generate forward delete operations for SQL items.
         """
-        for key in delete_keys:
-            app_label, sql_name = key
-            old_node = self.from_sql_graph.nodes[key]
-            operation = DeleteSQL(sql_name, old_node.reverse_sql, reverse_sql=old_node.sql)
-            sql_deps = [n.key for n in self.from_sql_graph.node_map[key].children]
-            sql_deps.append(key)
-            self.add_sql_operation(app_label, sql_name, operation, sql_deps)
+        self._add_drop_operations(
+            DeleteSQL, delete_keys,
+            lambda key: resolve_sql(self.from_sql_graph.nodes[key].reverse_sql),
+            lambda key: resolve_sql(self.from_sql_graph.nodes[key].sql),
+        )
 
-    def generate_sql_changes(self):
+    def generate_sql_changes(self, keys=None):
         """
         Starting point of this tool, which identifies changes and generates respective
         operations.
+
+        Args:
+            keys (set, optional): Keys of the only items to compare, others are considered
+                unchanged. All items are compared by default.
         """
         from_keys = set(self.from_sql_graph.nodes.keys())
         to_keys = set(self.to_sql_graph.nodes.keys())
+        if keys is not None:
+            from_keys &= keys
+            to_keys &= keys
         new_keys = to_keys - from_keys
         delete_keys = from_keys - to_keys
         changed_keys = set()
@@ -229,12 +379,173 @@ class MigrationAutodetector(DjangoMigrationAutodetector):
         keys = self.assemble_changes(new_keys, changed_keys, self.to_sql_graph)
         delete_keys = self.assemble_changes(delete_keys, set(), self.from_sql_graph)
 
+        # deleted items depending on changed ones are dropped before changed ones are reversed.
+        reachability = self.from_sql_graph.get_reachability()
+        affected = reachability.descendants(changed_keys) & reachability.mask(delete_keys)
+        affected = set(reachability.keys(affected))
+
+        swapped = self._get_swapped(keys, changed_keys)
+
         self._sql_operations = {}
-        self._generate_reversed_sql(keys, changed_keys)
-        self._generate_sql(keys, changed_keys)
-        self._generate_delete_sql(delete_keys)
+        self._generate_staged_sql(keys, swapped)
+        self._generate_delete_sql([key for key in delete_keys if key in affected])
+        self._generate_reversed_sql(keys, changed_keys, swapped)
+        self._generate_sql(keys, changed_keys, swapped)
+        self._generate_delete_sql([key for key in delete_keys if key not in affected])
         self._generate_altered_sql_dependencies(dep_changed_keys)
 
+    def _is_related(self, key1, key2):
+        """
+        Whether one of SQL items directly depends on the other one in either old or new state.
+        """
+        if key1 == key2:
+            return True
+        for graph in (self.from_sql_graph, self.to_sql_graph):
+            node = graph.node_map.get(key1)
+            if node is not None and any(n.key == key2 for n in node.parents | node.children):
+                return True
+        return False
+
+    def _split_operations(self, app_label, operations):
+        """
+        Split sequence of operations into dependency layers: consecutive operations, none of
+        which alters an SQL item related to an item altered by another one.
+
+        Returns:
+            (list) Lists of operations, one per layer.
+        """
+        layers = [[]]
+        keys = set()
+        for operation in operations:
+            if isinstance(operation, BaseAlterSQL):
+                key = (app_label, operation.name)
+                if any(self._is_related(key, k) for k in keys):
+                    layers.append([])
+                    keys = set()
+                keys.add(key)
+            layers[-1].append(operation)
+        return layers
+
+    def split_sql_layers(self):
+        """
+        Split migrations, so that every dependency layer of SQL item operations is in its own
+        migration. Migrations are applied in separate transactions, so locks taken by a layer
+        are released once it's done, and a failed migrate continues from the failed layer.
+        """
+        renames = {}
+        groups = []
+        for app_label, migrations in self.migrations.items():
+            result = []
+            for migration in migrations:
+                group = []
+                for operations in self._split_operations(app_label, migration.operations):
+                    part = migration if not group else Migration('auto', app_label)
+                    part.operations = operations
+                    group.append(part)
+                groups.append(group)
+                old_name = migration.name
+                for part in group:
+                    part.name = 'auto_{}'.format(len(result) + 1)
+                    result.append(part)
+                # dependents of migration depend on its last layer.
+                renames[(app_label, old_name)] = (app_label, group[-1].name)
+            self.migrations[app_label] = result
+
+        for migrations in self.migrations.values():
+            for migration in migrations:
+                migration.dependencies = [renames.get(dep, dep) for dep in migration.dependencies]
+        for group in groups:
+            for prev, part in zip(group, group[1:]):
+                part.dependencies.append((prev.app_label, prev.name))
+
+    def _get_sql_phases(self):
+        """
+        Phases of consolidated SQL item operations: operations of an app having the same phase
+        are put into the same migration. Operation follows its dependencies of the same app in
+        the same or later phase, and ones of other apps in later phases.
+
+        Operations get the earliest phases first, then are moved to the latest phases allowed
+        by their dependents, that their app uses anyway, which leaves apps fewer phases.
+
+        Returns:
+            (dict) Phases by operations.
+        """
+        operations = self._consolidated_operations
+        apps = dict((operation, app_label) for app_label, operation in operations)
+        dependents = dict((operation, []) for app_label, operation in operations)
+        phases = {}
+        # operations are generated after their dependencies.
+        for app_label, operation in operations:
+            phase = 0
+            for dep in operation._auto_deps:
+                if dep[3] in apps:
+                    dependents[dep[3]].append(operation)
+                    phase = max(phase, phases[dep[3]] + (dep[0] != app_label))
+            phases[operation] = phase
+
+        used = {}
+        for app_label, operation in operations:
+            used.setdefault(app_label, {}).setdefault(phases[operation], set()).add(operation)
+        last = max(phases.values()) if phases else 0
+        for app_label, operation in reversed(operations):
+            latest = min([last] + [phases[dependent] - (apps[dependent] != app_label)
+                                   for dependent in dependents[operation]])
+            app_phases = used[app_label]
+            phase = max(p for p in app_phases if phases[operation] <= p <= latest)
+            if phase != phases[operation]:
+                app_phases[phases[operation]].discard(operation)
+                if not app_phases[phases[operation]]:
+                    del app_phases[phases[operation]]
+                app_phases[phase].add(operation)
+                phases[operation] = phase
+        return phases
+
+    def consolidate_sql_migrations(self, graph=None):
+        """
+        Put SQL item operations into as few migrations as their dependencies allow: one per
+        app and phase, see `_get_sql_phases`. SQL item migrations of app follow migrations made
+        by Django for its models. Otherwise Django chops cascades of SQL item changes spanning
+        apps into many migrations, switching between apps, or fails to order them at all.
+        """
+        phases = self._get_sql_phases()
+        groups = OrderedDict()
+        for app_label, operation in self._consolidated_operations:
+            groups.setdefault((app_label, phases[operation]), []).append(operation)
+
+        made = {}
+        for app_label, phase in sorted(groups):
+            migrations = self.migrations.setdefault(app_label, [])
+            migration = Migration('auto_{}'.format(len(migrations) + 1), app_label)
+            if not migrations and app_label not in getattr(self, 'existing_apps', (app_label,)):
+                migration.initial = True
+            migration.operations = groups[(app_label, phase)]
+            migration.dependencies = [(app_label, migrations[-1].name)] if migrations else []
+            migrations.append(migration)
+            made[(app_label, phase)] = migration
+
+        for (app_label, phase), migration in made.items():
+            dependencies = set(migration.dependencies)
+            for operation in migration.operations:
+                for dep in operation._auto_deps:
+                    if dep[0] == app_label:
+                        continue
+                    if dep[3] in phases:
+                        dependencies.add((dep[0], made[(dep[0], phases[dep[3]])].name))
+                    elif graph is not None and graph.leaf_nodes(dep[0]):
+                        # item of other app is not changed, it's created by existing migrations.
+                        dependencies.add(graph.leaf_nodes(dep[0])[0])
+                    else:
+                        dependencies.add((dep[0], '__first__'))
+            migration.dependencies = sorted(dependencies)
+
+    def _detect_changes(self, convert_apps=None, graph=None):
+        result = super(MigrationAutodetector, self)._detect_changes(convert_apps, graph)
+        if self.consolidate:
+            self.consolidate_sql_migrations(graph)
+        if self.split_layers:
+            self.split_sql_layers()
+        return result
+
     def check_dependency(self, operation, dependency):
         """
         Enhances default behavior of method by checking dependency for matching operation.
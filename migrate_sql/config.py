@@ -1,18 +1,159 @@
 # -*- coding: utf-8 -*-
 from __future__ import unicode_literals
 
+import codecs
+import hashlib
+import io
+import mmap
+import os
+
+
+class SQLFile(object):
+    """
+    SQL script stored in a separate file. File is not read until its content is needed, and is
+    fingerprinted without loading it into memory: large files are memory-mapped.
+
+    Can be used anywhere SQL item accepts SQL string, including `(sql, params)` tuples.
+    """
+    # Files of this size and bigger are hashed through memory map.
+    MMAP_THRESHOLD = 1024 * 1024
+    CHUNK_SIZE = 64 * 1024
+
+    def __init__(self, path, encoding='utf-8', offset=0, length=None, fingerprint=None):
+        """
+        Args:
+            path (str): Path to SQL file. Typically is built relatively to `sql_config` module:
+                `os.path.join(os.path.dirname(__file__), 'sql', 'make_sum.sql')`.
+            encoding (str, optional): Encoding of SQL file. Default = `utf-8`.
+            offset (int, optional): Position in bytes SQL script starts at. Default = 0.
+            length (int, optional): Length of SQL script in bytes. Default is up to end of file.
+            fingerprint (str, optional): Precalculated fingerprint of SQL script, if known,
+                e.g. stored along with the script in SQL manifest.
+        """
+        self.path = path
+        self.encoding = encoding
+        self.offset = offset
+        self.length = length
+        self._fingerprint = fingerprint
+        self._fixed = fingerprint is not None
+        self._stat = None
+
+    def __repr__(self):
+        if self.offset or self.length is not None:
+            return '{}({!r}, offset={}, length={})'.format(
+                self.__class__.__name__, self.path, self.offset, self.length)
+        return '{}({!r})'.format(self.__class__.__name__, self.path)
+
+    @property
+    def fingerprint(self):
+        """
+        SHA1 hex digest of file content, recalculated only when file is modified.
+        Equals to `sql_fingerprint` of the text file holds.
+        """
+        if self._fixed:
+            return self._fingerprint
+        stat = os.stat(self.path)
+        stat = (stat.st_size, stat.st_mtime)
+        if stat != self._stat:
+            self._fingerprint = self._hash(stat[0])
+            self._stat = stat
+        return self._fingerprint
+
+    def _hash(self, size):
+        if (self.offset or self.length is not None or
+                codecs.lookup(self.encoding).name != 'utf-8'):
+            # slices and files in other encodings are hashed by the text they hold.
+            return sql_fingerprint(self.read())
+        digest = hashlib.sha1()
+        with io.open(self.path, 'rb') as sql_file:
+            if size >= self.MMAP_THRESHOLD:
+                mapped = mmap.mmap(sql_file.fileno(), 0, access=mmap.ACCESS_READ)
+                try:
+                    digest.update(mapped)
+                finally:
+                    mapped.close()
+            else:
+                for chunk in iter(lambda: sql_file.read(self.CHUNK_SIZE), b''):
+                    digest.update(chunk)
+        return digest.hexdigest()
+
+    def iter_chunks(self, size=None):
+        """
+        Read SQL text from file in chunks, so that it's never loaded entirely.
+
+        Args:
+            size (int, optional): Size of chunks in bytes. Default = `CHUNK_SIZE`.
+        """
+        size = size or self.CHUNK_SIZE
+        decoder = codecs.getincrementaldecoder(self.encoding)()
+        remaining = self.length
+        with io.open(self.path, 'rb') as sql_file:
+            sql_file.seek(self.offset)
+            while remaining is None or remaining > 0:
+                content = sql_file.read(size if remaining is None else min(size, remaining))
+                if not content:
+                    break
+                if remaining is not None:
+                    remaining -= len(content)
+                text = decoder.decode(content)
+                if text:
+                    yield text
+        text = decoder.decode(b'', True)
+        if text:
+            yield text
+
+    def read(self):
+        """
+        Read SQL text from file.
+        """
+        with io.open(self.path, 'rb') as sql_file:
+            sql_file.seek(self.offset)
+            content = sql_file.read(-1 if self.length is None else self.length)
+        # line endings are kept as is, so that text matches the fingerprint.
+        return content.decode(self.encoding)
+
+
+def sql_fingerprint(sql):
+    """
+    Fingerprint of a single SQL string or lazy SQL source (e.g. `SQLFile`), which allows to
+    compare them without reading content of the latter.
+    """
+    fingerprint = getattr(sql, 'fingerprint', None)
+    if fingerprint is not None:
+        return fingerprint
+    if not isinstance(sql, bytes):
+        sql = sql.encode('utf-8')
+    return hashlib.sha1(sql).hexdigest()
+
+
+def resolve_sql(sqls):
+    """
+    Replace lazy SQL sources in `sqls` with text they hold, so that result can be written to
+    migrations. `sqls` has the same format as supported by Django's RunSQL operation.
+    """
+    def resolve(sql):
+        return sql.read() if hasattr(sql, 'read') else sql
+
+    if isinstance(sqls, (list, tuple)):
+        return type(sqls)(
+            type(sql)((resolve(sql[0]),) + tuple(sql[1:])) if isinstance(sql, (list, tuple))
+            else resolve(sql)
+            for sql in sqls
+        )
+    return resolve(sqls)
+
 
 class SQLItem(object):
     """
     Represents any SQL entity (unit), for example function, type, index or trigger.
     """
-    def __init__(self, name, sql, reverse_sql=None, dependencies=None, replace=False):
+    def __init__(self, name, sql, reverse_sql=None, dependencies=None, replace=False, swap=False):
         """
         Args:
             name (str): Name of the SQL item. Should be unique among other items in the current
                 application. It is the name that other items can refer to.
-            sql (str/tuple): Forward SQL that creates entity.
-            drop_sql (str/tuple, optional): Backward SQL that destroyes entity. (DROPs).
+            sql (str/tuple/SQLFile): Forward SQL that creates entity.
+            drop_sql (str/tuple/SQLFile, optional): Backward SQL that destroyes entity. (DROPs).
             dependencies (list, optional): Collection of item keys, that the current one depends on.
                 Each element is a tuple of two: (app, item_name). Order does not matter.
             replace (bool, optional): If `True`, further migrations will not drop previous version
@@ -21,9 +162,120 @@ class SQLItem(object):
                 If `False` then each changed item will get two operations: dropping previous version
                 and creating new one.
                 Default = `False`.
+            swap (bool, optional): If `True` and `replace` is `False`, further migrations will
+                create new version of item under a versioned name alongside the previous one,
+                drop the previous one and rename the new one, so item is missing for a moment
+                only. Supported for functions and views, which `sql` has only `CREATE`
+                statements of the object `reverse_sql` drops by a single `DROP` statement,
+                others are dropped and created as usual. See `swap.get_versioned_swap_sql`.
+                Default = `False`.
         """
         self.name = name
         self.sql = sql
         self.reverse_sql = reverse_sql
         self.dependencies = dependencies or []
         self.replace = replace
+        self.swap = swap
+
+    def get_swap_sql(self):
+        """
+        SQL putting new version of item in place of the old one, so that the old one is
+        dropped only once the new one is ready, see `swap` argument and `MaterializedView`.
+
+        Returns:
+            (SwapSQL) SQL of swap or `None`, if item is dropped and created from scratch.
+        """
+        if not self.swap or self.replace:
+            return None
+        # imported here, since modules parsing SQL import this one.
+        from migrate_sql.swap import get_versioned_swap_sql
+        return get_versioned_swap_sql(self)
+
+
+class SwapSQL(object):
+    """
+    SQL of swapping versions of an SQL item.
+    """
+    def __init__(self, stage, unstage, swap, unswap):
+        """
+        Args:
+            stage (list): SQL creating new version alongside the old one.
+            unstage (list): SQL dropping new version created by `stage`.
+            swap (list): SQL putting new version in place of the old one, run once the old one
+                is dropped.
+            unswap (list): SQL moving new version back to where `stage` created it.
+        """
+        self.stage = stage
+        self.unstage = unstage
+        self.swap = swap
+        self.unswap = unswap
+
+
+class MaterializedView(SQLItem):
+    """
+    Materialized view of PostgreSQL, along with its indexes.
+
+    Changed view is rebuilt without downtime: new version is built, populated and indexed
+    under a temporary name, while readers still use the old one. Then the old one is dropped
+    and the new one is renamed, which holds exclusive lock for a moment only. Items depending
+    on view are recreated after the swap.
+    """
+    # appended to names of view and its indexes, while new version is being built.
+    STAGE_SUFFIX = '__new'
+
+    def __init__(self, name, query, indexes=None, dependencies=None):
+        """
+        Args:
+            name (str): Name of the SQL item, which is the name of view as well.
+            query (str/SQLFile): Query of view.
+            indexes (list, optional): Indexes of view, tuples of two: (name, sql). SQL creating
+                index refers to names of index and view by `{index}` and `{view}` placeholders,
+                e.g. `('top_books_id', 'CREATE UNIQUE INDEX {index} ON {view} (id)')`.
+            dependencies (list, optional): Collection of item keys, that the current one depends on.
+        """
+        super(MaterializedView, self).__init__(
+            name, None, 'DROP MATERIALIZED VIEW {}'.format(name), dependencies=dependencies)
+        self.query = query
+        self.indexes = [tuple(index) for index in indexes or ()]
+
+    @property
+    def sql(self):
+        """
+        SQL creating view and its indexes, unless set explicitly. Built when needed, so that
+        query stored in a file is not read on import of `sql_config`.
+        """
+        if self._sql is not None:
+            return self._sql
+        return self.create_sql()
+
+    @sql.setter
+    def sql(self, value):
+        self._sql = value
+
+    def create_sql(self, suffix=''):
+        """
+        SQL creating view and its indexes, `suffix` is appended to their names.
+        """
+        view = self.name + suffix
+        sql = ['CREATE MATERIALIZED VIEW {} AS {}'.format(view, resolve_sql(self.query))]
+        for index, index_sql in self.indexes:
+            sql.append(index_sql.format(index=index + suffix, view=view))
+        return sql
+
+    def _rename_sql(self, from_suffix, to_suffix):
+        sql = ['ALTER MATERIALIZED VIEW {} RENAME TO {}'.format(self.name + from_suffix,
+                                                                self.name + to_suffix)]
+        for index, _ in self.indexes:
+            sql.append('ALTER INDEX {} RENAME TO {}'.format(index + from_suffix,
+                                                            index + to_suffix))
+        return sql
+
+    def get_swap_sql(self):
+        unstage = ['DROP MATERIALIZED VIEW IF EXISTS {}'.format(self.name + self.STAGE_SUFFIX)]
+        return SwapSQL(
+            # leftover of failed non-atomic migration is dropped first.
+            stage=unstage + self.create_sql(self.STAGE_SUFFIX),
+            unstage=unstage,
+            swap=self._rename_sql(self.STAGE_SUFFIX, ''),
+            unswap=self._rename_sql('', self.STAGE_SUFFIX),
+        )
@@ -1,48 +1,200 @@
 # -*- coding: utf-8 -*-
 from __future__ import unicode_literals
 
-from collections import defaultdict
+import heapq
+from collections import OrderedDict
+from copy import copy
 from importlib import import_module
 
-from django.db.migrations.graph import Node, NodeNotFoundError, CircularDependencyError
+try:
+    from collections.abc import MutableMapping
+except ImportError:
+    from collections import MutableMapping
+
 from django.conf import settings
-from django.apps import apps
 
-SQL_CONFIG_MODULE = settings.__dict__.get('SQL_CONFIG_MODULE', 'sql_config')
+# NOTE: Django's migration graph and app registry are imported, and settings are read, only
+# when first needed, so that the module is cheap to import and does not require settings.
+
+
+def get_sql_config_module():
+    """
+    Name of module holding SQL items of an app, `SQL_CONFIG_MODULE` setting.
+    """
+    return getattr(settings, 'SQL_CONFIG_MODULE', 'sql_config')
+
+
+# Marks keys deleted in a layer of `PersistentDict`.
+_DELETED = object()
+
+
+class _Layer(object):
+    """
+    Frozen layer of `PersistentDict`, shared among its versions.
+    """
+    def __init__(self, data, parent):
+        self.data = data
+        self.parent = parent
+        self.depth = parent.depth + 1 if parent else 1
+
+
+class PersistentDict(MutableMapping):
+    """
+    Dictionary with O(1) `clone`, which shares unchanged entries with its clones.
+
+    Cloning freezes current entries into a layer shared by both versions, further changes of
+    each version go to its own layer on top of shared ones. Chain of layers is flattened once
+    it gets deeper than `MAX_DEPTH`, so lookups stay cheap.
+    """
+    MAX_DEPTH = 16
+
+    def __init__(self, data=None, default=None):
+        """
+        Args:
+            data (dict, optional): Initial entries.
+            default (callable, optional): Factory of value returned for missing keys, like
+                `defaultdict` has, but missing keys are not inserted.
+        """
+        self._data = dict(data or ())
+        self._parent = None
+        self._len = len(self._data)
+        self.default = default
+
+    def clone(self):
+        if self._parent and self._parent.depth >= self.MAX_DEPTH:
+            self._data = self._flatten()
+            self._parent = None
+        if self._data:
+            self._parent = _Layer(self._data, self._parent)
+            self._data = {}
+        clone = self.__class__(default=self.default)
+        clone._parent = self._parent
+        clone._len = self._len
+        return clone
+
+    def _flatten(self):
+        layers = []
+        layer = self._parent
+        while layer:
+            layers.append(layer.data)
+            layer = layer.parent
+        layers.reverse()
+        layers.append(self._data)
+        result = {}
+        for data in layers:
+            result.update(data)
+        return dict((key, value) for key, value in result.items() if value is not _DELETED)
+
+    def _get(self, key):
+        value = self._data.get(key, _DELETED)
+        if key not in self._data:
+            layer = self._parent
+            while layer:
+                if key in layer.data:
+                    value = layer.data[key]
+                    break
+                layer = layer.parent
+        return value
+
+    def __getitem__(self, key):
+        value = self._get(key)
+        if value is _DELETED:
+            if self.default is None:
+                raise KeyError(key)
+            return self.default()
+        return value
+
+    def __contains__(self, key):
+        return self._get(key) is not _DELETED
+
+    def __setitem__(self, key, value):
+        if key not in self:
+            self._len += 1
+        self._data[key] = value
+
+    def __delitem__(self, key):
+        if key not in self:
+            raise KeyError(key)
+        self._len -= 1
+        if self._parent:
+            self._data[key] = _DELETED
+        else:
+            del self._data[key]
+
+    def __iter__(self):
+        if self._parent:
+            # flattening is as costly as iterating, so keep the result.
+            self._data = self._flatten()
+            self._parent = None
+        return iter(self._data)
+
+    def __len__(self):
+        return self._len
+
+    def __repr__(self):
+        return '{}({!r})'.format(self.__class__.__name__, dict(self.items()))
 
 
 class SQLStateGraph(object):
     """
     Represents graph assembled by SQL items as nodes and parent-child relations as arcs.
+
+    Graph is persistent: `clone` is O(1) and shares items and dependencies with the original,
+    changes of one version are invisible to others. Items and dependency sets are never
+    changed in place, so any number of versions (e.g. migration states) may coexist.
+
+    `node_map` holds nodes linked by `build_graph` and is replaced on every build.
+    Reachability queries (`descendants_of`, `ancestors_of`) are answered by bitsets over dense
+    ids of nodes, built on first query after build.
     """
     def __init__(self):
-        self.nodes = {}
+        self.nodes = PersistentDict()
         self.node_map = {}
-        self.dependencies = defaultdict(set)
+        self.dependencies = PersistentDict(default=frozenset)
+        self._reachability = None
+
+    def clone(self):
+        """
+        Make a copy of graph, sharing structure with the current one.
+        """
+        graph = self.__class__()
+        graph.nodes = self.nodes.clone()
+        graph.node_map = self.node_map
+        graph.dependencies = self.dependencies.clone()
+        graph._reachability = self._reachability
+        return graph
 
     def remove_node(self, key):
-        # XXX: Workaround for Issue #2
-        # Silences state aggregation problem in `migrate` command.
-        if key in self.nodes and key in self.node_map:
-            del self.nodes[key]
-            del self.node_map[key]
+        del self.nodes[key]
 
     def add_node(self, key, sql_item):
-        node = Node(key)
-        self.node_map[key] = node
+        self.nodes[key] = sql_item
+
+    def update_node(self, key, **attrs):
+        """
+        Replace SQL item of node with its copy, having `attrs` changed.
+        Items may be shared between versions of graph, so they're never changed in place.
+        """
+        sql_item = copy(self.nodes[key])
+        sql_item.dependencies = list(sql_item.dependencies)
+        for attr, value in attrs.items():
+            setattr(sql_item, attr, value)
         self.nodes[key] = sql_item
 
     def add_lazy_dependency(self, child, parent):
         """
         Add dependency to be resolved and applied later.
         """
-        self.dependencies[child].add(parent)
+        self.dependencies[child] = self.dependencies[child] | frozenset([parent])
 
     def remove_lazy_dependency(self, child, parent):
         """
-        Add dependency to be resolved and applied later.
+        Remove dependency to be resolved and applied later.
         """
-        self.dependencies[child].remove(parent)
+        dependencies = self.dependencies[child]
+        if parent not in dependencies:
+            raise KeyError(parent)
+        self.dependencies[child] = dependencies - frozenset([parent])
 
     def remove_lazy_for_child(self, child):
         """
@@ -55,6 +207,10 @@ class SQLStateGraph(object):
         """
         Read lazy dependency list and build graph.
         """
+        from django.db.migrations.graph import Node, NodeNotFoundError
+
+        # nodes are built from scratch, since previous ones might be shared with other versions.
+        self.node_map = {key: Node(key) for key in self.nodes}
         for child, parents in self.dependencies.items():
             if child not in self.nodes:
                 raise NodeNotFoundError(
@@ -72,29 +228,193 @@ class SQLStateGraph(object):
                 self.node_map[child].add_parent(self.node_map[parent])
                 self.node_map[parent].add_child(self.node_map[child])
 
-        for node in self.nodes:
-            self.ensure_not_cyclic(node,
-                                   lambda x: (parent.key for parent in self.node_map[x].parents))
+        self._reachability = None
+        # the check walks the whole graph, once is enough.
+        self.ensure_not_cyclic(None, lambda x: (parent.key for parent in self.node_map[x].parents))
 
     def ensure_not_cyclic(self, start, get_children):
+        from django.db.migrations.graph import CircularDependencyError
+
         # Algo from GvR:
         # http://neopythonic.blogspot.co.uk/2009/01/detecting-cycles-in-directed-graph.html
         todo = set(self.nodes)
         while todo:
             node = todo.pop()
             stack = [node]
+            on_stack = {node}
             while stack:
                 top = stack[-1]
                 for node in get_children(top):
-                    if node in stack:
+                    if node in on_stack:
                         cycle = stack[stack.index(node):]
                         raise CircularDependencyError(", ".join("%s.%s" % n for n in cycle))
                     if node in todo:
                         stack.append(node)
+                        on_stack.add(node)
                         todo.remove(node)
                         break
                 else:
-                    node = stack.pop()
+                    on_stack.discard(stack.pop())
+
+    def get_reachability(self):
+        """
+        Reachability index of built graph, see `Reachability`.
+        """
+        if self._reachability is None:
+            self._reachability = Reachability(self.node_map)
+        return self._reachability
+
+    def descendants_of(self, keys):
+        """
+        Keys of all nodes depending on any of `keys`, directly or not, including `keys`.
+
+        Returns:
+            (list) Keys ordered from leaves to roots.
+        """
+        reachability = self.get_reachability()
+        return reachability.keys(reachability.descendants(keys), leaves_first=True)
+
+    def ancestors_of(self, keys):
+        """
+        Keys of all nodes any of `keys` depends on, directly or not, including `keys`.
+
+        Returns:
+            (list) Keys ordered from leaves to roots.
+        """
+        reachability = self.get_reachability()
+        return reachability.keys(reachability.ancestors(keys), leaves_first=True)
+
+
+class Reachability(object):
+    """
+    Transitive closure of acyclic graph as bitsets. Nodes get dense ids in topological order
+    (parents first), sets of nodes are Python integers having bits of their ids set, so that
+    queries over many keys take a few big integer operations instead of traversals.
+    """
+    def __init__(self, node_map):
+        self.order = self._sort(node_map)
+        self.ids = {key: i for i, key in enumerate(self.order)}
+        ids = self.ids
+        # closures are built in one pass each: children of a node precede it in reverse order.
+        self._descendants = [0] * len(self.order)
+        for i in range(len(self.order) - 1, -1, -1):
+            mask = 1 << i
+            for child in node_map[self.order[i]].children:
+                mask |= self._descendants[ids[child.key]]
+            self._descendants[i] = mask
+        self._ancestors = [0] * len(self.order)
+        for i, key in enumerate(self.order):
+            mask = 1 << i
+            for parent in node_map[key].parents:
+                mask |= self._ancestors[ids[parent.key]]
+            self._ancestors[i] = mask
+
+    @staticmethod
+    def _sort(node_map):
+        """
+        Topological order of nodes, parents first. Ties are broken by keys, so that order is
+        deterministic.
+        """
+        degrees = {key: len(node.parents) for key, node in node_map.items()}
+        ready = [key for key, degree in degrees.items() if not degree]
+        heapq.heapify(ready)
+        order = []
+        while ready:
+            key = heapq.heappop(ready)
+            order.append(key)
+            for child in node_map[key].children:
+                degrees[child.key] -= 1
+                if not degrees[child.key]:
+                    heapq.heappush(ready, child.key)
+        return order
+
+    def mask(self, keys):
+        """
+        Bitset of `keys`.
+        """
+        mask = 0
+        for key in keys:
+            mask |= 1 << self.ids[key]
+        return mask
+
+    def descendants(self, keys):
+        """
+        Bitset of `keys` and all their descendants.
+        """
+        mask = 0
+        for key in keys:
+            mask |= self._descendants[self.ids[key]]
+        return mask
+
+    def ancestors(self, keys):
+        """
+        Bitset of `keys` and all their ancestors.
+        """
+        mask = 0
+        for key in keys:
+            mask |= self._ancestors[self.ids[key]]
+        return mask
+
+    def keys(self, mask, leaves_first=False):
+        """
+        Keys of bitset in topological order, parents first unless `leaves_first` is `True`.
+        """
+        bits = bin(mask)[:1:-1]
+        result = []
+        pos = bits.find('1')
+        while pos >= 0:
+            result.append(self.order[pos])
+            pos = bits.find('1', pos + 1)
+        if leaves_first:
+            result.reverse()
+        return result
+
+
+def get_sql_config(app_config):
+    """
+    Module holding SQL items of an app.
+
+    Returns:
+        (module) Module having `sql_items` or `None`, if the app has no SQL items.
+    """
+    try:
+        module = import_module('.'.join((app_config.module.__name__, get_sql_config_module())))
+    except ImportError:
+        return None
+    return module if hasattr(module, 'sql_items') else None
+
+
+def build_items_graph(items):
+    """
+    Build graph of SQL items.
+
+    If `SQL_INFER_DEPENDENCIES` setting is `True`, dependencies declared by items are replaced
+    with the ones inferred from their SQL, see `analyzer.infer_dependencies`.
+
+    Args:
+        items (OrderedDict): SQL items by their keys, `(app_label, name)`.
+    Returns:
+        (SQLStateGraph) Built graph.
+    """
+    if getattr(settings, 'SQL_INFER_DEPENDENCIES', False):
+        from migrate_sql.analyzer import infer_dependencies
+
+        reports = infer_dependencies(items)
+        inferred = OrderedDict()
+        for key, sql_item in items.items():
+            # copied, so that kind of item (e.g. `MaterializedView`) is kept.
+            inferred[key] = copy(sql_item)
+            inferred[key].dependencies = sorted(reports[key].inferred)
+        items = inferred
+
+    graph = SQLStateGraph()
+    for key, sql_item in items.items():
+        graph.add_node(key, sql_item)
+        for dep in sql_item.dependencies:
+            graph.add_lazy_dependency(key, dep)
+
+    graph.build_graph()
+    return graph
 
 
 def build_current_graph():
@@ -104,19 +424,62 @@ def build_current_graph():
     Returns:
         (SQLStateGraph) Current project state graph.
     """
-    graph = SQLStateGraph()
+    from django.apps import apps
+
+    items = OrderedDict()
     for app_name, config in apps.app_configs.items():
-        try:
-            module = import_module(
-                '.'.join((config.module.__name__, SQL_CONFIG_MODULE)))
-            sql_items = module.sql_items
-        except (ImportError, AttributeError):
+        module = get_sql_config(config)
+        if module is None:
             continue
-        for sql_item in sql_items:
-            graph.add_node((app_name, sql_item.name), sql_item)
+        for sql_item in module.sql_items:
+            items[(app_name, sql_item.name)] = sql_item
+    return build_items_graph(items)
+
+
+def _iter_sql_operations(operations):
+    """
+    SQL item operations among `operations`, including ones nested into state operations
+    (e.g. of `SeparateDatabaseAndState`), in order their state changes are applied.
+    """
+    from migrate_sql.operations import MigrateSQLMixin
+
+    for operation in operations:
+        for nested in _iter_sql_operations(getattr(operation, 'state_operations', ())):
+            yield nested
+        if isinstance(operation, MigrateSQLMixin):
+            yield operation
+
 
-            for dep in sql_item.dependencies:
-                graph.add_lazy_dependency((app_name, sql_item.name), dep)
+def build_migrations_graph(loader, nodes=None, at_end=True):
+    """
+    Read state of SQL items from migrations history, the same `loader.project_state` holds.
+    Only SQL item operations are replayed, models are neither rendered nor even read, which is
+    much faster for projects having long history of models.
+
+    Args:
+        loader (MigrationLoader): Loader of migrations.
+        nodes (list/tuple, optional): Migration keys `(app_label, name)` to build state at,
+            all leaf migrations by default.
+        at_end (bool): Whether to include changes of `nodes` themselves.
+    Returns:
+        (SQLStateGraph) State graph of migrations.
+    """
+    migration_graph = loader.graph
+    if nodes is None:
+        nodes = migration_graph.leaf_nodes()
+    elif isinstance(nodes, tuple):
+        nodes = [nodes]
+
+    graph = SQLStateGraph()
+    seen = set()
+    for node in nodes:
+        for key in migration_graph.forwards_plan(node):
+            if key in seen or (not at_end and key in nodes):
+                continue
+            seen.add(key)
+            migration = migration_graph.nodes[key]
+            for operation in _iter_sql_operations(migration.operations):
+                operation.sql_state_forwards(migration.app_label, graph)
 
     graph.build_graph()
     return graph
@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+"""
+Compiles SQL items of all apps into manifest, that allows building SQL state graph
+without importing `sql_config` modules.
+"""
+
+from __future__ import unicode_literals
+
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from migrate_sql.autodetector import is_sql_equal
+from migrate_sql.graph import build_current_graph
+from migrate_sql.manifest import ManifestError, load_manifest, write_manifest
+
+
+def _is_item_equal(item1, item2):
+    return (type(item1) is type(item2) and
+            is_sql_equal(item1.sql, item2.sql) and
+            is_sql_equal(item1.reverse_sql, item2.reverse_sql) and
+            set(item1.dependencies) == set(item2.dependencies) and
+            item1.replace == item2.replace and
+            item1.swap == item2.swap)
+
+
+class Command(BaseCommand):
+    help = "Compiles SQL items of all apps into a manifest."
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Path of manifest file to write.')
+        parser.add_argument('--check', action='store_true', dest='check', default=False,
+                            help='Exit with error if manifest is outdated instead of writing it.')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        graph = build_current_graph()
+
+        if options['check']:
+            if not os.path.exists(path):
+                raise CommandError('SQL manifest {} does not exist.'.format(path))
+            compiled = load_manifest(path)
+            outdated = sorted(
+                key for key in set(graph.nodes) | set(compiled.nodes)
+                if key not in graph.nodes or key not in compiled.nodes or
+                not _is_item_equal(graph.nodes[key], compiled.nodes[key])
+            )
+            if outdated:
+                raise CommandError('SQL manifest {} is outdated: {}.'.format(
+                    path, ', '.join('%s.%s' % key for key in outdated)))
+            if options['verbosity'] >= 1:
+                self.stdout.write('SQL manifest {} is up to date.'.format(path))
+            return
+
+        try:
+            write_manifest(graph, path)
+        except ManifestError as ex:
+            raise CommandError(str(ex))
+        if options['verbosity'] >= 1:
+            self.stdout.write('Compiled {} SQL items into {}.'.format(len(graph.nodes), path))
@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+"""
+Reports dependencies of SQL items declared, but not referenced by their SQL, and the ones
+referenced, but not declared. Proposes minimal dependency sets.
+"""
+
+from __future__ import unicode_literals
+
+from django.core.management.base import BaseCommand, CommandError
+
+from migrate_sql.analyzer import infer_dependencies
+from migrate_sql.graph import build_current_graph
+
+
+def _keys(keys):
+    return ', '.join('%s.%s' % key for key in sorted(keys))
+
+
+class Command(BaseCommand):
+    help = "Infers dependencies of SQL items from their SQL and reports differences."
+
+    def add_arguments(self, parser):
+        parser.add_argument('app_label', nargs='*',
+                            help='Report SQL items of these apps only.')
+        parser.add_argument('--check', action='store_true', dest='check', default=False,
+                            help='Exit with error if declared dependencies differ from '
+                                 'the ones inferred.')
+
+    def handle(self, *app_labels, **options):
+        app_labels = set(app_labels or options.get('app_label') or ())
+        graph = build_current_graph()
+        reports = infer_dependencies(graph.nodes)
+
+        differ = []
+        for key, report in sorted(reports.items()):
+            if app_labels and key[0] not in app_labels:
+                continue
+            if report.ok:
+                continue
+            differ.append(key)
+            if options['verbosity'] >= 1:
+                self.stdout.write('%s.%s:' % key)
+                if report.unused:
+                    self.stdout.write('  unused: {}'.format(_keys(report.unused)))
+                if report.missing:
+                    self.stdout.write('  missing: {}'.format(_keys(report.missing)))
+                self.stdout.write('  dependencies={!r}'.format(
+                    [tuple(str(part) for part in dep) for dep in sorted(report.inferred)]))
+
+        if differ and options['check']:
+            raise CommandError('Dependencies of SQL items differ from inferred: {}.'.format(
+                _keys(differ)))
+        if not differ and options['verbosity'] >= 1:
+            self.stdout.write('Dependencies of SQL items match their SQL.')
@@ -6,10 +6,13 @@ Replaces built-in Django command and forces it generate SQL item modification op
 into regular Django migrations.
 """
 
+import os
 import sys
 
 from django.core.management.commands.makemigrations import Command as MakeMigrationsCommand
+from django.conf import settings
 from django.db.migrations.loader import MigrationLoader
+from django.db.migrations.writer import MigrationWriter
 from django.db.migrations import Migration
 from django.core.management.base import CommandError
 from django.db.migrations.questioner import InteractiveMigrationQuestioner
@@ -19,10 +22,40 @@ from django.utils.six import iteritems
 
 from migrate_sql.autodetector import MigrationAutodetector
 from migrate_sql.graph import build_current_graph
+from migrate_sql.manifest import load_manifest
+from migrate_sql.store import STORE_DIRECTORY, store_operation_sql
+from migrate_sql.watch import SQLWatcher
 
 
 class Command(MakeMigrationsCommand):
 
+    def add_arguments(self, parser):
+        super(Command, self).add_arguments(parser)
+        parser.add_argument('--sql-manifest', action='store', dest='sql_manifest', default=None,
+                            help='Read SQL items from manifest compiled by `compilesqlmanifest` '
+                                 'instead of `sql_config` modules.')
+        parser.add_argument('--sql-store', action='store_true', dest='sql_store', default=False,
+                            help='Store SQL texts in content-addressed store of migrations '
+                                 'package instead of embedding them. Default is `SQL_STORE` '
+                                 'setting.')
+        parser.add_argument('--batch-drops', action='store_true', dest='batch_drops',
+                            default=False,
+                            help='Drop SQL items of the same kind and dependency layer by single '
+                                 'statements. Default is `SQL_BATCH_DROPS` setting.')
+        parser.add_argument('--split-layers', action='store_true', dest='split_layers',
+                            default=False,
+                            help='Put every dependency layer of SQL item operations into its own '
+                                 'migration, run in its own transaction. Default is '
+                                 '`SQL_SPLIT_LAYERS` setting.')
+        parser.add_argument('--consolidate', action='store_true', dest='consolidate',
+                            default=False,
+                            help='Put SQL item operations of an app into as few migrations as '
+                                 'dependencies between apps allow. Default is `SQL_CONSOLIDATE` '
+                                 'setting.')
+        parser.add_argument('--watch', action='store_true', dest='watch', default=False,
+                            help='Keep running and print SQL item operations every time '
+                                 '`sql_config` modules change. Nothing is written.')
+
     def handle(self, *app_labels, **options):
 
         self.verbosity = options.get('verbosity')
@@ -32,6 +65,7 @@ class Command(MakeMigrationsCommand):
         self.empty = options.get('empty', False)
         self.migration_name = options.get('name', None)
         self.exit_code = options.get('exit_code', False)
+        self.sql_store = options.get('sql_store') or getattr(settings, 'SQL_STORE', False)
 
         # Make sure the app they asked for exists
         app_labels = set(app_labels)
@@ -81,10 +115,16 @@ class Command(MakeMigrationsCommand):
         if self.merge and conflicts:
             return self.handle_merge(loader, conflicts)
 
+        if options.get('watch'):
+            return self.watch(loader, app_labels)
+
         state = loader.project_state()
 
         # NOTE: customization. Passing graph to autodetector.
-        sql_graph = build_current_graph()
+        if options.get('sql_manifest'):
+            sql_graph = load_manifest(options['sql_manifest'])
+        else:
+            sql_graph = build_current_graph()
 
         # Set up autodetector
         autodetector = MigrationAutodetector(
@@ -92,6 +132,9 @@ class Command(MakeMigrationsCommand):
             ProjectState.from_apps(apps),
             InteractiveMigrationQuestioner(specified_apps=app_labels, dry_run=self.dry_run),
             sql_graph,
+            batch_drops=options.get('batch_drops') or None,
+            split_layers=options.get('split_layers') or None,
+            consolidate=options.get('consolidate') or None,
         )
 
         # If they want to make an empty migration, make one for each app
@@ -135,3 +178,39 @@ class Command(MakeMigrationsCommand):
                 return
 
         self.write_migration_files(changes)
+
+    def watch(self, loader, app_labels):
+        """
+        Print SQL item operations every time SQL items change, until interrupted.
+        """
+        def report(changes):
+            if not changes:
+                self.stdout.write("No changes detected")
+            for app_label, operations in changes.items():
+                self.stdout.write(self.style.MIGRATE_HEADING("SQL changes for '%s':" % app_label))
+                for operation in operations:
+                    self.stdout.write("  - %s" % operation.describe())
+
+        def report_error(error):
+            self.stderr.write("Error in SQL items, waiting for changes: %s" % error)
+
+        if self.verbosity >= 1:
+            self.stdout.write("Watching SQL items for changes, press CTRL-C to quit.")
+        try:
+            SQLWatcher(loader, app_labels).watch(report, errback=report_error)
+        except KeyboardInterrupt:
+            pass
+
+    def write_migration_files(self, changes):
+        """
+        Moves SQL texts of operations to SQL store before writing migrations, if requested.
+        """
+        if self.sql_store:
+            for app_label, app_migrations in changes.items():
+                for migration in app_migrations:
+                    directory = os.path.join(os.path.dirname(MigrationWriter(migration).path),
+                                             STORE_DIRECTORY)
+                    for operation in migration.operations:
+                        store_operation_sql(operation, app_label, directory,
+                                            write=not self.dry_run)
+        super(Command, self).write_migration_files(changes)
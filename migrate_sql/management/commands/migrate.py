@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+"""
+Replaces built-in Django command to report progress of SQL item operations and to key
+checkpoints of SQL item operations by migrations run.
+"""
+
+from __future__ import unicode_literals
+
+from django.conf import settings
+from django.core.management.commands.migrate import Command as MigrateCommand
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from migrate_sql.progress import MigrationProgress, activate
+from migrate_sql.recorder import track_checkpoints
+
+
+class Command(MigrateCommand):
+
+    def add_arguments(self, parser):
+        super(Command, self).add_arguments(parser)
+        parser.add_argument('--sql-progress', action='store_true', dest='sql_progress',
+                            default=False,
+                            help='Report every SQL item operation run with estimate of '
+                                 'remaining time, based on durations recorded by previous '
+                                 'runs. Default is `SQL_PROGRESS` setting.')
+        parser.add_argument('--sql-index-progress', action='store_true',
+                            dest='sql_index_progress', default=False,
+                            help='Same as --sql-progress, reporting also phase, blocks and '
+                                 'tuples of index builds, while they run (PostgreSQL 12+). '
+                                 'Default is `SQL_INDEX_PROGRESS` setting.')
+
+    def handle(self, *args, **options):
+        self.sql_progress = None
+        self.sql_connection = connections[options.get('database') or DEFAULT_DB_ALIAS]
+        index_progress = (options.get('sql_index_progress') or
+                          getattr(settings, 'SQL_INDEX_PROGRESS', False))
+        if ((options.get('sql_progress') or getattr(settings, 'SQL_PROGRESS', False) or
+                index_progress) and options.get('verbosity', 1) >= 1):
+            self.sql_progress = MigrationProgress(self.sql_connection, self.stdout,
+                                                  index_progress=index_progress)
+        with activate(self.sql_progress):
+            return super(Command, self).handle(*args, **options)
+
+    def migration_progress_callback(self, action, migration=None, fake=False):
+        super(Command, self).migration_progress_callback(action, migration, fake)
+        track_checkpoints(self.sql_connection, action, migration, fake)
+        if self.sql_progress is None or fake:
+            return
+        if action == 'apply_start':
+            self.sql_progress.start_migration(migration)
+        elif action == 'unapply_start':
+            self.sql_progress.start_migration(migration, backwards=True)
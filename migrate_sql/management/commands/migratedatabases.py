@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+"""
+Applies migrations to many databases (e.g. shards having the same schema) concurrently.
+"""
+
+from __future__ import unicode_literals
+
+from django.apps import apps
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from migrate_sql.parallel import migrate_databases
+
+
+class Command(BaseCommand):
+    help = "Migrates many databases concurrently and reports results per database."
+
+    def add_arguments(self, parser):
+        parser.add_argument('app_label', nargs='?',
+                            help='App label of an application to synchronize the state.')
+        parser.add_argument('migration_name', nargs='?',
+                            help='Database state will be brought to the state after that '
+                                 'migration. Use the name "zero" to unapply all migrations.')
+        parser.add_argument('--databases', action='store', dest='databases', default=None,
+                            help='Comma separated database aliases. Defaults to all databases.')
+        parser.add_argument('--workers', action='store', dest='workers', type=int, default=4,
+                            help='Maximum number of databases migrated at the same time.')
+        parser.add_argument('--fake', action='store_true', dest='fake', default=False,
+                            help='Mark migrations as run without actually running them.')
+
+    def handle(self, *args, **options):
+        app_label = options['app_label']
+        if app_label:
+            try:
+                apps.get_app_config(app_label)
+            except LookupError as ex:
+                raise CommandError(str(ex))
+
+        if options['databases']:
+            aliases = [alias for alias in options['databases'].split(',') if alias]
+        else:
+            aliases = list(settings.DATABASES)
+        unknown = [alias for alias in aliases if alias not in settings.DATABASES]
+        if unknown:
+            raise CommandError('Unknown databases: {}.'.format(', '.join(unknown)))
+
+        results = migrate_databases(aliases, app_label, options['migration_name'],
+                                    fake=options['fake'], workers=options['workers'])
+
+        failed = []
+        for result in results:
+            if result.ok:
+                status = self.style.MIGRATE_SUCCESS('OK')
+            else:
+                status = self.style.ERROR('FAILED: {}'.format(result.error))
+                failed.append(result.alias)
+            if options['verbosity'] >= 1 or not result.ok:
+                self.stdout.write(
+                    '{}: {} migrations, {} SQL operations ({} skipped by routers) '
+                    'in {:.2f}s... {}'.format(
+                        result.alias, len(result.migrations), result.sql_operations,
+                        result.skipped_operations, result.seconds, status))
+            if options['verbosity'] >= 2:
+                for app, name, backwards in result.migrations:
+                    self.stdout.write('  {} {}.{}'.format(
+                        'Unapplied' if backwards else 'Applied', app, name))
+        if failed:
+            raise CommandError('Migration failed for databases: {}.'.format(', '.join(failed)))
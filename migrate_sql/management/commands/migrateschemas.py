@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+"""
+Applies SQL item migrations to many PostgreSQL schemas (e.g. tenants) concurrently.
+"""
+
+from __future__ import unicode_literals
+
+from django.apps import apps
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS
+
+from migrate_sql.schemas import get_schemas, migrate_schemas
+
+
+class Command(BaseCommand):
+    help = "Applies SQL item migrations to many PostgreSQL schemas concurrently."
+
+    def add_arguments(self, parser):
+        parser.add_argument('app_label', nargs='?',
+                            help='App label of an application to apply SQL items of.')
+        parser.add_argument('migration_name', nargs='?',
+                            help='SQL items will be brought to the state after that migration.')
+        parser.add_argument('--schemas', action='store', dest='schemas', default=None,
+                            help='Comma separated schema names. Defaults to SQL_SCHEMAS setting.')
+        parser.add_argument('--database', action='store', dest='database',
+                            default=DEFAULT_DB_ALIAS, help='Database to migrate schemas of.')
+        parser.add_argument('--workers', action='store', dest='workers', type=int, default=4,
+                            help='Maximum number of schemas migrated at the same time.')
+        parser.add_argument('--fake', action='store_true', dest='fake', default=False,
+                            help='Mark migrations as applied without actually running them.')
+
+    def handle(self, *args, **options):
+        app_label = options['app_label']
+        if app_label:
+            try:
+                apps.get_app_config(app_label)
+            except LookupError as ex:
+                raise CommandError(str(ex))
+
+        if options['schemas']:
+            schemas = [schema for schema in options['schemas'].split(',') if schema]
+        else:
+            schemas = get_schemas()
+        if not schemas:
+            raise CommandError('No schemas to migrate, set SQL_SCHEMAS or use --schemas.')
+
+        try:
+            results = migrate_schemas(
+                schemas, app_label, options['migration_name'], alias=options['database'],
+                fake=options['fake'], workers=options['workers'])
+        except ValueError as ex:
+            raise CommandError(str(ex))
+
+        failed = []
+        for result in results:
+            if result.ok:
+                status = self.style.MIGRATE_SUCCESS('OK')
+            else:
+                status = self.style.ERROR('FAILED: {}'.format(result.error))
+                failed.append(result.schema)
+            if options['verbosity'] >= 1 or not result.ok:
+                self.stdout.write('{}: {} migrations, {} SQL operations in {:.2f}s... {}'.format(
+                    result.schema, len(result.migrations), result.sql_operations,
+                    result.seconds, status))
+            if options['verbosity'] >= 2:
+                for app, name in result.migrations:
+                    self.stdout.write('  Applied {}.{}'.format(app, name))
+        if failed:
+            raise CommandError('Migration failed for schemas: {}. Applied migrations are '
+                               'checkpointed, run command again to continue.'.format(
+                                   ', '.join(failed)))
@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+"""
+Refreshes materialized views declared as SQL items, in order of their dependencies.
+"""
+
+from __future__ import unicode_literals
+
+from django.apps import apps
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS
+
+from migrate_sql.graph import build_current_graph
+from migrate_sql.parallel import DependencyFailed
+from migrate_sql.refresh import refresh_views
+
+
+class Command(BaseCommand):
+    help = "Refreshes materialized views declared as SQL items, in order of their dependencies."
+
+    def add_arguments(self, parser):
+        parser.add_argument('app_label', nargs='*',
+                            help='App labels of applications to refresh views of.')
+        parser.add_argument('--database', action='store', dest='database',
+                            default=DEFAULT_DB_ALIAS, help='Database to refresh views in.')
+        parser.add_argument('--workers', action='store', dest='workers', type=int, default=4,
+                            help='Maximum number of views refreshed at the same time.')
+        parser.add_argument('--no-concurrently', action='store_false', dest='concurrently',
+                            default=True,
+                            help='Never refresh views CONCURRENTLY, even if they have a unique '
+                                 'index.')
+
+    def handle(self, *app_labels, **options):
+        for app_label in app_labels:
+            try:
+                apps.get_app_config(app_label)
+            except LookupError as ex:
+                raise CommandError(str(ex))
+
+        results = refresh_views(build_current_graph(), app_labels, alias=options['database'],
+                                concurrently=options['concurrently'], workers=options['workers'])
+        if not results and options['verbosity'] >= 1:
+            self.stdout.write('No materialized views to refresh.')
+
+        failed = []
+        for result in results:
+            name = '{}.{}'.format(*result.key)
+            if result.ok:
+                if options['verbosity'] >= 1:
+                    self.stdout.write('{}: refreshed{} in {:.2f}s... {}'.format(
+                        name, ' concurrently' if result.concurrently else '', result.seconds,
+                        self.style.MIGRATE_SUCCESS('OK')))
+                continue
+            failed.append(name)
+            if isinstance(result.error, DependencyFailed):
+                self.stdout.write('{}... {}'.format(
+                    name, self.style.NOTICE('SKIPPED: {}'.format(result.error))))
+            else:
+                self.stdout.write('{}... {}'.format(
+                    name, self.style.ERROR('FAILED: {}'.format(result.error))))
+        if failed:
+            raise CommandError('Refresh failed for views: {}.'.format(', '.join(failed)))
@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+"""
+Collapses SQL item migrations of an app into a single baseline migration.
+"""
+
+from __future__ import unicode_literals
+
+import io
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.migrations.loader import AmbiguityError, MigrationLoader
+from django.db.migrations.writer import MigrationWriter
+
+from migrate_sql.squash import SquashError, build_baseline
+
+
+class Command(BaseCommand):
+    help = ("Collapses SQL item migrations of an app into a baseline migration creating SQL "
+            "items alive at their end.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('app_label',
+                            help='App label of the application to squash SQL migrations for.')
+        parser.add_argument('migration_name', nargs='?', default=None,
+                            help='Migrations will be squashed until and including this one, '
+                                 'the last migration of app by default.')
+        parser.add_argument('--dry-run', action='store_true', dest='dry_run', default=False,
+                            help="Just show what baseline would be made; don't actually "
+                                 "write it.")
+
+    def handle(self, *args, **options):
+        app_label = options['app_label']
+        loader = MigrationLoader(None, ignore_no_migrations=True)
+        if app_label not in loader.migrated_apps:
+            raise CommandError("App '%s' does not have migrations." % app_label)
+        if options['migration_name']:
+            try:
+                migration = loader.get_migration_by_prefix(app_label, options['migration_name'])
+            except AmbiguityError:
+                raise CommandError("More than one migration matches '%s' in app '%s'." %
+                                   (options['migration_name'], app_label))
+            except KeyError:
+                raise CommandError("Cannot find a migration matching '%s' from app '%s'." %
+                                   (options['migration_name'], app_label))
+            migration_name = migration.name
+        else:
+            leaves = loader.graph.leaf_nodes(app_label)
+            if len(leaves) != 1:
+                raise CommandError("App '%s' has conflicting migrations, specify the migration "
+                                   "to squash until." % app_label)
+            migration_name = leaves[0][1]
+
+        try:
+            baseline = build_baseline(loader, app_label, migration_name)
+        except SquashError as ex:
+            raise CommandError(str(ex))
+
+        writer = MigrationWriter(baseline)
+        content = writer.as_string()
+        if isinstance(content, bytes):
+            # Django before 1.10 returns encoded migration.
+            content = content.decode('utf-8')
+        if not options['dry_run']:
+            with io.open(writer.path, 'w', encoding='utf-8') as fh:
+                fh.write(content)
+        if options['verbosity'] >= 1:
+            self.stdout.write(self.style.MIGRATE_HEADING(
+                'Baseline of %s migrations creating %s SQL items: %s' %
+                (len(baseline.replaces), len(baseline.operations), writer.path)))
+            if options['verbosity'] >= 3:
+                self.stdout.write(content)
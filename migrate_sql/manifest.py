@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+"""
+Precompiled SQL item manifest.
+
+Manifest is a JSON file holding keys, dependencies and fingerprints of all SQL items of a
+project, and a blob file with their SQL texts, referenced by offsets. Building SQL state graph
+from manifest does not import `sql_config` modules (nor anything they import), and SQL texts
+are not read until needed, which makes short-lived processes (checks, deploy hooks) start fast.
+"""
+
+from __future__ import unicode_literals
+
+import io
+import json
+import os
+
+from migrate_sql.config import MaterializedView, SQLFile, SQLItem, resolve_sql, sql_fingerprint
+from migrate_sql.graph import SQLStateGraph
+
+MANIFEST_VERSION = 1
+BLOB_SUFFIX = '.sql'
+
+
+class ManifestError(Exception):
+    pass
+
+
+class _Blob(object):
+    """
+    Collects SQL texts to be stored in blob, each distinct text is stored once.
+    """
+    def __init__(self):
+        self.chunks = []
+        self.size = 0
+        self.refs = {}
+
+    def add(self, sql):
+        fingerprint = sql_fingerprint(sql)
+        if fingerprint not in self.refs:
+            content = sql.encode('utf-8')
+            self.refs[fingerprint] = {
+                'offset': self.size, 'length': len(content), 'fingerprint': fingerprint,
+            }
+            self.chunks.append(content)
+            self.size += len(content)
+        return self.refs[fingerprint]
+
+
+def _dump_sql(sqls, blob):
+    """
+    Replace SQL texts in `sqls` with references to `blob`. `sqls` has the same format as
+    supported by Django's RunSQL operation: single references stand for strings, lists for
+    sequences, `[reference, params]` lists for `(sql, params)` tuples.
+    """
+    if sqls is None:
+        return None
+    sqls = resolve_sql(sqls)
+    if not isinstance(sqls, (list, tuple)):
+        return blob.add(sqls)
+    return [
+        [blob.add(sql[0])] + list(sql[1:]) if isinstance(sql, (list, tuple)) else blob.add(sql)
+        for sql in sqls
+    ]
+
+
+def _load_sql(data, blob_path):
+    """
+    Reverse of `_dump_sql`, references are turned into lazy `SQLFile` objects.
+    """
+    def load(ref):
+        return SQLFile(blob_path, offset=ref['offset'], length=ref['length'],
+                       fingerprint=ref['fingerprint'])
+
+    if data is None:
+        return None
+    if isinstance(data, dict):
+        return load(data)
+    return [tuple([load(sql[0])] + sql[1:]) if isinstance(sql, list) else load(sql)
+            for sql in data]
+
+
+def blob_path(manifest_path):
+    return manifest_path + BLOB_SUFFIX
+
+
+def write_manifest(graph, manifest_path):
+    """
+    Compile SQL items of `graph` into manifest and blob.
+
+    Args:
+        graph (graph.SQLStateGraph): State of SQL items, e.g. `build_current_graph()`.
+        manifest_path (str): Path of manifest file, blob is written next to it,
+            having `.sql` appended to the name.
+    """
+    blob = _Blob()
+    items = []
+    for (app_label, name), sql_item in sorted(graph.nodes.items()):
+        items.append({
+            'app': app_label,
+            'name': name,
+            'sql': _dump_sql(sql_item.sql, blob),
+            'reverse_sql': _dump_sql(sql_item.reverse_sql, blob),
+            'dependencies': sorted(list(dep) for dep in sql_item.dependencies),
+            'replace': sql_item.replace,
+            'swap': sql_item.swap,
+        })
+        if isinstance(sql_item, MaterializedView):
+            items[-1]['materialized_view'] = {
+                'query': _dump_sql(sql_item.query, blob),
+                'indexes': [list(index) for index in sql_item.indexes],
+            }
+    data = {
+        'version': MANIFEST_VERSION,
+        'blob': os.path.basename(blob_path(manifest_path)),
+        'items': items,
+    }
+    try:
+        content = json.dumps(data, separators=(',', ':'), sort_keys=True)
+    except TypeError as ex:
+        raise ManifestError('SQL params must be JSON serializable: {}'.format(ex))
+
+    with io.open(blob_path(manifest_path), 'wb') as blob_file:
+        for chunk in blob.chunks:
+            blob_file.write(chunk)
+    with io.open(manifest_path, 'wb') as manifest_file:
+        manifest_file.write(content.encode('utf-8'))
+
+
+def load_manifest(manifest_path):
+    """
+    Build SQL state graph from manifest. SQL texts are loaded lazily from blob.
+
+    Returns:
+        (SQLStateGraph) Graph of SQL items manifest holds.
+    """
+    with io.open(manifest_path, encoding='utf-8') as manifest_file:
+        data = json.load(manifest_file)
+    if data.get('version') != MANIFEST_VERSION:
+        raise ManifestError('Unsupported SQL manifest version {!r} of {}.'.format(
+            data.get('version'), manifest_path))
+
+    sql_blob = os.path.join(os.path.dirname(manifest_path), data['blob'])
+    graph = SQLStateGraph()
+    for item in data['items']:
+        key = (item['app'], item['name'])
+        dependencies = [tuple(dep) for dep in item['dependencies']]
+        if 'materialized_view' in item:
+            view = item['materialized_view']
+            sql_item = MaterializedView(item['name'], _load_sql(view['query'], sql_blob),
+                                        indexes=view['indexes'], dependencies=dependencies)
+        else:
+            sql_item = SQLItem(item['name'], _load_sql(item['sql'], sql_blob),
+                               _load_sql(item['reverse_sql'], sql_blob),
+                               dependencies=dependencies, replace=item['replace'],
+                               swap=item.get('swap', False))
+        graph.add_node(key, sql_item)
+        for dep in dependencies:
+            graph.add_lazy_dependency(key, dep)
+    graph.build_graph()
+    return graph
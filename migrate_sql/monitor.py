@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+"""
+Monitoring of index builds run by SQL item operations, used by `migrate --sql-index-progress`.
+
+While an operation building an index runs, a thread polls `pg_stat_progress_create_index`
+(PostgreSQL 12 and later) on its own connection for the backend running the operation, and
+reports phase of the build along with blocks and tuples processed, whenever they change.
+"""
+
+from __future__ import unicode_literals
+
+import re
+import threading
+
+from django.db import DatabaseError, connections
+
+from migrate_sql.config import resolve_sql
+from migrate_sql.splitter import iter_statements
+
+_CREATE_INDEX = re.compile(r'\bCREATE\s+(?:UNIQUE\s+)?INDEX\b', re.IGNORECASE)
+
+# index is known during concurrent builds only. Table created by the same migration is
+# reported by oid, since it's not committed yet.
+_PROGRESS_SQL = """
+SELECT coalesce(t.relname, p.relid::text), i.relname, p.phase,
+       p.blocks_done, p.blocks_total, p.tuples_done, p.tuples_total
+FROM pg_stat_progress_create_index p
+LEFT JOIN pg_class t ON t.oid = p.relid LEFT JOIN pg_class i ON i.oid = p.index_relid
+WHERE p.pid = %s
+"""
+
+
+def builds_index(sqls):
+    """
+    Whether SQL, in format supported by Django's RunSQL operation, may build an index.
+    Scripts stored separately (`SQLFile`) are scanned statement by statement as they're read,
+    so that they're never loaded entirely.
+    """
+    if not isinstance(sqls, (list, tuple)):
+        sqls = [sqls]
+    for sql in sqls:
+        if isinstance(sql, (list, tuple)):
+            sql = sql[0]
+        if hasattr(sql, 'iter_chunks'):
+            statements = iter_statements(sql.iter_chunks())
+        else:
+            statements = [resolve_sql(sql)]
+        if any(statement and _CREATE_INDEX.search(statement) for statement in statements):
+            return True
+    return False
+
+
+class IndexProgress(object):
+    """
+    State of index build, a row of `pg_stat_progress_create_index`.
+    """
+    def __init__(self, table, index, phase, blocks_done, blocks_total, tuples_done,
+                 tuples_total):
+        self.table = table
+        self.index = index
+        self.phase = phase
+        self.blocks_done = blocks_done
+        self.blocks_total = blocks_total
+        self.tuples_done = tuples_done
+        self.tuples_total = tuples_total
+
+    def _key(self):
+        return (self.table, self.index, self.phase, self.blocks_done, self.blocks_total,
+                self.tuples_done, self.tuples_total)
+
+    def __eq__(self, other):
+        return isinstance(other, IndexProgress) and self._key() == other._key()
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __str__(self):
+        return 'index {}on {}: {}, blocks {}/{}, tuples {}/{}'.format(
+            self.index + ' ' if self.index else '', self.table, self.phase, self.blocks_done,
+            self.blocks_total, self.tuples_done, self.tuples_total)
+
+
+class IndexBuildMonitor(object):
+    """
+    Polls progress of index builds run by a database backend in a separate thread, while
+    within the context.
+    """
+    # seconds between polls.
+    interval = 1.0
+
+    def __init__(self, connection, report, interval=None):
+        """
+        Args:
+            connection: Connection building indexes.
+            report (callable): Called with `IndexProgress` from the monitoring thread, every
+                time progress changes.
+            interval (float, optional): Seconds between polls. Default = `interval`.
+        """
+        self.alias = connection.alias
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT pg_backend_pid()')
+            self.pid = cursor.fetchone()[0]
+        self.report = report
+        if interval is not None:
+            self.interval = interval
+        self.reported = False
+        self._stop = threading.Event()
+        self._thread = None
+
+    def poll(self):
+        """
+        Progress of index build in the current thread's connection.
+
+        Returns:
+            (IndexProgress) Progress or `None`, if no index is being built.
+        """
+        with connections[self.alias].cursor() as cursor:
+            cursor.execute(_PROGRESS_SQL, [self.pid])
+            row = cursor.fetchone()
+        return IndexProgress(*row) if row else None
+
+    def _run(self):
+        last = None
+        try:
+            while not self._stop.wait(self.interval):
+                try:
+                    progress = self.poll()
+                except DatabaseError:
+                    # e.g. progress of index builds is not available before PostgreSQL 12.
+                    return
+                if progress is not None and progress != last:
+                    self.report(progress)
+                    self.reported = True
+                last = progress
+        finally:
+            # connections are thread-local and have to be closed by the thread that opened them.
+            connections[self.alias].close()
+
+    def __enter__(self):
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._stop.set()
+        self._thread.join()
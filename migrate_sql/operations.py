@@ -1,11 +1,48 @@
 # -*- coding: utf-8 -*-
 from __future__ import unicode_literals
 
+from types import MethodType
+
+from django.db import router
 from django.db.migrations.operations import RunSQL
 from django.db.migrations.operations.base import Operation
 
-from migrate_sql.graph import SQLStateGraph
-from migrate_sql.config import SQLItem
+from migrate_sql.config import SQLItem, resolve_sql, sql_fingerprint
+from migrate_sql.planner import check_cascade
+from migrate_sql.progress import track_progress
+from migrate_sql.splitter import iter_statements, split_cache
+
+
+def clone_state(state):
+    """
+    Clone project state along with SQL state it holds.
+    Bound to project states as `clone` method by `set_sql_state`, since Django's
+    `ProjectState.clone` knows nothing about SQL state.
+    """
+    new_state = state.__class__.clone(state)
+    set_sql_state(new_state, state.sql_state.clone())
+    return new_state
+
+
+def set_sql_state(state, sql_state):
+    """
+    Attach SQLStateGraph to project state, so that it survives cloning of state.
+    """
+    state.sql_state = sql_state
+    state.clone = MethodType(clone_state, state)
+
+
+def uses_default_split(connection):
+    """
+    Whether database backend splits scripts into statements by Django's default implementation,
+    which uses `sqlparse` and is very slow on big scripts.
+    """
+    from django.db.backends.base.operations import BaseDatabaseOperations
+
+    def unwrap(method):
+        return getattr(method, '__func__', method)
+    return (unwrap(type(connection.ops).prepare_sql_script) is
+            unwrap(BaseDatabaseOperations.prepare_sql_script))
 
 
 class MigrateSQLMixin(object):
@@ -14,9 +51,17 @@ class MigrateSQLMixin(object):
         Get SQLStateGraph from state.
         """
         if not hasattr(state, 'sql_state'):
-            setattr(state, 'sql_state', SQLStateGraph())
+            # imported here, since migrations import this module just to be loaded.
+            from migrate_sql.graph import SQLStateGraph
+            set_sql_state(state, SQLStateGraph())
         return state.sql_state
 
+    def sql_state_forwards(self, app_label, sql_state):
+        """
+        Apply changes of operation to SQL state only. Unlike `state_forwards`, doesn't need
+        project state, so SQL state can be replayed without rendering models.
+        """
+
 
 class AlterSQLState(MigrateSQLMixin, Operation):
     """
@@ -37,30 +82,26 @@ class AlterSQLState(MigrateSQLMixin, Operation):
         return (self.__class__.__name__, [], kwargs)
 
     def state_forwards(self, app_label, state):
-        sql_state = self.get_sql_state(state)
-        key = (app_label, self.name)
-
-        if key not in sql_state.nodes:
-            # XXX: dummy for `migrate` command, that does not preserve state object.
-            # Should fail with error when fixed.
-            return
+        self.sql_state_forwards(app_label, self.get_sql_state(state))
 
-        sql_item = sql_state.nodes[key]
+    def sql_state_forwards(self, app_label, sql_state):
+        key = (app_label, self.name)
+        dependencies = list(sql_state.nodes[key].dependencies)
 
         for dep in self.add_dependencies:
             # we are also adding relations to aggregated SQLItem, but only to restore
             # original items. Still using graph for advanced node/arc manipulations.
-
-            # XXX: dummy `if` for `migrate` command, that does not preserve state object.
-            # Fail with error when fixed
-            if dep in sql_item.dependencies:
-                sql_item.dependencies.remove(dep)
+            if dep not in dependencies:
+                dependencies.append(dep)
             sql_state.add_lazy_dependency(key, dep)
 
         for dep in self.remove_dependencies:
-            sql_item.dependencies.append(dep)
+            if dep in dependencies:
+                dependencies.remove(dep)
             sql_state.remove_lazy_dependency(key, dep)
 
+        sql_state.update_node(key, dependencies=dependencies)
+
     def database_forwards(self, app_label, schema_editor, from_state, to_state):
         pass
 
@@ -99,6 +140,85 @@ class BaseAlterSQL(MigrateSQLMixin, RunSQL):
         kwargs['name'] = self.name
         return (name, args, kwargs)
 
+    def state_forwards(self, app_label, state):
+        super(BaseAlterSQL, self).state_forwards(app_label, state)
+        self.sql_state_forwards(app_label, self.get_sql_state(state))
+
+    @property
+    def fingerprint(self):
+        """
+        Fingerprint of operation, changes if operation or any of its SQL is changed.
+        """
+        parts = [self.__class__.__name__, self.name]
+        for sqls in (self.sql, self.reverse_sql):
+            if not isinstance(sqls, (list, tuple)):
+                sqls = [sqls]
+            for sql in sqls:
+                if isinstance(sql, (list, tuple)):
+                    parts.append('{} {!r}'.format(sql_fingerprint(sql[0]), list(sql[1:])))
+                else:
+                    parts.append(sql_fingerprint(sql) if sql else repr(sql))
+        return sql_fingerprint('\n'.join(parts))
+
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        """
+        In migrations, that are not atomic, operations are checkpointed, so that operations
+        completed are skipped when failed migration is run again.
+        """
+        # imported here, since migrations import this module just to be loaded.
+        from migrate_sql.recorder import get_checkpoint_recorder
+
+        if not router.allow_migrate(schema_editor.connection.alias, app_label, **self.hints):
+            return
+        recorder, key = get_checkpoint_recorder(schema_editor, self)
+        if recorder is not None and recorder.is_applied(key, self.fingerprint):
+            return
+        with track_progress(app_label, self, schema_editor.connection):
+            check_cascade(schema_editor.connection, self.sql, [from_state, to_state])
+            super(BaseAlterSQL, self).database_forwards(app_label, schema_editor, from_state,
+                                                        to_state)
+        if recorder is not None:
+            recorder.record_applied(key, self.fingerprint)
+
+    def database_backwards(self, app_label, schema_editor, from_state, to_state):
+        from migrate_sql.recorder import get_checkpoint_recorder
+
+        with track_progress(app_label, self, schema_editor.connection, backwards=True):
+            if (self.reverse_sql is not None and
+                    router.allow_migrate(schema_editor.connection.alias, app_label, **self.hints)):
+                check_cascade(schema_editor.connection, self.reverse_sql, [from_state, to_state])
+            super(BaseAlterSQL, self).database_backwards(app_label, schema_editor, from_state,
+                                                         to_state)
+        recorder, key = get_checkpoint_recorder(schema_editor, self)
+        if recorder is not None:
+            recorder.record_unapplied(key)
+
+    def _run_sql(self, schema_editor, sqls):
+        """
+        Same as `RunSQL._run_sql`, but SQL scripts stored separately (`SQLFile`, `SQLRef`)
+        are streamed: read in chunks and executed statement by statement, as they're parsed.
+        Scripts with params are read entirely, since params belong to the whole script.
+
+        Scripts, that backend would split by `sqlparse`, are split by `splitter` instead,
+        in dialect of database vendor, and the result is cached.
+        """
+        vendor = schema_editor.connection.vendor
+        if hasattr(sqls, 'iter_chunks'):
+            sqls = [sqls]
+        elif not isinstance(sqls, (list, tuple)):
+            if sqls != RunSQL.noop and uses_default_split(schema_editor.connection):
+                for statement in split_cache.split(sqls, vendor):
+                    schema_editor.execute(statement, params=None)
+            else:
+                super(BaseAlterSQL, self)._run_sql(schema_editor, sqls)
+            return
+        for sql in sqls:
+            if hasattr(sql, 'iter_chunks'):
+                for statement in iter_statements(sql.iter_chunks(), vendor):
+                    schema_editor.execute(statement, params=None)
+            else:
+                super(BaseAlterSQL, self)._run_sql(schema_editor, resolve_sql([sql]))
+
 
 class ReverseAlterSQL(BaseAlterSQL):
     def describe(self):
@@ -110,7 +230,7 @@ class AlterSQL(BaseAlterSQL):
     Updates SQL item with a new version.
     """
     def __init__(self, name, sql, reverse_sql=None, state_operations=None, hints=None,
-                 state_reverse_sql=None):
+                 state_reverse_sql=None, state_sql=None):
         """
         Args:
             name (str): Name of SQL item in current application to alter state for.
@@ -119,34 +239,38 @@ class AlterSQL(BaseAlterSQL):
             state_reverse_sql (str/list): Backward SQL used to alter state of backward SQL
                 *instead* of `reverse_sql`. Used for operations generated for items with
                 `replace` = `True`.
+            state_sql (str/list): Forward SQL used to alter state *instead* of `sql`. Used
+                for operations swapping in new version of item created by `StageSQL`.
         """
         super(AlterSQL, self).__init__(name, sql, reverse_sql=reverse_sql,
                                        state_operations=state_operations, hints=hints)
         self.state_reverse_sql = state_reverse_sql
+        self.state_sql = state_sql
 
     def deconstruct(self):
         name, args, kwargs = super(AlterSQL, self).deconstruct()
         kwargs['name'] = self.name
         if self.state_reverse_sql:
             kwargs['state_reverse_sql'] = self.state_reverse_sql
+        if self.state_sql:
+            kwargs['state_sql'] = self.state_sql
         return (name, args, kwargs)
 
     def describe(self):
         return 'Alter SQL "{name}"'.format(name=self.name)
 
-    def state_forwards(self, app_label, state):
-        super(AlterSQL, self).state_forwards(app_label, state)
-        sql_state = self.get_sql_state(state)
-        key = (app_label, self.name)
+    def sql_state_forwards(self, app_label, sql_state):
+        sql_state.update_node((app_label, self.name), sql=self.state_sql or self.sql,
+                              reverse_sql=self.state_reverse_sql or self.reverse_sql)
 
-        if key not in sql_state.nodes:
-            # XXX: dummy for `migrate` command, that does not preserve state object.
-            # Fail with error when fixed
-            return
 
-        sql_item = sql_state.nodes[key]
-        sql_item.sql = self.sql
-        sql_item.reverse_sql = self.state_reverse_sql or self.reverse_sql
+class StageSQL(BaseAlterSQL):
+    """
+    Creates new version of SQL item alongside the old one, which is swapped in by `AlterSQL`
+    later. Doesn't alter state.
+    """
+    def describe(self):
+        return 'Stage SQL "{name}"'.format(name=self.name)
 
 
 class CreateSQL(BaseAlterSQL):
@@ -169,10 +293,7 @@ class CreateSQL(BaseAlterSQL):
                                         state_operations=state_operations, hints=hints)
         self.dependencies = dependencies or ()
 
-    def state_forwards(self, app_label, state):
-        super(CreateSQL, self).state_forwards(app_label, state)
-        sql_state = self.get_sql_state(state)
-
+    def sql_state_forwards(self, app_label, sql_state):
         sql_state.add_node(
             (app_label, self.name),
             SQLItem(self.name, self.sql, self.reverse_sql, list(self.dependencies)),
@@ -189,9 +310,6 @@ class DeleteSQL(BaseAlterSQL):
     def describe(self):
         return 'Delete SQL "{name}"'.format(name=self.name)
 
-    def state_forwards(self, app_label, state):
-        super(DeleteSQL, self).state_forwards(app_label, state)
-        sql_state = self.get_sql_state(state)
-
+    def sql_state_forwards(self, app_label, sql_state):
         sql_state.remove_node((app_label, self.name))
         sql_state.remove_lazy_for_child((app_label, self.name))
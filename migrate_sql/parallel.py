@@ -0,0 +1,236 @@
+# -*- coding: utf-8 -*-
+"""
+Concurrent application of migrations to many databases.
+"""
+
+from __future__ import unicode_literals
+
+import threading
+from collections import deque
+from functools import partial
+from timeit import default_timer
+
+from django.db import connections, router
+from django.utils.six.moves import queue
+
+
+def run_parallel(func, tasks, workers, teardown=None):
+    """
+    Run `func(task)` for every task in a bounded pool of threads.
+
+    Every thread runs tasks one by one, so thread-local resources, like database connections,
+    are reused by tasks executed in the same thread.
+
+    Args:
+        func (callable): Function to run, accepts single task argument.
+        tasks (list): Tasks to run.
+        workers (int): Maximum number of threads.
+        teardown (callable, optional): Called without arguments by every thread once there are
+            no more tasks, e.g. to close thread-local connections.
+    Returns:
+        (list) Pairs `(result, exception)` in order of `tasks`, where one of elements is `None`.
+    """
+    todo = queue.Queue()
+    for index, task in enumerate(tasks):
+        todo.put((index, task))
+    results = [None] * len(tasks)
+
+    def worker():
+        while True:
+            try:
+                index, task = todo.get_nowait()
+            except queue.Empty:
+                if teardown is not None:
+                    teardown()
+                return
+            try:
+                results[index] = (func(task), None)
+            except Exception as ex:
+                results[index] = (None, ex)
+
+    threads = [threading.Thread(target=worker) for _ in range(max(1, min(workers, len(tasks))))]
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+class DependencyFailed(Exception):
+    """
+    Task is not run, since a task it depends on failed.
+    """
+
+
+def run_ordered(func, tasks, dependencies, workers, teardown=None):
+    """
+    Run `func(task)` for every task in a bounded pool of threads, like `run_parallel`, but
+    every task is started once tasks it depends on are done. Tasks depending on failed ones,
+    directly or not, are not run and fail with `DependencyFailed`.
+
+    Args:
+        func (callable): Function to run, accepts single task argument.
+        tasks (list): Tasks to run, hashable.
+        dependencies (dict): Tasks every task depends on, by tasks. Tasks not in `tasks` are
+            ignored.
+        workers (int): Maximum number of threads.
+        teardown (callable, optional): Called without arguments by every thread once there are
+            no more tasks.
+    Returns:
+        (list) Pairs `(result, exception)` in order of `tasks`, where one of elements is `None`.
+    """
+    indexes = dict((task, index) for index, task in enumerate(tasks))
+    waiting = dict((task, set(dep for dep in dependencies.get(task, ()) if dep in indexes))
+                   for task in tasks)
+    dependents = dict((task, []) for task in tasks)
+    for task in tasks:
+        for dep in waiting[task]:
+            dependents[dep].append(task)
+    ready = deque(task for task in tasks if not waiting[task])
+    results = [None] * len(tasks)
+    # number of tasks being run.
+    running = [0]
+    condition = threading.Condition()
+
+    def finish(task, result):
+        results[indexes[task]] = result
+        for dependent in dependents[task]:
+            if results[indexes[dependent]] is not None:
+                continue
+            if result[1] is not None:
+                finish(dependent, (None, DependencyFailed(
+                    'Not run, since {} failed.'.format(task))))
+            else:
+                waiting[dependent].discard(task)
+                if not waiting[dependent]:
+                    ready.append(dependent)
+
+    def worker():
+        while True:
+            with condition:
+                while not ready and running[0]:
+                    condition.wait()
+                if not ready:
+                    break
+                task = ready.popleft()
+                running[0] += 1
+            try:
+                result = (func(task), None)
+            except Exception as ex:
+                result = (None, ex)
+            with condition:
+                running[0] -= 1
+                finish(task, result)
+                condition.notify_all()
+        if teardown is not None:
+            teardown()
+
+    threads = [threading.Thread(target=worker) for _ in range(max(1, min(workers, len(tasks))))]
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
+    for thread in threads:
+        thread.join()
+    # tasks left are the ones having cyclic dependencies.
+    return [result or (None, DependencyFailed('Not run, since dependencies are cyclic.'))
+            for result in results]
+
+
+class MigrateResult(object):
+    """
+    Result of migrating a single database.
+    """
+    def __init__(self, alias):
+        self.alias = alias
+        # names of (un)applied migrations, (app_label, name, backwards).
+        self.migrations = []
+        # SQL item operations executed and skipped by database routers.
+        self.sql_operations = 0
+        self.skipped_operations = 0
+        self.seconds = 0.0
+        self.error = None
+
+    @property
+    def ok(self):
+        return self.error is None
+
+
+def get_targets(loader, app_label=None, migration_name=None):
+    """
+    Migration targets, the same way as `migrate` command finds them.
+    """
+    if app_label is None:
+        return loader.graph.leaf_nodes()
+    if migration_name is None:
+        return [key for key in loader.graph.leaf_nodes() if key[0] == app_label]
+    if migration_name == 'zero':
+        return [(app_label, None)]
+    migration = loader.get_migration_by_prefix(app_label, migration_name)
+    return [(migration.app_label, migration.name)]
+
+
+def migrate_database(alias, app_label=None, migration_name=None, fake=False):
+    """
+    Migrate database `alias` to targets, in the current thread. Unlike `migrate` command,
+    does not send `pre_migrate`/`post_migrate` signals.
+
+    Returns:
+        (MigrateResult) Migrations (un)applied, count of SQL item operations run and error
+            occurred, if any.
+    """
+    from django.db.migrations.executor import MigrationExecutor
+    from migrate_sql.operations import BaseAlterSQL
+    from migrate_sql.recorder import track_checkpoints
+
+    result = MigrateResult(alias)
+    start = default_timer()
+    connection = connections[alias]
+    try:
+        executor = MigrationExecutor(connection, partial(track_checkpoints, connection))
+        targets = get_targets(executor.loader, app_label, migration_name)
+        plan = executor.migration_plan(targets)
+        for migration, backwards in plan:
+            result.migrations.append((migration.app_label, migration.name, backwards))
+            for operation in migration.operations:
+                if not isinstance(operation, BaseAlterSQL):
+                    continue
+                if router.allow_migrate(alias, migration.app_label, **operation.hints):
+                    result.sql_operations += 1
+                else:
+                    result.skipped_operations += 1
+        if plan:
+            executor.migrate(targets, plan, fake=fake)
+    except Exception as ex:
+        result.error = ex
+    finally:
+        # connections are thread-local and have to be closed by the thread that opened them.
+        connection.close()
+        result.seconds = default_timer() - start
+    return result
+
+
+def migrate_databases(aliases, app_label=None, migration_name=None, fake=False, workers=4):
+    """
+    Migrate many databases concurrently.
+
+    Args:
+        aliases (list): Database aliases.
+        app_label (str, optional): Migrate only this application.
+        migration_name (str, optional): Migrate `app_label` to this migration, `zero` unapplies
+            all migrations of app.
+        fake (bool): Mark migrations as run without actually running them.
+        workers (int): Maximum number of databases migrated at the same time.
+    Returns:
+        (list) `MigrateResult` of every alias in order of `aliases`.
+    """
+    def migrate(alias):
+        return migrate_database(alias, app_label, migration_name, fake=fake)
+
+    results = []
+    for alias, (result, error) in zip(aliases, run_parallel(migrate, aliases, workers)):
+        if error is not None:
+            result = MigrateResult(alias)
+            result.error = error
+        results.append(result)
+    return results
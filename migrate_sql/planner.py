@@ -0,0 +1,333 @@
+# -*- coding: utf-8 -*-
+"""
+Planner of batched drops of SQL items.
+
+Items deleted or rolled back by a migration are dropped one statement each. Planner groups
+items of the same dependency layer (items of a layer don't depend on each other) and object
+kind into single multi-object statements, e.g. `DROP FUNCTION a(), b(), c()` (PostgreSQL
+syntax). Optionally, statements dropping with `CASCADE` are verified against the database not
+to drop objects that are not managed by SQL items.
+"""
+
+from __future__ import unicode_literals
+
+import re
+
+from migrate_sql.config import resolve_sql
+from migrate_sql.splitter import split_sql
+
+_DROP = re.compile(
+    r'^DROP\s+(?P<kind>FUNCTION|PROCEDURE|AGGREGATE|TYPE|DOMAIN|TABLE|(?:MATERIALIZED\s+)?VIEW|'
+    r'SEQUENCE|INDEX)\s+(?P<if_exists>IF\s+EXISTS\s+)?(?P<names>.+?)'
+    r'(?:\s+(?P<behavior>CASCADE|RESTRICT))?\s*;?$',
+    re.IGNORECASE | re.DOTALL,
+)
+
+# kind of object: (catalog, function resolving name into oid).
+_CATALOGS = {
+    'FUNCTION': ('pg_proc', 'to_regprocedure'),
+    'PROCEDURE': ('pg_proc', 'to_regprocedure'),
+    'AGGREGATE': ('pg_proc', 'to_regprocedure'),
+    'TYPE': ('pg_type', 'to_regtype'),
+    'DOMAIN': ('pg_type', 'to_regtype'),
+    'TABLE': ('pg_class', 'to_regclass'),
+    'VIEW': ('pg_class', 'to_regclass'),
+    'MATERIALIZED VIEW': ('pg_class', 'to_regclass'),
+    'SEQUENCE': ('pg_class', 'to_regclass'),
+    'INDEX': ('pg_class', 'to_regclass'),
+}
+
+# Objects directly depending on given ones, or on their internal parts (array and row types,
+# rewrite rules of views). Parts of objects (rewrite rules, array and row types, defaults,
+# triggers, constraints) are reported as the objects they belong to.
+_DEPENDENTS_SQL = """
+WITH RECURSIVE parts(classid, objid) AS (
+    SELECT classid, objid FROM unnest(%s::oid[], %s::oid[]) AS t(classid, objid)
+  UNION
+    SELECT d.classid, d.objid
+    FROM pg_depend d JOIN parts p ON d.refclassid = p.classid AND d.refobjid = p.objid
+    WHERE d.deptype = 'i'
+), dependents(classid, objid, objsubid) AS (
+    SELECT d.classid, d.objid, d.objsubid
+    FROM pg_depend d JOIN parts p ON d.refclassid = p.classid AND d.refobjid = p.objid
+    WHERE d.deptype IN ('n', 'a')
+), objects(classid, objid, objsubid) AS (
+    SELECT CASE
+               WHEN r.oid IS NOT NULL OR tc.oid IS NOT NULL OR ad.oid IS NOT NULL
+                    OR tg.oid IS NOT NULL OR co.conrelid <> 0
+                   THEN 'pg_class'::regclass::oid
+               WHEN c.oid IS NOT NULL OR ty.typcategory = 'A' OR co.contypid <> 0
+                   THEN 'pg_type'::regclass::oid
+               ELSE t.classid
+           END,
+           CASE
+               WHEN r.oid IS NOT NULL THEN r.ev_class
+               WHEN tc.oid IS NOT NULL THEN tc.oid
+               WHEN ad.oid IS NOT NULL THEN ad.adrelid
+               WHEN tg.oid IS NOT NULL THEN tg.tgrelid
+               WHEN co.conrelid <> 0 THEN co.conrelid
+               WHEN c.oid IS NOT NULL THEN c.reltype
+               WHEN ty.typcategory = 'A' THEN ty.typelem
+               WHEN co.contypid <> 0 THEN co.contypid
+               ELSE t.objid
+           END,
+           CASE WHEN t.classid = 'pg_class'::regclass AND c.oid IS NULL THEN t.objsubid ELSE 0 END
+    FROM dependents t
+    LEFT JOIN pg_rewrite r ON t.classid = 'pg_rewrite'::regclass AND r.oid = t.objid
+    LEFT JOIN pg_class c
+        ON t.classid = 'pg_class'::regclass AND c.oid = t.objid AND c.relkind = 'c'
+    LEFT JOIN pg_type ty ON t.classid = 'pg_type'::regclass AND ty.oid = t.objid
+    LEFT JOIN pg_class tc ON tc.oid = ty.typrelid AND tc.relkind <> 'c'
+    LEFT JOIN pg_attrdef ad ON t.classid = 'pg_attrdef'::regclass AND ad.oid = t.objid
+    LEFT JOIN pg_trigger tg ON t.classid = 'pg_trigger'::regclass AND tg.oid = t.objid
+    LEFT JOIN pg_constraint co ON t.classid = 'pg_constraint'::regclass AND co.oid = t.objid
+)
+SELECT DISTINCT classid, objid, pg_describe_object(classid, objid, objsubid) FROM objects
+"""
+
+
+class UnsafeCascadeError(Exception):
+    pass
+
+
+class DropStatement(object):
+    """
+    Parsed single `DROP` statement, possibly dropping many objects of the same kind.
+    """
+    def __init__(self, kind, names, if_exists=False, behavior=None):
+        self.kind = kind
+        self.names = names
+        self.if_exists = if_exists
+        self.behavior = behavior
+
+    @property
+    def batch_key(self):
+        """
+        Statements having the same batch key can be combined into one.
+        """
+        return (self.kind, self.if_exists, self.behavior)
+
+    def __str__(self):
+        return 'DROP {kind} {if_exists}{names}{behavior}'.format(
+            kind=self.kind,
+            if_exists='IF EXISTS ' if self.if_exists else '',
+            names=', '.join(self.names),
+            behavior=' ' + self.behavior if self.behavior else '',
+        )
+
+
+def _split_names(names):
+    """
+    Split comma separated object names, ignoring commas inside of argument lists and quotes.
+    """
+    result = []
+    depth = 0
+    quote = None
+    start = 0
+    for pos, char in enumerate(names):
+        if quote:
+            if char == quote:
+                quote = None
+        elif char in '"\'':
+            quote = char
+        elif char == '(':
+            depth += 1
+        elif char == ')':
+            depth -= 1
+        elif char == ',' and not depth:
+            result.append(names[start:pos].strip())
+            start = pos + 1
+    result.append(names[start:].strip())
+    return result
+
+
+def parse_drop(sql):
+    """
+    Parse SQL as a single `DROP` statement of an object kind supported by planner.
+
+    Args:
+        sql: SQL, has the same format as supported by Django's RunSQL operation.
+    Returns:
+        (DropStatement) Parsed statement or `None`, if SQL is anything else, e.g. has params,
+            many statements or comments.
+    """
+    sql = resolve_sql(sql)
+    if isinstance(sql, (list, tuple)):
+        if len(sql) != 1 or isinstance(sql[0], (list, tuple)):
+            return None
+        sql = sql[0]
+    if not sql:
+        return None
+    statements = split_sql(sql)
+    if len(statements) != 1 or '--' in statements[0] or '/*' in statements[0]:
+        return None
+    match = _DROP.match(statements[0])
+    if not match:
+        return None
+    names = _split_names(match.group('names'))
+    if not all(names):
+        return None
+    behavior = match.group('behavior')
+    return DropStatement(' '.join(match.group('kind').upper().split()), names,
+                         if_exists=bool(match.group('if_exists')),
+                         behavior=behavior.upper() if behavior else None)
+
+
+def drop_layers(keys, graph):
+    """
+    Dependency layers of items dropped together. Items having no dependents among dropped
+    ones are layer 0, others are one layer above their highest dependent.
+
+    Args:
+        keys (list): Keys of dropped items.
+        graph (graph.SQLStateGraph): Built graph of SQL items, `keys` are dropped from.
+    Returns:
+        (dict) Layer of every key.
+    """
+    keys = set(keys)
+    layers = {}
+    for key in keys:
+        stack = [key]
+        while stack:
+            current = stack[-1]
+            if current in layers:
+                stack.pop()
+                continue
+            children = [n.key for n in graph.node_map[current].children if n.key in keys]
+            pending = [child for child in children if child not in layers]
+            if pending:
+                stack.extend(pending)
+                continue
+            layers[current] = max([layers[child] + 1 for child in children] or [0])
+            stack.pop()
+    return layers
+
+
+class DropBatch(object):
+    """
+    Items dropped by a single statement.
+    """
+    def __init__(self, keys, statement=None):
+        # keys of items, in order of operations.
+        self.keys = keys
+        # combined statement, `None` if batch is a single item dropped by its own SQL.
+        self.statement = statement
+
+
+def plan_drops(keys, graph, get_sql):
+    """
+    Group drops of items into batches. Items of the same application, dependency layer and
+    object kind are batched, others are dropped one by one.
+
+    Args:
+        keys (list): Keys of dropped items, in order of operations.
+        graph (graph.SQLStateGraph): Built graph of SQL items, `keys` are dropped from.
+        get_sql (callable): Returns SQL dropping item by its key.
+    Returns:
+        (list) `DropBatch` objects, ordered by layers.
+    """
+    layers = drop_layers(keys, graph)
+    batches = {}
+    ordered = []
+    for index, key in enumerate(keys):
+        drop = parse_drop(get_sql(key))
+        if drop is None:
+            group = (key[0], layers[key], index)
+        else:
+            group = (key[0], layers[key]) + drop.batch_key
+        if group not in batches:
+            batches[group] = ([], [])
+            ordered.append((layers[key], index, group))
+        batches[group][0].append(key)
+        batches[group][1].append(drop)
+
+    result = []
+    for _, _, group in sorted(ordered):
+        group_keys, drops = batches[group]
+        statement = None
+        if len(group_keys) > 1:
+            names = [name for drop in drops for name in drop.names]
+            statement = str(DropStatement(drops[0].kind, names, if_exists=drops[0].if_exists,
+                                          behavior=drops[0].behavior))
+        result.append(DropBatch(group_keys, statement))
+    return result
+
+
+def _resolve_objects(cursor, drops):
+    """
+    Find objects dropped by statements in database catalogs.
+
+    Returns:
+        (set) Pairs `(catalog oid, object oid)` of objects existing.
+    """
+    columns = []
+    params = []
+    for drop in drops:
+        catalog, func = _CATALOGS[drop.kind]
+        for name in drop.names:
+            # functions may be dropped by name only, if it's not overloaded.
+            name_func = 'to_regproc' if func == 'to_regprocedure' and '(' not in name else func
+            columns.append("'{}'::regclass::oid, {}(%s)::oid".format(catalog, name_func))
+            params.append(name)
+    if not columns:
+        return set()
+    cursor.execute('SELECT {}'.format(', '.join(columns)), params)
+    row = cursor.fetchone()
+    return {(row[i], row[i + 1]) for i in range(0, len(row), 2) if row[i + 1] is not None}
+
+
+def verify_cascade(connection, sql, sql_states):
+    """
+    Make sure `DROP ... CASCADE` statement does not drop objects that are not managed by SQL
+    items. Objects of items are found by parsing their `reverse_sql`. PostgreSQL only.
+
+    Args:
+        connection: Database connection statement is run by.
+        sql: SQL to verify, anything but a `DROP ... CASCADE` statement is ignored.
+        sql_states (list): `SQLStateGraph` objects holding managed items.
+    Raises:
+        UnsafeCascadeError: If statement drops unmanaged objects.
+    """
+    drop = parse_drop(sql)
+    if drop is None or drop.behavior != 'CASCADE':
+        return
+    managed = [parse_drop(sql_item.reverse_sql)
+               for sql_state in sql_states for sql_item in sql_state.nodes.values()]
+    with connection.cursor() as cursor:
+        targets = _resolve_objects(cursor, [drop])
+        managed = _resolve_objects(cursor, [item for item in managed if item is not None])
+        # dependents are searched level by level, unmanaged ones are reported, but not searched
+        # further.
+        seen = set(targets)
+        level = targets
+        unmanaged = set()
+        while level:
+            cursor.execute(_DEPENDENTS_SQL, [[obj[0] for obj in level], [obj[1] for obj in level]])
+            level = set()
+            for classid, objid, description in cursor.fetchall():
+                if (classid, objid) in seen:
+                    continue
+                if (classid, objid) in managed:
+                    seen.add((classid, objid))
+                    level.add((classid, objid))
+                else:
+                    unmanaged.add(description)
+    if unmanaged:
+        raise UnsafeCascadeError('"{}" would drop objects not managed by SQL items: {}.'.format(
+            drop, ', '.join(sorted(unmanaged))))
+
+
+def check_cascade(connection, sql, states):
+    """
+    Verify `sql` by `verify_cascade`, if enabled by `SQL_VERIFY_CASCADE` setting and
+    database is PostgreSQL.
+
+    Args:
+        states (list): Django project states holding SQL states.
+    """
+    from django.conf import settings
+
+    if not getattr(settings, 'SQL_VERIFY_CASCADE', False) or connection.vendor != 'postgresql':
+        return
+    sql_states = [state.sql_state for state in states if hasattr(state, 'sql_state')]
+    verify_cascade(connection, sql, sql_states)
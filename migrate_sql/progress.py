@@ -0,0 +1,172 @@
+# -*- coding: utf-8 -*-
+"""
+Progress of SQL item operations run by `migrate --sql-progress`.
+
+Every SQL item operation of a migration being applied or unapplied is reported with its
+position, item, duration and time elapsed since the migration started. Durations are recorded
+by `recorder.TimingRecorder`, so that remaining time is estimated from previous runs.
+"""
+
+from __future__ import unicode_literals
+
+from contextlib import contextmanager
+from timeit import default_timer
+
+# progress reported by the running command, see `activate`.
+_progress = None
+
+
+def format_seconds(seconds):
+    if seconds < 60:
+        return '{:.1f}s'.format(seconds)
+    minutes, seconds = divmod(int(round(seconds)), 60)
+    hours, minutes = divmod(minutes, 60)
+    if hours:
+        return '{}h{:02d}m{:02d}s'.format(hours, minutes, seconds)
+    return '{}m{:02d}s'.format(minutes, seconds)
+
+
+class MigrationProgress(object):
+    """
+    Reports SQL item operations of migrations run on a database.
+    """
+    def __init__(self, connection, stdout, index_progress=False):
+        """
+        Args:
+            connection: Connection migrations are run by.
+            stdout (OutputWrapper): Output of command.
+            index_progress (bool): Report progress of index builds of operations, polled by
+                `monitor.IndexBuildMonitor` (PostgreSQL only).
+        """
+        self.connection = connection
+        self.stdout = stdout
+        self.index_progress = index_progress
+        self.recorder = None
+        # durations recorded by previous runs, by `(app_label, name, backwards)`.
+        self.durations = {}
+        # keys of operations of migration being run, in order they are run.
+        self.keys = []
+        self.done = 0
+        self.started = None
+
+    def start_migration(self, migration, backwards=False):
+        """
+        Start reporting operations of `migration`.
+        """
+        from migrate_sql.operations import BaseAlterSQL
+        from migrate_sql.recorder import TimingRecorder
+
+        if self.recorder is None:
+            self.recorder = TimingRecorder(self.connection)
+            self.recorder.ensure_schema()
+            self.durations = self.recorder.durations()
+        operations = [op for op in migration.operations if isinstance(op, BaseAlterSQL)]
+        if backwards:
+            operations.reverse()
+        self.keys = [(migration.app_label, op.name, backwards) for op in operations]
+        self.done = 0
+        self.started = default_timer()
+        if self.keys:
+            # ends the line Django starts for migration.
+            self.stdout.write('')
+
+    def estimate(self, keys, backwards=False):
+        """
+        Estimated seconds to run operations of `keys`. Items never run before are estimated by
+        average duration of others run in the same direction.
+
+        Returns:
+            (float) Seconds, or `None` if no durations were recorded yet.
+        """
+        known = [seconds for key, seconds in self.durations.items() if key[2] == backwards]
+        if not known:
+            return None
+        average = sum(known) / len(known)
+        return sum(self.durations.get(key, average) for key in keys)
+
+    @contextmanager
+    def track(self, app_label, operation, connection, backwards=False):
+        """
+        Report operation run within the context and record its duration.
+        """
+        key = (app_label, operation.name, backwards)
+        # operations skipped (e.g. by router) are not run within the context.
+        index = None
+        if connection.alias == self.connection.alias and key in self.keys[self.done:]:
+            index = self.keys.index(key, self.done)
+        if index is None:
+            # not an operation of migration reported (e.g. run by another one).
+            yield
+            return
+
+        expected = self.durations.get(key)
+        header = '    SQL item {}/{} {}.{}{}...'.format(
+            index + 1, len(self.keys), app_label, operation.name,
+            ' (expected {})'.format(format_seconds(expected)) if expected is not None else '')
+        self.stdout.write(header, ending='')
+        self.stdout.flush()
+        monitor = self._get_monitor(operation, connection, backwards)
+        start = default_timer()
+        try:
+            with monitor:
+                yield
+        except Exception:
+            self.stdout.write(' FAILED after {}'.format(format_seconds(default_timer() - start)))
+            raise
+        seconds = default_timer() - start
+        if getattr(monitor, 'reported', False):
+            # progress of index build is reported below the header.
+            self.stdout.write('\n' + header, ending='')
+        self.recorder.record(app_label, operation.name, seconds, backwards=backwards)
+        self.done = index + 1
+
+        remaining = self.estimate(self.keys[self.done:], backwards=backwards)
+        self.stdout.write(' {}, elapsed {}, remaining {}'.format(
+            format_seconds(seconds), format_seconds(default_timer() - self.started),
+            'unknown' if remaining is None else '~' + format_seconds(remaining)))
+
+    def _report_index(self, progress):
+        self.stdout.write('\n      {}'.format(progress), ending='')
+        self.stdout.flush()
+
+    def _get_monitor(self, operation, connection, backwards=False):
+        """
+        Monitor of index builds of operation, if requested and operation builds an index.
+        """
+        from migrate_sql.monitor import IndexBuildMonitor, builds_index
+
+        sql = operation.reverse_sql if backwards else operation.sql
+        if (not self.index_progress or connection.vendor != 'postgresql' or
+                not builds_index(sql)):
+            return _NoProgress()
+        return IndexBuildMonitor(connection, self._report_index)
+
+
+class _NoProgress(object):
+    def __enter__(self):
+        pass
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        pass
+
+
+@contextmanager
+def activate(progress):
+    """
+    Report progress of SQL item operations run within the context by `progress`.
+    """
+    global _progress
+    previous, _progress = _progress, progress
+    try:
+        yield progress
+    finally:
+        _progress = previous
+
+
+def track_progress(app_label, operation, connection, backwards=False):
+    """
+    Context manager reporting operation run within it, if progress is being reported.
+    """
+    if _progress is None:
+        return _NoProgress()
+    return _progress.track(app_label, operation, connection, backwards=backwards)
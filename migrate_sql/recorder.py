@@ -0,0 +1,199 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.apps.registry import Apps
+from django.db import models
+from django.utils.timezone import now
+
+
+class RecorderModel(models.Model):
+    """
+    Base of models of tables recorders store data in.
+    """
+    applied = models.DateTimeField(default=now)
+
+    class Meta:
+        abstract = True
+        apps = Apps()
+        app_label = 'migrate_sql'
+
+
+class BaseRecorder(object):
+    """
+    Stores data in a table of `model`. Same as Django's `MigrationRecorder`, the table is not
+    managed by migrations: it's created on demand and queried through a model of separate app
+    registry.
+    """
+    model = None
+
+    def __init__(self, connection):
+        self.connection = connection
+
+    @property
+    def queryset(self):
+        return self.model.objects.using(self.connection.alias)
+
+    def has_table(self):
+        with self.connection.cursor() as cursor:
+            return self.model._meta.db_table in self.connection.introspection.table_names(cursor)
+
+    def ensure_schema(self):
+        """
+        Ensures the table exists.
+        """
+        if self.has_table():
+            return
+        with self.connection.schema_editor() as editor:
+            editor.create_model(self.model)
+
+
+class SchemaRecorder(BaseRecorder):
+    """
+    Stores checkpoints of SQL item migrations applied to database schemas (e.g. tenants).
+    """
+    class SchemaMigration(RecorderModel):
+        schema = models.CharField(max_length=255)
+        app = models.CharField(max_length=255)
+        name = models.CharField(max_length=255)
+
+        class Meta(RecorderModel.Meta):
+            db_table = 'migrate_sql_schema_migrations'
+
+    model = SchemaMigration
+
+    def applied_migrations(self, schema):
+        """
+        Returns a set of (app, name) of migrations applied to `schema`.
+        """
+        return set(self.queryset.filter(schema=schema).values_list('app', 'name'))
+
+    def record_applied(self, schema, app, name):
+        self.queryset.create(schema=schema, app=app, name=name)
+
+    def record_unapplied(self, schema, app, name):
+        self.queryset.filter(schema=schema, app=app, name=name).delete()
+
+
+class CheckpointRecorder(BaseRecorder):
+    """
+    Stores checkpoints of SQL item operations run by migrations, that are not atomic. Every
+    operation completed has a checkpoint identified by migration, position of operation in it
+    and operation fingerprint. Checkpoints of migration are deleted once it's recorded as
+    applied, see `track_checkpoints`.
+    """
+    class Checkpoint(RecorderModel):
+        app = models.CharField(max_length=255)
+        migration = models.CharField(max_length=255)
+        operation = models.PositiveIntegerField()
+        fingerprint = models.CharField(max_length=40)
+
+        class Meta(RecorderModel.Meta):
+            db_table = 'migrate_sql_checkpoints'
+
+    model = Checkpoint
+
+    def _filter(self, key):
+        app, migration, operation = key
+        return self.queryset.filter(app=app, migration=migration, operation=operation)
+
+    def is_applied(self, key, fingerprint):
+        """
+        Args:
+            key (tuple): Operation, `(app_label, migration name, index of operation)`.
+        """
+        return self._filter(key).filter(fingerprint=fingerprint).exists()
+
+    def record_applied(self, key, fingerprint):
+        self.record_unapplied(key)
+        app, migration, operation = key
+        self.queryset.create(app=app, migration=migration, operation=operation,
+                             fingerprint=fingerprint)
+
+    def record_unapplied(self, key):
+        self._filter(key).delete()
+
+    def clear(self, app, migration):
+        """
+        Delete checkpoints of migration, if any.
+        """
+        if self.has_table():
+            self.queryset.filter(app=app, migration=migration).delete()
+
+
+class TimingRecorder(BaseRecorder):
+    """
+    Stores the last duration of operations run on every SQL item, used to estimate remaining
+    time of migrations.
+    """
+    class Timing(RecorderModel):
+        app = models.CharField(max_length=255)
+        name = models.CharField(max_length=255)
+        backwards = models.BooleanField(default=False)
+        seconds = models.FloatField()
+
+        class Meta(RecorderModel.Meta):
+            db_table = 'migrate_sql_timings'
+
+    model = Timing
+
+    def durations(self):
+        """
+        Returns a dict of seconds by `(app, name, backwards)`.
+        """
+        return {(app, name, backwards): seconds for app, name, backwards, seconds in
+                self.queryset.values_list('app', 'name', 'backwards', 'seconds')}
+
+    def record(self, app, name, seconds, backwards=False):
+        self.queryset.filter(app=app, name=name, backwards=backwards).delete()
+        self.queryset.create(app=app, name=name, backwards=backwards, seconds=seconds)
+
+
+def track_checkpoints(connection, action, migration=None, fake=False):
+    """
+    Progress callback of `MigrationExecutor`, that tracks migration run by `connection`, so
+    that checkpoints of its operations are keyed by it. Once migration is recorded as applied
+    or unapplied, its checkpoints are deleted, if its operations were checkpointed. Checkpoints
+    left by failed migration, that is faked then, are deleted by operations unapplied later.
+    """
+    if action in ('apply_start', 'unapply_start'):
+        connection._sql_migration = migration
+        connection._sql_checkpointed = False
+    elif action in ('apply_success', 'unapply_success'):
+        connection._sql_migration = None
+        if getattr(connection, '_sql_checkpointed', False):
+            connection._sql_checkpointed = False
+            CheckpointRecorder(connection).clear(migration.app_label, migration.name)
+
+
+def get_checkpoint_recorder(schema_editor, operation):
+    """
+    Checkpoint recorder for `operation` run by `schema_editor`, if migration is not atomic
+    (e.g. database can't rollback DDL) and checkpoints are not disabled by `SQL_CHECKPOINTS`
+    setting. Atomic migrations are rolled back entirely on failure, checkpoints would be rolled
+    back too. Operations run outside of migration tracked by `track_checkpoints` are not
+    checkpointed.
+
+    Returns:
+        (tuple) Recorder and key of operation, `(app_label, migration name, index of
+            operation)`, or `(None, None)` if checkpoints are not used.
+    """
+    from django.conf import settings
+
+    connection = schema_editor.connection
+    atomic = getattr(schema_editor, 'atomic_migration', connection.features.can_rollback_ddl)
+    migration = getattr(connection, '_sql_migration', None)
+    if (atomic or migration is None or getattr(schema_editor, 'collect_sql', False) or
+            not getattr(settings, 'SQL_CHECKPOINTS', True)):
+        return None, None
+    indexes = [index for index, op in enumerate(migration.operations) if op is operation]
+    if not indexes:
+        return None, None
+    # recorder is cached for the migration.
+    recorder = getattr(schema_editor, '_sql_checkpoints', None)
+    if recorder is None:
+        recorder = CheckpointRecorder(connection)
+        recorder.ensure_schema()
+        schema_editor._sql_checkpoints = recorder
+    # checkpoints of migration are deleted once it's run, see `track_checkpoints`.
+    connection._sql_checkpointed = True
+    return recorder, (migration.app_label, migration.name, indexes[0])
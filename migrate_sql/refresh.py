@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+"""
+Refreshing materialized views declared as SQL items (`config.MaterializedView`).
+
+Views are refreshed on a pool of connections, every view once views it reads from, directly or
+through other SQL items, are refreshed, so independent views are refreshed at the same time.
+Views having a unique index are refreshed `CONCURRENTLY`, so they can be read meanwhile.
+"""
+
+from __future__ import unicode_literals
+
+from collections import OrderedDict
+from timeit import default_timer
+
+from django.db import connections
+
+from migrate_sql.config import MaterializedView
+from migrate_sql.parallel import run_ordered
+
+
+class RefreshResult(object):
+    """
+    Result of refreshing a single materialized view.
+    """
+    def __init__(self, key):
+        self.key = key
+        self.concurrently = False
+        self.seconds = 0.0
+        self.error = None
+
+    @property
+    def ok(self):
+        return self.error is None
+
+
+def get_view_dependencies(sql_graph, app_labels=None):
+    """
+    Materialized views of `sql_graph` along with materialized views each of them reads from,
+    directly or through other SQL items.
+
+    Args:
+        sql_graph (graph.SQLStateGraph): State of SQL items, e.g. `build_current_graph()`.
+        app_labels (list, optional): Views of these apps only. Views of other apps are not
+            waited for.
+    Returns:
+        (OrderedDict) Lists of keys of views by keys of views, parents first.
+    """
+    views = [key for key in sql_graph.get_reachability().order
+             if isinstance(sql_graph.nodes[key], MaterializedView) and
+             (not app_labels or key[0] in app_labels)]
+    result = OrderedDict()
+    for key in views:
+        ancestors = set(sql_graph.ancestors_of([key]))
+        result[key] = [view for view in views if view != key and view in ancestors]
+    return result
+
+
+def can_refresh_concurrently(cursor, name):
+    """
+    Whether view can be refreshed `CONCURRENTLY`: it is populated and has a unique index
+    on columns only, with no `WHERE` clause. View is looked up by `name` the same way unquoted
+    name is resolved by SQL.
+    """
+    cursor.execute(
+        'SELECT c.relispopulated AND EXISTS ('
+        '    SELECT 1 FROM pg_index i WHERE i.indrelid = c.oid AND i.indisunique AND'
+        '    i.indpred IS NULL AND i.indexprs IS NULL'
+        ") FROM pg_class c WHERE c.oid = to_regclass(%s) AND c.relkind = 'm'",
+        [name])
+    row = cursor.fetchone()
+    return bool(row and row[0])
+
+
+def refresh_view(key, alias='default', concurrently=True):
+    """
+    Refresh materialized view of item `key` in the current thread.
+
+    Args:
+        concurrently (bool): Refresh `CONCURRENTLY`, if view allows it.
+    Returns:
+        (RefreshResult) Whether view was refreshed concurrently and how long it took.
+    """
+    result = RefreshResult(key)
+    start = default_timer()
+    connection = connections[alias]
+    try:
+        with connection.cursor() as cursor:
+            result.concurrently = concurrently and can_refresh_concurrently(cursor, key[1])
+            # name is not quoted, the same as in SQL of `MaterializedView` creating view.
+            cursor.execute('REFRESH MATERIALIZED VIEW {}{}'.format(
+                'CONCURRENTLY ' if result.concurrently else '', key[1]))
+    finally:
+        result.seconds = default_timer() - start
+    return result
+
+
+def refresh_views(sql_graph, app_labels=None, alias='default', concurrently=True, workers=4):
+    """
+    Refresh materialized views concurrently, in order of their dependencies.
+    A view is not refreshed, if refreshing a view it reads from fails.
+
+    Args:
+        sql_graph (graph.SQLStateGraph): State of SQL items, e.g. `build_current_graph()`.
+        app_labels (list, optional): Refresh views of these apps only.
+        alias (str): Database to refresh views in.
+        concurrently (bool): Refresh `CONCURRENTLY` views, which allow it.
+        workers (int): Maximum number of views refreshed at the same time.
+    Returns:
+        (list) `RefreshResult` of every view, parents first.
+    """
+    dependencies = get_view_dependencies(sql_graph, app_labels)
+    keys = list(dependencies)
+
+    def refresh(key):
+        return refresh_view(key, alias, concurrently=concurrently)
+
+    def close():
+        # connections are thread-local and have to be closed by the thread that opened them.
+        connections[alias].close()
+
+    results = []
+    for key, (result, error) in zip(keys, run_ordered(refresh, keys, dependencies, workers,
+                                                      close)):
+        if error is not None:
+            result = RefreshResult(key)
+            result.error = error
+        results.append(result)
+    return results
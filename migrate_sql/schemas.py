@@ -0,0 +1,180 @@
+# -*- coding: utf-8 -*-
+"""
+Application of SQL item migrations to many PostgreSQL schemas of a single database
+(e.g. one schema per tenant).
+
+Only operations altering SQL items are run in schemas, with `search_path` set to the schema
+followed by the original search path. Every migration is applied to a schema in a transaction,
+along with a checkpoint recorded by `SchemaRecorder`, so that a failed run continues from the
+first migration not applied, instead of starting over.
+"""
+
+from __future__ import unicode_literals
+
+import threading
+from timeit import default_timer
+
+from django.conf import settings
+from django.db import connections
+from django.utils import six
+from django.utils.module_loading import import_string
+
+from migrate_sql.parallel import get_targets, run_parallel
+
+
+class SchemaResult(object):
+    """
+    Result of migrating a single schema.
+    """
+    def __init__(self, schema):
+        self.schema = schema
+        # names of applied migrations, (app_label, name).
+        self.migrations = []
+        self.sql_operations = 0
+        self.seconds = 0.0
+        self.error = None
+
+    @property
+    def ok(self):
+        return self.error is None
+
+
+def get_schemas():
+    """
+    Schemas to apply SQL items to, `SQL_SCHEMAS` setting. It's either a list of schema names,
+    or a callable (or its dotted path) returning one, for schemas known at runtime only.
+    """
+    schemas = getattr(settings, 'SQL_SCHEMAS', ())
+    if isinstance(schemas, six.string_types):
+        schemas = import_string(schemas)
+    if callable(schemas):
+        schemas = schemas()
+    return list(schemas)
+
+
+def get_sql_plan(loader, app_label=None, migration_name=None):
+    """
+    Migrations having SQL item operations, in order they are applied to reach targets.
+
+    Returns:
+        (list) Pairs `(migration, operations)`, operations are ones of migration having
+            SQL item operations, state ones (e.g. `AlterSQLState`) included.
+    """
+    from migrate_sql.graph import _iter_sql_operations
+
+    plan = []
+    seen = set()
+    for target in get_targets(loader, app_label, migration_name):
+        if target[1] is None:
+            continue
+        for key in loader.graph.forwards_plan(target):
+            if key in seen:
+                continue
+            seen.add(key)
+            migration = loader.graph.nodes[key]
+            operations = [op for op in migration.operations
+                          if any(_iter_sql_operations([op]))]
+            if operations:
+                plan.append((migration, operations))
+    return plan
+
+
+def migrate_schema(schema, plan, alias='default', fake=False):
+    """
+    Apply SQL item operations of migrations in `plan`, not applied to `schema` yet.
+    SQL state is replayed along, the same way `migrate` does, so that operations get states
+    before and after them (e.g. for verification of `CASCADE`).
+
+    Returns:
+        (SchemaResult) Migrations applied, count of SQL item operations run and error
+            occurred, if any.
+    """
+    from django.db.migrations.state import ProjectState
+    from migrate_sql.graph import SQLStateGraph, _iter_sql_operations
+    from migrate_sql.operations import BaseAlterSQL, set_sql_state
+    from migrate_sql.recorder import SchemaRecorder
+
+    result = SchemaResult(schema)
+    start = default_timer()
+    connection = connections[alias]
+    recorder = SchemaRecorder(connection)
+    state = ProjectState()
+    set_sql_state(state, SQLStateGraph())
+    try:
+        applied = recorder.applied_migrations(schema)
+        with connection.cursor() as cursor:
+            cursor.execute('SHOW search_path')
+            search_path = cursor.fetchone()[0]
+
+        for migration, operations in plan:
+            if (migration.app_label, migration.name) in applied:
+                for operation in _iter_sql_operations(operations):
+                    operation.sql_state_forwards(migration.app_label, state.sql_state)
+                continue
+            with connection.schema_editor() as schema_editor:
+                if not fake:
+                    schema_editor.execute('SET LOCAL search_path TO {}, {}'.format(
+                        schema_editor.quote_name(schema), search_path))
+                for operation in operations:
+                    from_state, state = state, state.clone()
+                    for nested in _iter_sql_operations([operation]):
+                        nested.sql_state_forwards(migration.app_label, state.sql_state)
+                    if not fake and isinstance(operation, BaseAlterSQL):
+                        operation.database_forwards(
+                            migration.app_label, schema_editor, from_state, state)
+                        result.sql_operations += 1
+                if not fake:
+                    schema_editor.execute('SET LOCAL search_path TO {}'.format(search_path))
+                recorder.record_applied(schema, migration.app_label, migration.name)
+            result.migrations.append((migration.app_label, migration.name))
+    except Exception as ex:
+        result.error = ex
+    finally:
+        result.seconds = default_timer() - start
+    return result
+
+
+def migrate_schemas(schemas, app_label=None, migration_name=None, alias='default', fake=False,
+                    workers=4):
+    """
+    Apply SQL item migrations to many schemas concurrently. Migrations can't be unapplied.
+
+    Args:
+        schemas (list): Names of schemas.
+        app_label (str, optional): Migrate only this application.
+        migration_name (str, optional): Migrate `app_label` up to this migration.
+        alias (str): Database alias.
+        fake (bool): Record migrations as applied without actually running them.
+        workers (int): Maximum number of schemas migrated at the same time,
+            each by its own connection.
+    Returns:
+        (list) `SchemaResult` of every schema in order of `schemas`.
+    """
+    from django.db.migrations.loader import MigrationLoader
+    from migrate_sql.recorder import SchemaRecorder
+
+    if connections[alias].vendor != 'postgresql':
+        raise ValueError('Schemas are supported by PostgreSQL only.')
+    plan = get_sql_plan(MigrationLoader(None), app_label, migration_name)
+    lock = threading.Lock()
+    ensured = []
+
+    def migrate(schema):
+        with lock:
+            # checkpoints table is created by the first worker, so that they don't race for it.
+            if not ensured:
+                SchemaRecorder(connections[alias]).ensure_schema()
+                ensured.append(True)
+        return migrate_schema(schema, plan, alias=alias, fake=fake)
+
+    def close():
+        # connections are thread-local and have to be closed by the thread that opened them.
+        connections[alias].close()
+
+    results = []
+    for schema, (result, error) in zip(schemas, run_parallel(migrate, schemas, workers, close)):
+        if error is not None:
+            result = SchemaResult(schema)
+            result.error = error
+        results.append(result)
+    return results
@@ -0,0 +1,297 @@
+# -*- coding: utf-8 -*-
+"""
+Splitter of SQL scripts into statements.
+
+Understands string literals (including `E''` strings with backslash escapes), quoted
+identifiers, PostgreSQL dollar quoting (`$$ ... $$`, `$body$ ... $body$`), line comments and
+nested block comments, so that semicolons inside of them don't end statements. Works
+incrementally: script is fed in chunks, statements are returned as soon as they're complete.
+
+Dialect follows database vendor: MySQL strings have backslash escapes and `#` starts
+a line comment there.
+"""
+
+from __future__ import unicode_literals
+
+import re
+import threading
+from collections import OrderedDict
+
+from migrate_sql.config import sql_fingerprint
+
+NORMAL, SINGLE_QUOTE, DOUBLE_QUOTE, DOLLAR_QUOTE, LINE_COMMENT, BLOCK_COMMENT = range(6)
+
+# vendors, which treat backslash as escape in all strings and `#` as start of line comment.
+BACKSLASH_ESCAPE_VENDORS = ('mysql',)
+HASH_COMMENT_VENDORS = ('mysql',)
+
+_SPECIAL = re.compile(r'[;\'"$/-]')
+_SPECIAL_OR_HASH = re.compile(r'[;\'"$/#-]')
+_QUOTE_OR_ESCAPE = {
+    SINGLE_QUOTE: re.compile(r"['\\]"),
+    DOUBLE_QUOTE: re.compile(r'["\\]'),
+}
+_BLOCK_COMMENT = re.compile(r'/\*|\*/')
+_DOLLAR_TAG = re.compile(r'\$(?:[^\W\d]\w*)?\$', re.UNICODE)
+_PARTIAL_DOLLAR_TAG = re.compile(r'\$(?:[^\W\d]\w*)?$', re.UNICODE)
+_IDENTIFIER_CHAR = re.compile(r'[\w$]', re.UNICODE)
+
+
+class StatementSplitter(object):
+    """
+    Incremental SQL script splitter.
+
+    Statements are returned as they are written in script, including comments inside and
+    terminating semicolon. Parts of script having comments only are skipped.
+
+        splitter = StatementSplitter()
+        for chunk in chunks:
+            for statement in splitter.feed(chunk):
+                execute(statement)
+        for statement in splitter.close():
+            execute(statement)
+    """
+    def __init__(self, vendor=None):
+        """
+        Args:
+            vendor (str, optional): Vendor of database, e.g. `connection.vendor`, which dialect
+                of script is. Default is PostgreSQL dialect.
+        """
+        self.vendor = vendor
+        self._backslash_escapes = vendor in BACKSLASH_ESCAPE_VENDORS
+        self._special = _SPECIAL_OR_HASH if vendor in HASH_COMMENT_VENDORS else _SPECIAL
+        self._reset()
+
+    def _reset(self):
+        # text of current statement scanned so far, but moved out of buffer.
+        self._parts = []
+        self._buffer = ''
+        # start of current statement and scanning position in buffer.
+        self._start = 0
+        self._pos = 0
+        self._state = NORMAL
+        self._has_content = False
+        self._escape = False
+        self._tag = None
+        self._depth = 0
+
+    def feed(self, chunk):
+        """
+        Feed next chunk of script.
+
+        Returns:
+            (list) Statements completed by chunk.
+        """
+        self._buffer += chunk
+        statements = self._scan(final=False)
+        # move scanned text out of buffer, so that it does not grow with every chunk.
+        # two characters are kept to look behind at.
+        keep = max(self._start, self._pos - 2)
+        if keep > self._start:
+            self._parts.append(self._buffer[self._start:keep])
+        self._buffer = self._buffer[keep:]
+        self._pos -= keep
+        self._start = 0
+        return statements
+
+    def close(self):
+        """
+        Finish script.
+
+        Returns:
+            (list) Statements left, including the last one not terminated by semicolon.
+        """
+        statements = self._scan(final=True)
+        if self._has_content or self._state in (SINGLE_QUOTE, DOUBLE_QUOTE, DOLLAR_QUOTE):
+            statements.append(self._pop_statement(len(self._buffer)))
+        self._reset()
+        return statements
+
+    def _pop_statement(self, end):
+        self._parts.append(self._buffer[self._start:end])
+        statement = ''.join(self._parts).strip()
+        self._parts = []
+        self._start = end
+        self._has_content = False
+        return statement
+
+    def _scan(self, final):
+        statements = []
+        buf = self._buffer
+        size = len(buf)
+        pos = self._pos
+        while pos < size:
+            state = self._state
+            if state == NORMAL:
+                match = self._special.search(buf, pos)
+                end = match.start() if match else size
+                if not self._has_content and not buf[pos:end].isspace() and end > pos:
+                    self._has_content = True
+                if not match:
+                    pos = size
+                    break
+                char = buf[end]
+                if char == ';':
+                    if self._has_content:
+                        statements.append(self._pop_statement(end + 1))
+                    else:
+                        # comments and whitespace between statements are dropped.
+                        self._parts = []
+                        self._start = end + 1
+                    pos = end + 1
+                elif char == '#':
+                    self._state = LINE_COMMENT
+                    pos = end + 1
+                elif char in '-/':
+                    if end + 1 >= size and not final:
+                        pos = end
+                        break
+                    pair = buf[end:end + 2]
+                    if pair == '--':
+                        self._state = LINE_COMMENT
+                        pos = end + 2
+                    elif pair == '/*':
+                        self._state = BLOCK_COMMENT
+                        self._depth = 1
+                        pos = end + 2
+                    else:
+                        self._has_content = True
+                        pos = end + 1
+                elif char == '$':
+                    self._has_content = True
+                    if end and _IDENTIFIER_CHAR.match(buf[end - 1]):
+                        # part of identifier, e.g. `foo$bar`.
+                        pos = end + 1
+                        continue
+                    tag = _DOLLAR_TAG.match(buf, end)
+                    if tag:
+                        self._state = DOLLAR_QUOTE
+                        self._tag = tag.group()
+                        pos = tag.end()
+                    elif not final and _PARTIAL_DOLLAR_TAG.match(buf, end):
+                        # tag may be completed by the next chunk.
+                        pos = end
+                        break
+                    else:
+                        # positional parameter, e.g. `$1`.
+                        pos = end + 1
+                else:
+                    self._has_content = True
+                    if self._backslash_escapes:
+                        self._state = DOUBLE_QUOTE if char == '"' else SINGLE_QUOTE
+                        self._escape = True
+                    elif char == '"':
+                        self._state = DOUBLE_QUOTE
+                        self._escape = False
+                    else:
+                        self._state = SINGLE_QUOTE
+                        prefix = buf[max(0, end - 2):end]
+                        self._escape = (prefix[-1:] in ('e', 'E') and
+                                        not (len(prefix) == 2 and
+                                             _IDENTIFIER_CHAR.match(prefix[0])))
+                    pos = end + 1
+            elif state in (SINGLE_QUOTE, DOUBLE_QUOTE):
+                if self._escape:
+                    match = _QUOTE_OR_ESCAPE[state].search(buf, pos)
+                    end = match.start() if match else -1
+                else:
+                    end = buf.find("'" if state == SINGLE_QUOTE else '"', pos)
+                if end < 0:
+                    pos = size
+                    break
+                if end + 1 >= size and not final:
+                    # escaped or doubled quote may be split by chunks.
+                    pos = end
+                    break
+                if buf[end] == '\\':
+                    pos = end + 2
+                elif buf[end + 1:end + 2] == buf[end]:
+                    # doubled quote.
+                    pos = end + 2
+                else:
+                    self._state = NORMAL
+                    pos = end + 1
+            elif state == DOLLAR_QUOTE:
+                end = buf.find(self._tag, pos)
+                if end < 0:
+                    # closing tag may be split by chunks.
+                    pos = max(pos, size - len(self._tag) + 1)
+                    break
+                self._state = NORMAL
+                pos = end + len(self._tag)
+            elif state == LINE_COMMENT:
+                end = buf.find('\n', pos)
+                if end < 0:
+                    pos = size
+                    break
+                self._state = NORMAL
+                pos = end + 1
+            else:
+                match = _BLOCK_COMMENT.search(buf, pos)
+                if not match:
+                    pos = max(pos, size - 1)
+                    break
+                self._depth += 1 if match.group() == '/*' else -1
+                if not self._depth:
+                    self._state = NORMAL
+                pos = match.end()
+        self._pos = pos
+        return statements
+
+
+def iter_statements(chunks, vendor=None):
+    """
+    Split SQL script given as iterable of text chunks into statements, lazily.
+
+    Args:
+        vendor (str, optional): Vendor of database, which dialect of script is.
+    """
+    splitter = StatementSplitter(vendor)
+    for chunk in chunks:
+        for statement in splitter.feed(chunk):
+            yield statement
+    for statement in splitter.close():
+        yield statement
+
+
+def split_sql(sql, vendor=None):
+    """
+    Split SQL script into list of statements.
+
+    Args:
+        vendor (str, optional): Vendor of database, which dialect of script is.
+    """
+    return list(iter_statements([sql], vendor))
+
+
+class SplitCache(object):
+    """
+    LRU cache of scripts split into statements, keyed by fingerprints of scripts and vendors
+    of databases.
+    Same scripts are split once when migrations are applied repeatedly, e.g. in test suites.
+    """
+    def __init__(self, size=256):
+        self.size = size
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def split(self, sql, vendor=None):
+        key = (vendor, sql_fingerprint(sql))
+        with self._lock:
+            statements = self._data.pop(key, None)
+            if statements is not None:
+                self._data[key] = statements
+                return statements
+        statements = tuple(split_sql(sql, vendor))
+        with self._lock:
+            self._data[key] = statements
+            while len(self._data) > self.size:
+                self._data.popitem(last=False)
+        return statements
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+split_cache = SplitCache()
@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+"""
+Collapsing SQL item migrations of an app into a single baseline migration.
+
+Baseline creates every SQL item, that is alive at the end of squashed migrations, by one
+`CreateSQL` operation, in order of dependencies. It replaces squashed migrations, so fresh
+databases run it instead of the whole history.
+"""
+
+from __future__ import unicode_literals
+
+from django.conf import settings
+from django.db import migrations
+from django.db.migrations.migration import SwappableTuple
+
+from migrate_sql.graph import SQLStateGraph, build_migrations_graph
+from migrate_sql.operations import CreateSQL, MigrateSQLMixin
+
+
+class SquashError(Exception):
+    """
+    Migrations can't be collapsed into a baseline.
+    """
+
+
+def get_squashed_migrations(loader, app_label, migration_name):
+    """
+    Migrations of app up to `migration_name`, all of which should have SQL item operations only.
+
+    Returns:
+        (list) Migrations in order they are applied.
+    """
+    target = (app_label, migration_name)
+    squashed = []
+    for key in loader.graph.forwards_plan(target):
+        if key[0] != app_label:
+            continue
+        migration = loader.graph.nodes[key]
+        if migration.replaces:
+            raise SquashError('Migration {} is squashed already.'.format(migration.name))
+        others = [op for op in migration.operations if not isinstance(op, MigrateSQLMixin)]
+        if others:
+            raise SquashError(
+                'Migration {} has operations other than SQL item ones ({}), use '
+                'squashmigrations instead.'.format(
+                    migration.name, ', '.join(op.__class__.__name__ for op in others)))
+        squashed.append(migration)
+    return squashed
+
+
+def get_external_dependencies(squashed):
+    """
+    Dependencies of `squashed` migrations on migrations of other apps.
+    """
+    dependencies = set()
+    for migration in squashed:
+        for dependency in migration.dependencies:
+            if isinstance(dependency, SwappableTuple):
+                if settings.AUTH_USER_MODEL == dependency.setting:
+                    dependencies.add(('__setting__', 'AUTH_USER_MODEL'))
+                else:
+                    dependencies.add(dependency)
+            elif dependency[0] != migration.app_label:
+                dependencies.add(dependency)
+    return sorted(dependencies)
+
+
+def baseline_operations(sql_state, app_label):
+    """
+    Operations creating SQL items of app alive in `sql_state`, parents first.
+    """
+    operations = []
+    for key in sql_state.get_reachability().order:
+        if key[0] != app_label:
+            continue
+        sql_item = sql_state.nodes[key]
+        operations.append(CreateSQL(sql_item.name, sql_item.sql, reverse_sql=sql_item.reverse_sql,
+                                    dependencies=[tuple(dep) for dep in sql_item.dependencies]))
+    return operations
+
+
+def _app_items(sql_state, app_label):
+    return {
+        key: (sql_item.sql, sql_item.reverse_sql,
+              sorted(tuple(dep) for dep in sql_item.dependencies), sql_state.dependencies[key])
+        for key, sql_item in sql_state.nodes.items() if key[0] == app_label
+    }
+
+
+def verify_baseline(operations, sql_state, app_label):
+    """
+    Ensure SQL state created by baseline `operations` is exactly the one of app in `sql_state`.
+    """
+    baseline_state = SQLStateGraph()
+    for operation in operations:
+        operation.sql_state_forwards(app_label, baseline_state)
+    expected = _app_items(sql_state, app_label)
+    result = _app_items(baseline_state, app_label)
+    differ = sorted(key for key in set(expected) | set(result)
+                    if expected.get(key) != result.get(key))
+    if differ:
+        raise SquashError('Baseline differs from migrations in SQL items: {}.'.format(
+            ', '.join('%s.%s' % key for key in differ)))
+
+
+def build_baseline(loader, app_label, migration_name):
+    """
+    Baseline migration of app, replacing its migrations up to `migration_name`.
+
+    Returns:
+        (Migration) Baseline migration.
+    """
+    squashed = get_squashed_migrations(loader, app_label, migration_name)
+    sql_state = build_migrations_graph(loader, (app_label, migration_name))
+    operations = baseline_operations(sql_state, app_label)
+    verify_baseline(operations, sql_state, app_label)
+
+    subclass = type(str('Migration'), (migrations.Migration,), {
+        'dependencies': get_external_dependencies(squashed),
+        'operations': operations,
+        'replaces': [(migration.app_label, migration.name) for migration in squashed],
+    })
+    return subclass('0001_squashed_sql_{}'.format(migration_name), app_label)
@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+"""
+Content-addressed store of SQL texts.
+
+In store mode migrations do not embed SQL texts, every distinct text is written once to
+`sql/<digest>.sql` inside migrations package of an app, and operations reference it by digest.
+"""
+
+from __future__ import unicode_literals
+
+import io
+import os
+from importlib import import_module
+
+from migrate_sql.config import SQLFile, sql_fingerprint
+
+STORE_DIRECTORY = 'sql'
+
+# Attributes of SQL operations that hold SQL.
+SQL_ATTRS = ('sql', 'reverse_sql', 'state_sql', 'state_reverse_sql')
+
+
+def get_store_directory(app_label):
+    """
+    Directory of SQL store of an app, located in its migrations package.
+    """
+    from django.db.migrations.loader import MigrationLoader
+
+    module_name = MigrationLoader.migrations_module(app_label)
+    if isinstance(module_name, tuple):
+        # newer versions of Django return (module name, explicit) pair.
+        module_name = module_name[0]
+    module = import_module(module_name)
+    return os.path.join(os.path.dirname(os.path.abspath(module.__file__)), STORE_DIRECTORY)
+
+
+class SQLRef(SQLFile):
+    """
+    Reference to SQL text in SQL store of an app. Written to migrations instead of SQL text.
+    """
+    def __init__(self, app_label, digest):
+        """
+        Args:
+            app_label (str): Application which migrations package holds SQL store.
+            digest (str): Fingerprint of SQL text, which is the name of file in store.
+        """
+        self.app_label = app_label
+        self.digest = digest
+        super(SQLRef, self).__init__(None, fingerprint=digest)
+
+    @property
+    def path(self):
+        # resolved on first read, since migration modules are imported before apps are ready.
+        if self._path is None:
+            self._path = os.path.join(get_store_directory(self.app_label),
+                                      '{}.sql'.format(self.digest))
+        return self._path
+
+    @path.setter
+    def path(self, value):
+        self._path = value
+
+    def deconstruct(self):
+        return ('migrate_sql.store.SQLRef', (self.app_label, self.digest), {})
+
+    def __eq__(self, other):
+        return isinstance(other, SQLRef) and self.digest == other.digest
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash(self.digest)
+
+    def __repr__(self):
+        return '{}({!r}, {!r})'.format(self.__class__.__name__, self.app_label, self.digest)
+
+
+def store_sql(sqls, app_label, directory, write=True):
+    """
+    Replace SQL texts in `sqls` with references to SQL store, writing texts missing in store.
+    `sqls` has the same format as supported by Django's RunSQL operation.
+
+    Args:
+        sqls: SQL texts to store.
+        app_label (str): Application which migrations package holds SQL store.
+        directory (str): Directory of SQL store.
+        write (bool): If `False`, references are made, but nothing is written.
+    Returns:
+        Same structure as `sqls`, SQL texts are replaced with `SQLRef` objects.
+    """
+    def store(sql):
+        if not sql or isinstance(sql, SQLRef):
+            return sql
+        if hasattr(sql, 'read'):
+            sql = sql.read()
+        digest = sql_fingerprint(sql)
+        path = os.path.join(directory, '{}.sql'.format(digest))
+        if write and not os.path.exists(path):
+            if not os.path.isdir(directory):
+                os.makedirs(directory)
+            with io.open(path, 'wb') as sql_file:
+                sql_file.write(sql.encode('utf-8'))
+        return SQLRef(app_label, digest)
+
+    if isinstance(sqls, (list, tuple)):
+        return type(sqls)(
+            type(sql)((store(sql[0]),) + tuple(sql[1:])) if isinstance(sql, (list, tuple))
+            else store(sql)
+            for sql in sqls
+        )
+    return store(sqls)
+
+
+def store_operation_sql(operation, app_label, directory, write=True):
+    """
+    Replace SQL texts held by operation with references to SQL store.
+    """
+    for attr in SQL_ATTRS:
+        sqls = getattr(operation, attr, None)
+        if sqls:
+            setattr(operation, attr, store_sql(sqls, app_label, directory, write=write))
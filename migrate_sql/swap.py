@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+"""
+Swapping versions of functions and views declared by items having `swap=True`.
+
+New version of changed item is created under a versioned name (e.g. `top_books__v1a2b3c4d`)
+alongside the old one, which is still used meanwhile. Once items depending on the old version
+are dropped, it's dropped as well and the new one is renamed, which takes a moment only.
+Dependents are created again afterwards.
+"""
+
+from __future__ import unicode_literals
+
+from migrate_sql.analyzer import find_created_name
+from migrate_sql.config import SwapSQL, resolve_sql, sql_fingerprint
+from migrate_sql.planner import parse_drop
+from migrate_sql.splitter import split_sql
+
+# kinds of objects, which are swapped by renaming.
+SWAP_KINDS = ('FUNCTION', 'PROCEDURE', 'AGGREGATE', 'VIEW')
+
+
+def _sql_params(sqls):
+    """
+    Pairs `(sql, params)` of SQL in format supported by Django's RunSQL operation.
+    """
+    sqls = resolve_sql(sqls)
+    if not isinstance(sqls, (list, tuple)):
+        sqls = [sqls]
+    return [tuple(sql) if isinstance(sql, (list, tuple)) else (sql, None) for sql in sqls]
+
+
+def versioned_name(name, sqls):
+    """
+    Name of version of object created by `sqls`, which changes along with SQL.
+    """
+    fingerprint = sql_fingerprint('\n'.join('{} {!r}'.format(sql, params)
+                                            for sql, params in _sql_params(sqls)))
+    return '{}__v{}'.format(name, fingerprint[:8])
+
+
+def rename_created(sqls, name, new_name):
+    """
+    SQL creating object `name` under `new_name`.
+
+    Returns:
+        (list) Statements in format supported by Django's RunSQL operation or `None`, if any
+            statement is not `CREATE` statement of object `name`.
+    """
+    result = []
+    for sql, params in _sql_params(sqls):
+        statements = split_sql(sql) if sql else []
+        if params is not None and len(statements) != 1:
+            return None
+        for statement in statements:
+            statement = statement.strip()
+            found = find_created_name(statement)
+            if found is None or found[2] != name or '.' in statement[found[0]:found[1]]:
+                return None
+            statement = statement[:found[0]] + new_name + statement[found[1]:]
+            result.append(statement if params is None else (statement, params))
+    return result or None
+
+
+def get_versioned_swap_sql(sql_item):
+    """
+    SQL swapping versions of function or view of item by renaming.
+
+    Returns:
+        (config.SwapSQL) SQL of swap, or `None`, if item is not a function or view, or SQL of
+            item is anything but statements creating the object `reverse_sql` drops.
+    """
+    drop = parse_drop(sql_item.reverse_sql)
+    if drop is None or drop.kind not in SWAP_KINDS or len(drop.names) != 1:
+        return None
+    name, paren, args = drop.names[0].partition('(')
+    name, args = name.strip(), paren + args
+    if '"' in name or '.' in name:
+        return None
+
+    version = versioned_name(name, sql_item.sql)
+    stage = rename_created(sql_item.sql, name.lower(), version)
+    if stage is None:
+        return None
+    unstage = ['DROP {} IF EXISTS {}{}'.format(drop.kind, version, args)]
+    return SwapSQL(
+        # leftover of failed non-atomic migration is dropped first.
+        stage=unstage + stage,
+        unstage=unstage,
+        swap=['ALTER {} {}{} RENAME TO {}'.format(drop.kind, version, args, name)],
+        unswap=['ALTER {} {}{} RENAME TO {}'.format(drop.kind, name, args, version)],
+    )
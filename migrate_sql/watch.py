@@ -0,0 +1,206 @@
+# -*- coding: utf-8 -*-
+"""
+Watching SQL items for changes, used by `makemigrations --watch`.
+
+SQL state of migrations is replayed once and kept in memory along with SQL items of every app.
+When `sql_config` module of an app or a file its SQL items are stored in (`SQLFile`) changes,
+only its SQL items are reloaded and compared with migrations, changes of other apps found
+before are reused.
+"""
+
+from __future__ import unicode_literals
+
+import os
+import time
+from collections import OrderedDict
+
+from django.apps import apps
+from django.db.migrations.graph import CircularDependencyError, NodeNotFoundError
+from django.db.migrations.state import ProjectState
+from django.utils.six.moves import reload_module
+
+from migrate_sql.autodetector import MigrationAutodetector, is_sql_equal
+from migrate_sql.config import MaterializedView, SQLFile
+from migrate_sql.graph import build_items_graph, build_migrations_graph, get_sql_config
+from migrate_sql.operations import set_sql_state
+
+
+def _source_path(module):
+    path = getattr(module, '__file__', None)
+    if path and path.endswith(('.pyc', '.pyo')):
+        path = path[:-1]
+    return path
+
+
+def _mtime(path):
+    try:
+        return os.stat(path).st_mtime
+    except (OSError, TypeError):
+        return None
+
+
+def _sql_file_paths(sql_item):
+    """
+    Paths of files SQL of item is stored in.
+    """
+    if isinstance(sql_item, MaterializedView):
+        # SQL of view is built from query, it's not read here.
+        sources = [sql_item.query]
+    else:
+        sources = [sql_item.sql, sql_item.reverse_sql]
+    paths = []
+    for sqls in sources:
+        if not isinstance(sqls, (list, tuple)):
+            sqls = [sqls]
+        for sql in sqls:
+            if isinstance(sql, (list, tuple)):
+                sql = sql[0]
+            if isinstance(sql, SQLFile):
+                paths.append(sql.path)
+    return paths
+
+
+class SQLWatcher(object):
+    """
+    Finds SQL item operations `makemigrations` would generate, incrementally.
+    """
+    def __init__(self, loader, app_labels=None):
+        """
+        Args:
+            loader (MigrationLoader): Loader of migrations.
+            app_labels (set, optional): Report changes of these apps only.
+        """
+        self.app_labels = set(app_labels or ())
+        self.from_sql_graph = build_migrations_graph(loader)
+        self.modules = OrderedDict()
+        self.mtimes = {}
+        # modification times of files SQL items are stored in, by app labels and paths.
+        self.file_mtimes = {}
+        for app_config in apps.get_app_configs():
+            module = get_sql_config(app_config)
+            if module is not None:
+                self.modules[app_config.label] = module
+                self.mtimes[app_config.label] = _mtime(_source_path(module))
+        self.items = OrderedDict()
+        # keys of items differing from migrations.
+        self.changed = set()
+        self.refresh(list(self.modules))
+
+    def poll(self, errback=None):
+        """
+        Reload `sql_config` modules changed on disk since last poll, and find apps, which
+        SQL items are stored in files changed since last refresh.
+
+        Args:
+            errback (callable, optional): Called with exception a module failed to reload
+                with, previous version of module is kept then. Exception is raised, if not given.
+        Returns:
+            (list) Labels of apps changed, SQL items of which have to be refreshed.
+        """
+        changed = []
+        for app_label, module in self.modules.items():
+            mtime = _mtime(_source_path(module))
+            if mtime != self.mtimes[app_label]:
+                self.mtimes[app_label] = mtime
+                try:
+                    self.modules[app_label] = reload_module(module)
+                except Exception as ex:
+                    if errback is None:
+                        raise
+                    errback(ex)
+                    continue
+                changed.append(app_label)
+            elif any(_mtime(path) != file_mtime
+                     for path, file_mtime in self.file_mtimes.get(app_label, {}).items()):
+                changed.append(app_label)
+        return changed
+
+    def _is_changed(self, key):
+        old_item = self.from_sql_graph.nodes.get(key)
+        new_item = self.items.get(key)
+        if old_item is None or new_item is None:
+            return old_item is not new_item
+        return (not is_sql_equal(old_item.sql, new_item.sql) or
+                set(map(tuple, old_item.dependencies)) != set(map(tuple, new_item.dependencies)))
+
+    def refresh(self, app_labels):
+        """
+        Read SQL items of apps again and find out which of them differ from migrations.
+        """
+        for app_label in app_labels:
+            keys = {key for key in self.items if key[0] == app_label}
+            keys.update(key for key in self.from_sql_graph.nodes if key[0] == app_label)
+            for key in keys:
+                self.items.pop(key, None)
+            file_mtimes = self.file_mtimes[app_label] = {}
+            for sql_item in self.modules[app_label].sql_items:
+                key = (app_label, sql_item.name)
+                self.items[key] = sql_item
+                keys.add(key)
+                for path in _sql_file_paths(sql_item):
+                    file_mtimes[path] = _mtime(path)
+            for key in keys:
+                if self._is_changed(key):
+                    self.changed.add(key)
+                else:
+                    self.changed.discard(key)
+
+    def changes(self):
+        """
+        SQL item operations, that would be generated by `makemigrations`.
+
+        Returns:
+            (OrderedDict) Lists of operations by app labels.
+        """
+        from_state = ProjectState()
+        set_sql_state(from_state, self.from_sql_graph)
+        autodetector = MigrationAutodetector(
+            from_state, ProjectState(), to_sql_graph=build_items_graph(self.items),
+            consolidate=False)
+        autodetector.generated_operations = {}
+        # items depending on changed ones are added by the autodetector itself.
+        autodetector.generate_sql_changes(keys=self.changed)
+
+        result = OrderedDict()
+        for app_label, operations in sorted(autodetector.generated_operations.items()):
+            if not self.app_labels or app_label in self.app_labels:
+                result[app_label] = operations
+        return result
+
+    def update(self, errback=None):
+        """
+        Refresh SQL items changed since last update.
+
+        Args:
+            errback (callable, optional): Called with errors of SQL items (module failed to
+                reload, missing or circular dependencies), previous SQL items are kept then.
+                Errors are raised, if not given.
+        Returns:
+            (OrderedDict) Changes, same as `changes` returns, or `None` if SQL items are
+                the same or have errors.
+        """
+        app_labels = self.poll(errback)
+        if not app_labels:
+            return None
+        items, changed = self.items.copy(), set(self.changed)
+        try:
+            self.refresh(app_labels)
+            return self.changes()
+        except (NodeNotFoundError, CircularDependencyError) as ex:
+            self.items, self.changed = items, changed
+            if errback is None:
+                raise
+            errback(ex)
+            return None
+
+    def watch(self, callback, interval=1.0, errback=None):
+        """
+        Call `callback` with changes first and every time SQL items change, until interrupted.
+        Errors of SQL items are passed to `errback`, see `update`.
+        """
+        callback(self.changes())
+        while True:
+            time.sleep(interval)
+            changes = self.update(errback)
+            if changes is not None:
+                callback(changes)
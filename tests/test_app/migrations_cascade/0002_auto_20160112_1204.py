@@ -0,0 +1,26 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+import migrate_sql.operations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('test_app', '0001_initial'),
+    ]
+
+    operations = [
+        migrate_sql.operations.CreateSQL(
+            name='sale',
+            sql='CREATE TYPE sale AS (arg1 int); -- 1',
+            reverse_sql='DROP TYPE sale',
+        ),
+        migrate_sql.operations.CreateSQL(
+            name='book',
+            sql='CREATE TYPE book AS (sale1 sale, arg1 int); -- 1',
+            reverse_sql='DROP TYPE book',
+            dependencies=[('test_app', 'sale')],
+        ),
+    ]
@@ -0,0 +1,25 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+import migrate_sql.operations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('test_app', '0002_auto_20160112_1204'),
+    ]
+
+    operations = [
+        migrate_sql.operations.DeleteSQL(
+            name='sale',
+            sql='DROP TYPE sale CASCADE',
+            reverse_sql='CREATE TYPE sale AS (arg1 int); -- 1',
+        ),
+        migrate_sql.operations.DeleteSQL(
+            name='book',
+            sql='DROP TYPE book',
+            reverse_sql='CREATE TYPE book AS (sale1 sale, arg1 int); -- 1',
+        ),
+    ]
@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.core.management import call_command
+from django.core.management.base import CommandError
+
+from migrate_sql.analyzer import defined_names, infer_dependencies, referenced_names
+from migrate_sql.config import SQLItem
+from migrate_sql.graph import build_current_graph
+
+from test_app.test_migrations import BaseMigrateSQLTestCase
+
+
+class DependencyInferenceTestCase(BaseMigrateSQLTestCase):
+    """
+    Tests inference of SQL item dependencies from their SQL.
+    """
+    def setUp(self):
+        super(DependencyInferenceTestCase, self).setUp()
+        self.config.sql_items = [
+            SQLItem('book', 'CREATE TYPE book AS (sale sale, arg1 int)', 'DROP TYPE book',
+                    dependencies=[('test_app2', 'sale')]),
+            SQLItem('rating', 'CREATE TYPE "Rating" AS (arg1 int)', 'DROP TYPE "Rating"'),
+            SQLItem(
+                'top_books',
+                """
+                -- returns books, not ratings.
+                CREATE FUNCTION top_books() RETURNS SETOF book AS $$
+                    SELECT ROW(ROW(1), 2)::book WHERE 'rating' <> $body$ top_books $body$;
+                $$ LANGUAGE SQL
+                """,
+                'DROP FUNCTION top_books()',
+                dependencies=[('test_app', 'book'), ('test_app2', 'sale'),
+                              ('test_app', 'rating')],
+            ),
+        ]
+        self.config2.sql_items = [
+            SQLItem('sale', 'CREATE TYPE sale AS (arg1 int)', 'DROP TYPE sale'),
+        ]
+
+    def test_names(self):
+        self.assertEqual(referenced_names('SELECT "Book".a FROM e\'\\\' sale\' /* rating */'),
+                         {'select', 'Book', 'a', 'from'})
+        self.assertEqual(defined_names(self.config.sql_items[1]), {'Rating'})
+        self.assertEqual(defined_names(self.config.sql_items[2]), {'top_books'})
+        self.assertEqual(defined_names(SQLItem('sale', 'SELECT 1')), {'sale'})
+
+    def test_infer(self):
+        reports = infer_dependencies(build_current_graph().nodes)
+        top_books = reports[('test_app', 'top_books')]
+        self.assertEqual(top_books.referenced, {('test_app', 'book')})
+        self.assertEqual(top_books.inferred, {('test_app', 'book')})
+        self.assertEqual(top_books.unused, {('test_app2', 'sale'), ('test_app', 'rating')})
+        self.assertEqual(top_books.missing, set())
+        self.assertTrue(reports[('test_app', 'book')].ok)
+
+        self.config.sql_items[0].dependencies = []
+        reports = infer_dependencies(build_current_graph().nodes)
+        self.assertEqual(reports[('test_app', 'book')].missing, {('test_app2', 'sale')})
+
+    def test_command(self):
+        call_command('inferdependencies', stdout=self.out)
+        self.assertIn("test_app.top_books:\n  unused: test_app.rating, test_app2.sale\n"
+                      "  dependencies=[('test_app', 'book')]", self.out.getvalue())
+        with self.assertRaisesRegexp(CommandError, 'differ from inferred: test_app.top_books'):
+            call_command('inferdependencies', check=True, stdout=self.out)
+        call_command('inferdependencies', 'test_app2', check=True, stdout=self.out)
+
+    def test_apply(self):
+        with self.settings(SQL_INFER_DEPENDENCIES=True):
+            graph = build_current_graph()
+        self.assertEqual(graph.dependencies[('test_app', 'top_books')], {('test_app', 'book')})
+        self.assertEqual(graph.nodes[('test_app', 'top_books')].dependencies,
+                         [('test_app', 'book')])
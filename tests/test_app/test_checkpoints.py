@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import DatabaseError, connection, transaction
+from django.db.migrations import Migration
+from django.db.migrations.state import ProjectState
+from django.test import TestCase
+
+from migrate_sql.operations import CreateSQL
+from migrate_sql.recorder import CheckpointRecorder, get_checkpoint_recorder, track_checkpoints
+
+from test_app.test_migrations import run_query
+
+
+class CheckpointTestCase(TestCase):
+    """
+    Tests checkpoints of SQL item operations run by migrations, that are not atomic.
+    """
+    def setUp(self):
+        super(CheckpointTestCase, self).setUp()
+        self.operations = [
+            CreateSQL('sale', 'CREATE TYPE sale AS (arg1 int)', 'DROP TYPE sale'),
+            CreateSQL('book', 'CREATE TYPE book AS (sale sale, missing missing)',
+                      'DROP TYPE book'),
+        ]
+        # migration is left tracked, if it fails.
+        self.addCleanup(setattr, connection, '_sql_migration', None)
+
+    def apply(self, operations, atomic=False, name='0001_initial'):
+        """
+        Apply operations as migration `name` the way Django applies a migration, which is not
+        atomic, unless requested otherwise.
+        """
+        migration = Migration(name, 'test_app')
+        migration.operations = operations
+        track_checkpoints(connection, 'apply_start', migration)
+        state = ProjectState()
+        # schema editor is not entered, since on PostgreSQL it would run operations in
+        # transaction; every operation is run in its own one instead.
+        schema_editor = connection.schema_editor()
+        schema_editor.deferred_sql = []
+        schema_editor.atomic_migration = atomic
+        for operation in operations:
+            new_state = state.clone()
+            operation.state_forwards('test_app', new_state)
+            with transaction.atomic():
+                operation.database_forwards('test_app', schema_editor, state, new_state)
+            state = new_state
+        track_checkpoints(connection, 'apply_success', migration)
+
+    def unapply(self, operations, name='0001_initial'):
+        """
+        Unapply operations of migration `name` the way `apply` applies them.
+        """
+        migration = Migration(name, 'test_app')
+        migration.operations = operations
+        track_checkpoints(connection, 'unapply_start', migration)
+        schema_editor = connection.schema_editor()
+        schema_editor.deferred_sql = []
+        schema_editor.atomic_migration = False
+        for operation in reversed(operations):
+            with transaction.atomic():
+                operation.database_backwards('test_app', schema_editor, ProjectState(),
+                                             ProjectState())
+        track_checkpoints(connection, 'unapply_success', migration)
+
+    def types(self):
+        return run_query("SELECT typname FROM pg_type WHERE typname IN ('sale', 'book') "
+                         "ORDER BY typname")
+
+    def test_resume(self):
+        with self.assertRaises(DatabaseError):
+            self.apply(self.operations)
+        self.assertEqual(self.types(), [('sale',)])
+        recorder = CheckpointRecorder(connection)
+        key = ('test_app', '0001_initial', 0)
+        self.assertTrue(recorder.is_applied(key, self.operations[0].fingerprint))
+
+        # changed operation is not skipped.
+        with self.assertRaises(DatabaseError):
+            self.apply([CreateSQL('sale', 'CREATE TYPE sale AS (arg2 int)', 'DROP TYPE sale')])
+
+        # same operation at another position or in another migration is not skipped.
+        with self.assertRaises(DatabaseError):
+            self.apply([self.operations[1], self.operations[0]])
+        with self.assertRaises(DatabaseError):
+            self.apply(self.operations[:1], name='0002_second')
+
+        # completed operation is skipped, otherwise it would fail, since type exists.
+        self.operations[1] = CreateSQL('book', 'CREATE TYPE book AS (sale sale)',
+                                       'DROP TYPE book')
+        self.apply(self.operations)
+        self.assertEqual(self.types(), [('book',), ('sale',)])
+        # checkpoints are deleted, once migration is applied.
+        self.assertFalse(recorder.queryset.exists())
+
+    def test_stale(self):
+        """
+        Checkpoints of failed migration, that is faked then, are kept until migration is
+        unapplied, so that they don't skip operations when migration is applied again.
+        """
+        with self.assertRaises(DatabaseError):
+            self.apply(self.operations)
+        recorder = CheckpointRecorder(connection)
+        self.assertTrue(recorder.queryset.exists())
+        self.operations[1] = CreateSQL('book', 'CREATE TYPE book AS (sale sale)',
+                                       'DROP TYPE book')
+        with connection.cursor() as cursor:
+            cursor.execute(self.operations[1].sql)
+        # checkpoints are not looked for, unless operations are run.
+        migration = Migration('0001_initial', 'test_app')
+        with self.assertNumQueries(0):
+            track_checkpoints(connection, 'apply_start', migration, fake=True)
+            track_checkpoints(connection, 'apply_success', migration, fake=True)
+        self.assertTrue(recorder.queryset.exists())
+
+        self.unapply(self.operations)
+        self.assertEqual(self.types(), [])
+        self.assertFalse(recorder.queryset.exists())
+        self.apply(self.operations)
+        self.assertEqual(self.types(), [('book',), ('sale',)])
+
+    def test_atomic(self):
+        self.apply(self.operations[:1], atomic=True)
+        self.assertEqual(self.types(), [('sale',)])
+        self.assertNotIn(CheckpointRecorder.Checkpoint._meta.db_table,
+                         connection.introspection.table_names())
+
+    def test_untracked(self):
+        """
+        Operations run outside of tracked migrations are not checkpointed.
+        """
+        schema_editor = connection.schema_editor()
+        schema_editor.atomic_migration = False
+        self.assertEqual(get_checkpoint_recorder(schema_editor, self.operations[0]),
+                         (None, None))
@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import os
+import shutil
+import tempfile
+
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db.migrations.loader import MigrationLoader
+from django.utils.six import StringIO
+
+from migrate_sql.autodetector import is_sql_equal
+from migrate_sql.config import MaterializedView, SQLFile, SQLItem
+from migrate_sql.manifest import load_manifest
+
+from test_app.test_migrations import BaseMigrateSQLTestCase
+
+
+class SQLManifestTestCase(BaseMigrateSQLTestCase):
+    """
+    Tests SQL items compiled into manifest.
+    """
+    def setUp(self):
+        super(SQLManifestTestCase, self).setUp()
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.path = os.path.join(directory, 'sql_manifest.json')
+        self.config.sql_items = [
+            SQLItem('top_books', [('SELECT %s', [5]), 'SELECT \'ф\''], 'SELECT 1',
+                    dependencies=[('test_app2', 'sale')], replace=True),
+            SQLItem('rating', 'SELECT 1'),
+        ]
+        self.config2.sql_items = [SQLItem('sale', 'SELECT 2')]
+
+    def test_load(self):
+        call_command('compilesqlmanifest', self.path, stdout=self.out)
+        graph = load_manifest(self.path)
+
+        self.assertEqual(set(graph.nodes), {('test_app', 'top_books'), ('test_app', 'rating'),
+                                            ('test_app2', 'sale')})
+        self.assertEqual(graph.dependencies[('test_app', 'top_books')], {('test_app2', 'sale')})
+        top_books = graph.nodes[('test_app', 'top_books')]
+        self.assertTrue(top_books.replace)
+        self.assertIsInstance(top_books.sql[0][0], SQLFile)
+        self.assertEqual(top_books.sql[0][0].read(), 'SELECT %s')
+        self.assertTrue(is_sql_equal(top_books.sql, self.config.sql_items[0].sql))
+        self.assertIsNone(graph.nodes[('test_app', 'rating')].reverse_sql)
+        # same text is stored once.
+        self.assertEqual(top_books.reverse_sql.offset,
+                         graph.nodes[('test_app', 'rating')].sql.offset)
+
+    def test_tuple_params(self):
+        """
+        Params of tuples, which are loaded from manifest as lists, should be equal to them.
+        """
+        self.config.sql_items = [SQLItem('top_books', [('SELECT %s', (5,))], 'SELECT 1')]
+        call_command('compilesqlmanifest', self.path, stdout=self.out)
+        call_command('compilesqlmanifest', self.path, check=True, stdout=self.out)
+
+        with self.temporary_migration_module():
+            call_command('makemigrations', 'test_app', stdout=self.out)
+            out = StringIO()
+            call_command('makemigrations', 'test_app', sql_manifest=self.path, stdout=out)
+            self.assertIn('No changes detected', out.getvalue())
+
+    def test_materialized_view(self):
+        self.config2.sql_items = [
+            MaterializedView('sale', 'SELECT \'view query\'',
+                             indexes=[('sale_id', 'CREATE INDEX {index} ON {view} (id)')]),
+        ]
+        call_command('compilesqlmanifest', self.path, stdout=self.out)
+        with open(self.path) as manifest_file:
+            self.assertNotIn('view query', manifest_file.read())
+
+        view = load_manifest(self.path).nodes[('test_app2', 'sale')]
+        self.assertIsInstance(view, MaterializedView)
+        self.assertIsInstance(view.query, SQLFile)
+        self.assertTrue(is_sql_equal(view.sql, self.config2.sql_items[0].sql))
+        call_command('compilesqlmanifest', self.path, check=True, stdout=self.out)
+
+    def test_check(self):
+        call_command('compilesqlmanifest', self.path, stdout=self.out)
+        call_command('compilesqlmanifest', self.path, check=True, stdout=self.out)
+
+        self.config2.sql_items = [SQLItem('sale', 'SELECT 3')]
+        with self.assertRaisesRegexp(CommandError, 'outdated: test_app2.sale'):
+            call_command('compilesqlmanifest', self.path, check=True, stdout=self.out)
+
+        self.config2.sql_items = [SQLItem('sale', 'SELECT 2', swap=True)]
+        with self.assertRaisesRegexp(CommandError, 'outdated: test_app2.sale'):
+            call_command('compilesqlmanifest', self.path, check=True, stdout=self.out)
+
+        # materialized view differs from item having the same SQL.
+        view = MaterializedView('sale', 'SELECT 2')
+        self.config2.sql_items = [view]
+        call_command('compilesqlmanifest', self.path, stdout=self.out)
+        self.config2.sql_items = [SQLItem('sale', view.sql, view.reverse_sql)]
+        with self.assertRaisesRegexp(CommandError, 'outdated: test_app2.sale'):
+            call_command('compilesqlmanifest', self.path, check=True, stdout=self.out)
+
+    def test_makemigrations(self):
+        self.config.sql_items = [SQLItem('top_books', [('SELECT %s', [5])], 'SELECT 1')]
+        call_command('compilesqlmanifest', self.path, stdout=self.out)
+        # manifest is used instead of configuration.
+        self.config.sql_items = []
+
+        with self.temporary_migration_module():
+            call_command('makemigrations', 'test_app', sql_manifest=self.path, stdout=self.out)
+            loader = MigrationLoader(None, load=True)
+            migration = loader.get_migration_by_prefix('test_app', '0002')
+            operation, = migration.operations
+            self.assertEqual(operation.sql, [('SELECT %s', [5])])
+            self.assertEqual(operation.reverse_sql, 'SELECT 1')
@@ -23,7 +23,9 @@ from django.conf import settings
 from django.test.utils import extend_sys_path
 
 from test_app.models import Book
-from migrate_sql.config import SQLItem
+from migrate_sql.config import MaterializedView, SQLItem, SQLFile
+from migrate_sql.graph import build_migrations_graph
+from migrate_sql.store import SQLRef
 
 
 class TupleComposite(CompositeCaster):
@@ -299,6 +301,82 @@ class MigrateSQLTestCase(BaseMigrateSQLTestCase):
         )
         self.check_migrations(expected_content, expected_results, 'test_app.migrations_change')
 
+    def test_migration_sql_file(self):
+        """
+        Items stored in SQL files should be persisted into migrations as text.
+        """
+        (sql, params), = self.SQL_V2[0]
+        sql_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, sql_dir)
+        path = os.path.join(sql_dir, 'top_books.sql')
+        with open(path, 'w') as sql_file:
+            sql_file.write(sql)
+        self.config.sql_items = [SQLItem('top_books', [(SQLFile(path), params)], self.SQL_V2[1])]
+
+        expected_content = {
+            ('test_app', '0003'): (
+                True,
+                [('test_app', '0002')],
+                [[('ReverseAlterSQL', 'top_books'), ('AlterSQL', 'top_books')]],
+            ),
+        }
+        expected_results = (
+            ('0003', [('HTML 5',), ('The mysterious dog',)]),
+        )
+        self.check_migrations(expected_content, expected_results, 'test_app.migrations_change')
+
+        # file content is the same as migrated one, no changes expected.
+        out = StringIO()
+        with self.temporary_migration_module(module='test_app.migrations_change'):
+            call_command('makemigrations', 'test_app', stdout=out)
+            call_command('makemigrations', 'test_app', stdout=out)
+        self.assertIn('No changes detected', out.getvalue())
+
+    def test_migration_sql_store(self):
+        """
+        In SQL store mode migrations should reference SQL texts stored once in migrations package.
+        """
+        sql, reverse_sql = self.SQL_V2
+        self.config.sql_items = [SQLItem('top_books', sql, reverse_sql)]
+
+        with self.temporary_migration_module(module='test_app.migrations_change') as path:
+            call_command('makemigrations', 'test_app', sql_store=True, stdout=self.out)
+            loader = MigrationLoader(None, load=True)
+            reverse_op, alter_op = loader.get_migration_by_prefix('test_app', '0003').operations
+
+            (sql_ref, params), = alter_op.sql
+            self.assertIsInstance(sql_ref, SQLRef)
+            self.assertEqual(params, [5])
+            self.assertEqual(sql_ref.read(), sql[0][0])
+            self.assertEqual(reverse_op.sql.read(), 'DROP FUNCTION top_books()')
+            self.assertEqual(len(os.listdir(os.path.join(path, 'sql'))), 4)
+
+            call_command('migrate', 'test_app', stdout=self.out)
+            self.check_run_migrations((
+                ('0003', [('HTML 5',), ('The mysterious dog',)]),
+                ('0002', [('HTML 5',), ('Management',), ('The mysterious dog',)]),
+            ))
+
+            out = StringIO()
+            call_command('makemigrations', 'test_app', sql_store=True, stdout=out)
+            self.assertIn('No changes detected', out.getvalue())
+
+            # state of swapped item is stored as well.
+            sql, reverse_sql = self.SQL_V3
+            self.config.sql_items = [SQLItem('top_books', sql, reverse_sql, swap=True)]
+            call_command('makemigrations', 'test_app', sql_store=True, stdout=self.out)
+            loader = MigrationLoader(None, load=True)
+            swap_op = loader.get_migration_by_prefix('test_app', '0004').operations[-1]
+            (sql_ref, params), = swap_op.state_sql
+            self.assertIsInstance(sql_ref, SQLRef)
+            self.assertEqual(sql_ref.read(), sql[0][0])
+            self.assertIsInstance(swap_op.state_reverse_sql, SQLRef)
+
+            call_command('migrate', 'test_app', stdout=self.out)
+            out = StringIO()
+            call_command('makemigrations', 'test_app', sql_store=True, stdout=out)
+            self.assertIn('No changes detected', out.getvalue())
+
     def test_migration_replace(self):
         """
         Items changed with `replace` = Truel should properly persist changes into migrations and
@@ -360,6 +438,93 @@ class MigrateSQLTestCase(BaseMigrateSQLTestCase):
         )
         self.check_migrations(expected_content, expected_results, 'test_app.migrations_recreate')
 
+    def test_materialized_view(self):
+        """
+        Changed materialized view should be built alongside the old one and swapped in,
+        dependents should be recreated on the new one.
+        """
+        def set_items(min_rating):
+            self.config.sql_items = [
+                MaterializedView(
+                    'top_books_mv',
+                    'SELECT id, name FROM test_app_book WHERE rating > {}'.format(min_rating),
+                    indexes=[('top_books_mv_id', 'CREATE UNIQUE INDEX {index} ON {view} (id)')],
+                ),
+                SQLItem('top_names', 'CREATE VIEW top_names AS SELECT name FROM top_books_mv',
+                        'DROP VIEW top_names', dependencies=[('test_app', 'top_books_mv')]),
+            ]
+
+        def check(names):
+            self.assertEqual(run_query('SELECT name FROM top_names ORDER BY name'), names)
+            self.assertEqual(run_query("SELECT relname FROM pg_class WHERE relname LIKE "
+                                       "'top_books_mv%%' ORDER BY relname"),
+                             [('top_books_mv',), ('top_books_mv_id',)])
+
+        with self.temporary_migration_module():
+            set_items(5)
+            call_command('makemigrations', 'test_app', stdout=self.out)
+            set_items(8)
+            call_command('makemigrations', 'test_app', stdout=self.out)
+            self.check_migrations_content({
+                ('test_app', '0003'): (
+                    True,
+                    [('test_app', '0002')],
+                    [[('StageSQL', 'top_books_mv'), ('ReverseAlterSQL', 'top_names'),
+                      ('AlterSQL', 'top_books_mv'), ('AlterSQL', 'top_names')]],
+                ),
+            })
+
+            call_command('migrate', 'test_app', '0002', stdout=self.out)
+            check([('HTML 5',), ('Management',), ('The mysterious dog',)])
+            call_command('migrate', 'test_app', stdout=self.out)
+            check([('HTML 5',)])
+            call_command('migrate', 'test_app', '0002', stdout=self.out)
+            check([('HTML 5',), ('Management',), ('The mysterious dog',)])
+
+            # state holds view itself, rather than SQL swapping it.
+            call_command('makemigrations', 'test_app', stdout=self.out)
+            self.assertIn('No changes detected', self.out.getvalue())
+
+    def test_migration_swap(self):
+        """
+        New version of item with `swap` should be created alongside the old one and renamed,
+        dependents should be recreated on the new one.
+        """
+        def set_items(sql, reverse_sql):
+            self.config.sql_items = [
+                SQLItem('top_books', sql, reverse_sql, swap=True),
+                SQLItem('top_book_names',
+                        'CREATE VIEW top_book_names AS SELECT name FROM top_books() ORDER BY name',
+                        'DROP VIEW top_book_names', dependencies=[('test_app', 'top_books')]),
+            ]
+
+        def check(names):
+            self.assertEqual(run_query('SELECT name FROM top_book_names'), names)
+            self.assertEqual(run_query("SELECT proname FROM pg_proc WHERE proname LIKE "
+                                       "'top_books%%'"), [('top_books',)])
+
+        with self.temporary_migration_module():
+            set_items(*self.SQL_V1)
+            call_command('makemigrations', 'test_app', stdout=self.out)
+            set_items(*self.SQL_V2)
+            call_command('makemigrations', 'test_app', stdout=self.out)
+            self.check_migrations_content({
+                ('test_app', '0003'): (
+                    True,
+                    [('test_app', '0002')],
+                    [[('StageSQL', 'top_books'), ('ReverseAlterSQL', 'top_book_names'),
+                      ('AlterSQL', 'top_books'), ('AlterSQL', 'top_book_names')]],
+                ),
+            })
+
+            call_command('migrate', 'test_app', stdout=self.out)
+            check([('HTML 5',), ('The mysterious dog',)])
+            call_command('migrate', 'test_app', '0002', stdout=self.out)
+            check([('HTML 5',), ('Management',), ('The mysterious dog',)])
+
+            call_command('makemigrations', 'test_app', stdout=self.out)
+            self.assertIn('No changes detected', self.out.getvalue())
+
 
 class SQLDependenciesTestCase(BaseMigrateSQLTestCase):
     """
@@ -388,6 +553,13 @@ class SQLDependenciesTestCase(BaseMigrateSQLTestCase):
              ['narration', 'book', 'sale', 'rating'],
              ((1, 2), ((3, 4), (5,), 6, 7), 8)),
         ],
+        ('test_app', '0003'): [
+            # narration check
+            ("('(1)', '(2)', 3)",
+             'narration',
+             ['rating', 'book', 'sale', 'narration'],
+             ((1,), (2,), 3)),
+        ],
         ('test_app', '0002'): [
             # narration check
             ("('(1)', '(2)', 3)",
@@ -432,14 +604,17 @@ class SQLDependenciesTestCase(BaseMigrateSQLTestCase):
                                [fetch_type])
             self.assertEqual(result, [(0,)])
 
-    def check_migrations(self, content, migrations, module=None, module2=None):
+    def check_migrations(self, content, migrations, module=None, module2=None, check=None):
         """
         Checks migrations content and result after being run.
+        `check` is called with migration loader to make additional checks of migrations made.
         """
         with self.temporary_migration_module(app_label='test_app', module=module):
             with self.temporary_migration_module(app_label='test_app2', module=module2):
                 call_command('makemigrations', stdout=self.out)
                 self.check_migrations_content(content)
+                if check is not None:
+                    check(MigrationLoader(None, load=True))
 
                 for app_label, migration in migrations:
                     call_command('migrate', app_label, migration, stdout=self.out)
@@ -475,6 +650,45 @@ class SQLDependenciesTestCase(BaseMigrateSQLTestCase):
         )
         self.check_migrations(expected_content, migrations)
 
+    def test_deps_create_split_layers(self):
+        """
+        Every dependency layer should be put into its own migration, if enabled.
+        """
+        self.config.sql_items = [
+            item('rating', 1),
+            item('book', 1),
+            item('narration', 1, [('test_app2', 'sale'), ('test_app', 'book')]),
+        ]
+        self.config2.sql_items = [item('sale', 1)]
+        expected_content = {
+            ('test_app2', '0001'): (
+                True,
+                [],
+                [[('CreateSQL', 'sale')]],
+            ),
+            ('test_app', '0002'): (
+                True,
+                [('test_app2', '0001'), ('test_app', '0001')],
+                [[('CreateSQL', 'rating')], [('CreateSQL', 'book')]],
+            ),
+            ('test_app', '0003'): (
+                True,
+                [('test_app', '0002')],
+                [[('CreateSQL', 'narration')]],
+            ),
+        }
+        migrations = (
+            ('test_app', '0003'),
+        )
+
+        def check(loader):
+            migration = next(mig for key, mig in loader.disk_migrations.items()
+                             if mig_name(key) == ('test_app', '0002'))
+            self.assertEqual({op.name for op in migration.operations}, {'rating', 'book'})
+
+        with self.settings(SQL_SPLIT_LAYERS=True):
+            self.check_migrations(expected_content, migrations, check=check)
+
     def test_deps_update(self):
         """
         Updating a graph of items with dependencies should embed relation changes in migrations.
@@ -520,6 +734,103 @@ class SQLDependenciesTestCase(BaseMigrateSQLTestCase):
             module='test_app.migrations_deps_update', module2='test_app2.migrations_deps_update',
         )
 
+    def test_deps_consolidate(self):
+        """
+        Cascades of changes spanning apps should be put into as few migrations as possible.
+        Django can't even order operations of these ones by itself.
+        """
+        self.config.sql_items = [
+            item('rating', 2),
+            item('book', 2),
+            item('narration', 1, [('test_app2', 'sale'), ('test_app', 'book')]),
+            item('edition', 1, [('test_app2', 'product')]),
+        ]
+        self.config2.sql_items = [item('sale', 2), item('product', 1, [('test_app', 'rating')])]
+        expected_content = {
+            ('test_app', '0003'): (
+                True,
+                [('test_app', '0002')],
+                [[('ReverseAlterSQL', 'narration'), ('ReverseAlterSQL', 'rating'),
+                  ('AlterSQL', 'rating')]],
+            ),
+            ('test_app2', '0002'): (
+                True,
+                [('test_app', '0003'), ('test_app2', '0001')],
+                [[('ReverseAlterSQL', 'sale'), ('AlterSQL', 'sale')], [('CreateSQL', 'product')]],
+            ),
+            ('test_app', '0004'): (
+                True,
+                [('test_app', '0003'), ('test_app2', '0002')],
+                [[('ReverseAlterSQL', 'book'), ('AlterSQL', 'book')],
+                 [('CreateSQL', 'edition'), ('AlterSQL', 'narration')]],
+            ),
+            ('test_app', '0005'): (False, [], []),
+            ('test_app2', '0003'): (False, [], []),
+        }
+
+        def check(loader):
+            call_command('migrate', stdout=self.out)
+            self.check_type('(1, 2)', 'rating', ['rating'], (1, 2))
+            self.check_type("('(1, 2)', 3)", 'product', ['rating', 'product'], ((1, 2), 3))
+            self.check_type("(('(1, 2)', 3), 4)", 'edition', ['rating', 'product', 'edition'],
+                            (((1, 2), 3), 4))
+
+        with self.settings(SQL_CONSOLIDATE=True):
+            self.check_migrations(
+                expected_content, (),
+                module='test_app.migrations_deps_update',
+                module2='test_app2.migrations_deps_update',
+                check=check,
+            )
+
+    def test_deps_update_delete_dependent(self):
+        """
+        Deleted items depending on changed ones should be dropped before the latter are reversed.
+        """
+        self.config.sql_items = [
+            item('rating', 1),
+            item('book', 2),
+        ]
+        self.config2.sql_items = [item('sale', 1)]
+        expected_content = {
+            ('test_app', '0003'): (
+                True,
+                [('test_app', '0002')],
+                [[('DeleteSQL', 'narration'), ('ReverseAlterSQL', 'book'), ('AlterSQL', 'book')]],
+            ),
+        }
+
+        def check(loader):
+            call_command('migrate', 'test_app', stdout=self.out)
+            self.check_type(None, 'narration', [], None)
+            self.check_type('(1, 2)', 'book', ['book'], (1, 2))
+
+        self.check_migrations(
+            expected_content, (),
+            module='test_app.migrations_deps_update', module2='test_app2.migrations_deps_update',
+            check=check,
+        )
+
+    def test_build_migrations_graph(self):
+        """
+        SQL state replayed without models should be the same as SQL state of project state.
+        """
+        def items(graph):
+            return {key: (sql_item.sql, sql_item.reverse_sql, list(sql_item.dependencies))
+                    for key, sql_item in graph.nodes.items()}
+
+        with self.temporary_migration_module(module='test_app.migrations_deps_delete'):
+            with self.temporary_migration_module(app_label='test_app2',
+                                                 module='test_app2.migrations_deps_delete'):
+                loader = MigrationLoader(None, load=True)
+                for nodes, at_end in ((None, True),
+                                      (('test_app', '0003_auto_20160108_0048'), True),
+                                      (('test_app', '0003_auto_20160108_0048'), False)):
+                    expected = loader.project_state(nodes, at_end).sql_state
+                    graph = build_migrations_graph(loader, nodes, at_end)
+                    self.assertEqual(items(graph), items(expected))
+                    self.assertEqual(dict(graph.dependencies), dict(expected.dependencies))
+
     def test_deps_circular(self):
         """
         Graph with items that refer to themselves in their dependencies should raise an error.
@@ -565,6 +876,25 @@ class SQLDependenciesTestCase(BaseMigrateSQLTestCase):
         Graph with items that gets some of them removed along with dependencies should reflect
         changes into migrations.
         """
+        self.check_deps_delete()
+
+    def test_deps_delete_batched(self):
+        """
+        Items of the same dependency layer should be dropped by single statement, if enabled.
+        """
+        def check(loader):
+            migration = next(mig for key, mig in loader.disk_migrations.items()
+                             if mig_name(key) == ('test_app', '0005'))
+            sqls = {op.name: op.sql for op in migration.operations}
+            self.assertIn(sqls['narration'] or sqls['product'],
+                          ('DROP TYPE narration, product', 'DROP TYPE product, narration'))
+            self.assertEqual(min(sqls['narration'], sqls['product']), '')
+            self.assertEqual(sqls['author'], 'DROP TYPE author')
+
+        with self.settings(SQL_BATCH_DROPS=True):
+            self.check_deps_delete(check)
+
+    def check_deps_delete(self, check=None):
         self.config.sql_items = [
             item('rating', 1),
             item('edition', 1),
@@ -595,4 +925,5 @@ class SQLDependenciesTestCase(BaseMigrateSQLTestCase):
         self.check_migrations(
             expected_content, migrations,
             module='test_app.migrations_deps_delete', module2='test_app2.migrations_deps_delete',
+            check=check,
         )
@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+try:
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
+
+from django.core.management import call_command
+from django.db import connections
+
+from migrate_sql.parallel import migrate_databases, run_parallel
+from migrate_sql.schemas import migrate_schemas
+
+from test_app.test_migrations import BaseMigrateSQLTestCase, run_query
+
+
+class DenyTestAppRouter(object):
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return app_label != 'test_app'
+
+
+class MigrateDatabasesTestCase(BaseMigrateSQLTestCase):
+    """
+    Tests concurrent migration of many databases.
+
+    NOTE: migrations are run in separate threads and connections, so their changes are
+    committed and have to be rolled back explicitly.
+    """
+    def function_exists(self):
+        return run_query("SELECT COUNT(*) FROM pg_proc WHERE proname = 'top_books'") == [(1,)]
+
+    def test_run_parallel(self):
+        def task(number):
+            if number == 3:
+                raise ValueError(number)
+            return number * 2
+
+        results = run_parallel(task, list(range(10)), 3)
+        self.assertEqual([result for result, _ in results], [0, 2, 4, None, 8, 10, 12, 14, 16, 18])
+        self.assertIsInstance(results[3][1], ValueError)
+
+    def test_migrate(self):
+        with self.temporary_migration_module(module='test_app.migrations_change'):
+            out = StringIO()
+            call_command('migratedatabases', 'test_app', databases='default', verbosity=2,
+                         stdout=out)
+            self.assertIn('default: 1 migrations, 1 SQL operations (0 skipped by routers)',
+                          out.getvalue())
+            self.assertIn('Applied test_app.0002_', out.getvalue())
+            self.assertTrue(self.function_exists())
+
+            result, = migrate_databases(['default'], 'test_app', '0001')
+            self.assertTrue(result.ok)
+            self.assertEqual([(app, backwards) for app, _, backwards in result.migrations],
+                             [('test_app', True)])
+            self.assertFalse(self.function_exists())
+
+    def test_routers(self):
+        with self.temporary_migration_module(module='test_app.migrations_change'):
+            with self.settings(DATABASE_ROUTERS=[DenyTestAppRouter()]):
+                result, = migrate_databases(['default'], 'test_app', workers=2)
+                self.assertTrue(result.ok)
+                self.assertEqual((result.sql_operations, result.skipped_operations), (0, 1))
+                self.assertFalse(self.function_exists())
+                migrate_databases(['default'], 'test_app', '0001', fake=True)
+
+    def test_errors(self):
+        result, = migrate_databases(['default'], 'test_app', '9999')
+        self.assertFalse(result.ok)
+        self.assertIsInstance(result.error, KeyError)
+
+
+def execute_committed(sql):
+    """
+    Execute SQL in a separate connection, so that it's committed and visible to workers.
+    """
+    def execute(_):
+        with connections['default'].cursor() as cursor:
+            cursor.execute(sql)
+
+    def close():
+        connections['default'].close()
+
+    (_, error), = run_parallel(execute, [None], 1, close)
+    if error is not None:
+        raise error
+
+
+class MigrateSchemasTestCase(BaseMigrateSQLTestCase):
+    """
+    Tests applying SQL items to many schemas.
+    """
+    SCHEMAS = ['tenant1', 'tenant2', 'tenant3']
+
+    def setUp(self):
+        super(MigrateSchemasTestCase, self).setUp()
+        for schema in self.SCHEMAS:
+            execute_committed('CREATE SCHEMA {}'.format(schema))
+        self.addCleanup(execute_committed, 'DROP TABLE migrate_sql_schema_migrations')
+        for schema in self.SCHEMAS:
+            self.addCleanup(execute_committed, 'DROP SCHEMA {} CASCADE'.format(schema))
+
+    def functions(self):
+        return run_query(
+            "SELECT n.nspname FROM pg_proc p JOIN pg_namespace n ON n.oid = p.pronamespace "
+            "WHERE p.proname = 'top_books' ORDER BY n.nspname")
+
+    def test_checkpoints(self):
+        # function of another type makes migration of tenant2 fail.
+        execute_committed('CREATE FUNCTION tenant2.top_books() RETURNS int AS $$ '
+                          'BEGIN RETURN 1; END; $$ LANGUAGE plpgsql')
+
+        with self.temporary_migration_module(module='test_app.migrations_change'):
+            results = migrate_schemas(self.SCHEMAS, 'test_app', workers=2)
+            self.assertEqual([result.ok for result in results], [True, False, True])
+            self.assertEqual([len(result.migrations) for result in results], [1, 0, 1])
+            self.assertEqual(self.functions(), [('tenant1',), ('tenant2',), ('tenant3',)])
+
+            execute_committed('DROP FUNCTION tenant2.top_books()')
+            out = StringIO()
+            call_command('migrateschemas', 'test_app', schemas=','.join(self.SCHEMAS),
+                         stdout=out)
+            self.assertIn('tenant1: 0 migrations', out.getvalue())
+            self.assertIn('tenant2: 1 migrations, 1 SQL operations', out.getvalue())
+            self.assertEqual(run_query('SELECT COUNT(*) FROM tenant2.top_books()'), [(0,)])
+            # nothing is created in default schema.
+            self.assertEqual(len(self.functions()), 3)
+
+    def test_verify_cascade(self):
+        """
+        Objects of SQL items are known to verification, dependents of items dropped by
+        `CASCADE` are not reported.
+        """
+        with self.temporary_migration_module(module='test_app.migrations_cascade'):
+            with self.settings(SQL_VERIFY_CASCADE=True):
+                results = migrate_schemas(self.SCHEMAS, 'test_app', workers=2)
+            self.assertEqual([result.error for result in results], [None, None, None])
+            self.assertEqual([result.sql_operations for result in results], [4, 4, 4])
@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import connection
+from django.test import TestCase
+
+from migrate_sql.config import SQLItem
+from migrate_sql.graph import SQLStateGraph
+from migrate_sql.planner import UnsafeCascadeError, parse_drop, plan_drops, verify_cascade
+
+
+def build_graph(items):
+    graph = SQLStateGraph()
+    for sql_item in items:
+        key = ('test_app', sql_item.name)
+        graph.add_node(key, sql_item)
+        for dep in sql_item.dependencies:
+            graph.add_lazy_dependency(key, dep)
+    graph.build_graph()
+    return graph
+
+
+class DropPlannerTestCase(TestCase):
+    """
+    Tests grouping drops of SQL items into multi-object statements.
+    """
+    def test_parse_drop(self):
+        drop = parse_drop('drop  function if exists top_books(int, text), "Sale"() cascade;')
+        self.assertEqual(drop.kind, 'FUNCTION')
+        self.assertEqual(drop.names, ['top_books(int, text)', '"Sale"()'])
+        self.assertTrue(drop.if_exists)
+        self.assertEqual(drop.behavior, 'CASCADE')
+        self.assertEqual(str(drop),
+                         'DROP FUNCTION IF EXISTS top_books(int, text), "Sale"() CASCADE')
+        self.assertEqual(parse_drop(['DROP MATERIALIZED VIEW top']).kind, 'MATERIALIZED VIEW')
+
+        self.assertIsNone(parse_drop('DROP TYPE book; DROP TYPE sale'))
+        self.assertIsNone(parse_drop('DROP TYPE book -- old'))
+        self.assertIsNone(parse_drop([('DROP TYPE %s', ['book'])]))
+        self.assertIsNone(parse_drop('DROP TRIGGER book ON sale'))
+        self.assertIsNone(parse_drop('SELECT 1'))
+
+    def test_plan_drops(self):
+        graph = build_graph([
+            SQLItem('sale', 'CREATE TYPE sale', 'DROP TYPE sale'),
+            SQLItem('book', 'CREATE TYPE book', 'DROP TYPE book',
+                    dependencies=[('test_app', 'sale')]),
+            SQLItem('rating', 'CREATE TYPE rating', 'DROP TYPE rating CASCADE',
+                    dependencies=[('test_app', 'sale')]),
+            SQLItem('narration', 'CREATE TYPE narration', 'DROP TYPE narration',
+                    dependencies=[('test_app', 'book')]),
+            SQLItem('top_books', 'CREATE FUNCTION top_books()', 'DROP FUNCTION top_books()',
+                    dependencies=[('test_app', 'sale')]),
+            SQLItem('edition', 'CREATE TYPE edition', 'DROP TYPE edition',
+                    dependencies=[('test_app', 'sale')]),
+        ])
+        keys = [('test_app', name) for name in
+                ('narration', 'top_books', 'rating', 'edition', 'book', 'sale')]
+        batches = plan_drops(keys, graph, lambda key: graph.nodes[key].reverse_sql)
+
+        self.assertEqual(
+            [([key[1] for key in batch.keys], batch.statement) for batch in batches],
+            [(['narration', 'edition'], 'DROP TYPE narration, edition'),
+             (['top_books'], None),
+             (['rating'], None),
+             (['book'], None),
+             (['sale'], None)],
+        )
+
+
+class VerifyCascadeTestCase(TestCase):
+    """
+    Tests verification of objects dropped by `CASCADE`.
+    """
+    def setUp(self):
+        super(VerifyCascadeTestCase, self).setUp()
+        self.items = [
+            SQLItem('sale', 'CREATE TYPE sale AS (arg1 int)', 'DROP TYPE sale'),
+            SQLItem('book', 'CREATE TYPE book AS (sale sale)', 'DROP TYPE book',
+                    dependencies=[('test_app', 'sale')]),
+            SQLItem('top_books', 'CREATE FUNCTION top_books(book[]) RETURNS int AS '
+                                 '$$ SELECT 1 $$ LANGUAGE SQL',
+                    'DROP FUNCTION top_books(book[])', dependencies=[('test_app', 'book')]),
+        ]
+        with connection.cursor() as cursor:
+            for sql_item in self.items:
+                cursor.execute(sql_item.sql)
+
+    def test_managed(self):
+        graph = build_graph(self.items)
+        verify_cascade(connection, 'DROP TYPE sale CASCADE', [graph])
+        verify_cascade(connection, 'DROP TYPE sale', [])
+
+    def test_unmanaged(self):
+        with connection.cursor() as cursor:
+            cursor.execute('CREATE TABLE sales (book book)')
+            cursor.execute('CREATE VIEW sale_ids AS SELECT 1::int AS id, NULL::sale AS sale')
+        graph = build_graph(self.items)
+        with self.assertRaises(UnsafeCascadeError) as cm:
+            verify_cascade(connection, 'DROP TYPE sale, book CASCADE', [graph])
+        self.assertIn('column book of table sales, column sale of view sale_ids',
+                      str(cm.exception))
+        self.assertNotIn('top_books', str(cm.exception))
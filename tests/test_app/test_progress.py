@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import io
+import os
+import shutil
+import tempfile
+
+from django.core.management import call_command
+from django.db import connection
+from django.utils.six import StringIO
+
+from migrate_sql.config import SQLFile, SQLItem
+from migrate_sql.monitor import IndexBuildMonitor, IndexProgress, builds_index
+from migrate_sql.progress import format_seconds
+from migrate_sql.recorder import TimingRecorder
+
+from test_app.test_migrations import BaseMigrateSQLTestCase
+
+
+class MigrationProgressTestCase(BaseMigrateSQLTestCase):
+    """
+    Tests progress of SQL item operations reported by `migrate --sql-progress`.
+    """
+    def migrate(self, migration_name):
+        out = StringIO()
+        call_command('migrate', 'test_app', migration_name, sql_progress=True, stdout=out)
+        return out.getvalue()
+
+    def test_progress(self):
+        with self.temporary_migration_module(module='test_app.migrations_deps_update'):
+            with self.temporary_migration_module(app_label='test_app2',
+                                                 module='test_app2.migrations_deps_update'):
+                output = self.migrate('0002')
+                self.assertIn('    SQL item 1/3 test_app.book...', output)
+                self.assertIn('    SQL item 3/3 test_app.narration...', output)
+                self.assertIn('remaining unknown\n', output)
+                self.assertEqual(
+                    sorted(key[:2] for key in TimingRecorder(connection).durations()),
+                    [('test_app', 'book'), ('test_app', 'narration'), ('test_app', 'rating'),
+                     ('test_app2', 'sale')])
+
+                # unapplying is estimated by durations of unapplying.
+                output = self.migrate('0001')
+                self.assertIn('    SQL item 1/3 test_app.narration...', output)
+                self.assertIn('remaining unknown\n', output)
+
+                output = self.migrate('0002')
+                self.assertIn('    SQL item 1/3 test_app.book (expected ', output)
+                self.assertIn(', remaining ~', output)
+
+    def test_format_seconds(self):
+        self.assertEqual(format_seconds(1.25), '1.2s')
+        self.assertEqual(format_seconds(61), '1m01s')
+        self.assertEqual(format_seconds(3725), '1h02m05s')
+
+    def test_index_progress(self):
+        self.config.sql_items = [
+            SQLItem('numbers', 'CREATE TABLE numbers AS SELECT n FROM generate_series(1, 300000) n',
+                    'DROP TABLE numbers'),
+            SQLItem('numbers_md5', 'CREATE INDEX numbers_md5 ON numbers (md5(n::text))',
+                    'DROP INDEX numbers_md5', dependencies=[('test_app', 'numbers')]),
+        ]
+        with self.temporary_migration_module():
+            call_command('makemigrations', 'test_app', stdout=self.out)
+            out = StringIO()
+            with self.settings(SQL_INDEX_PROGRESS=True):
+                IndexBuildMonitor.interval, interval = 0.01, IndexBuildMonitor.interval
+                try:
+                    call_command('migrate', 'test_app', stdout=out)
+                finally:
+                    IndexBuildMonitor.interval = interval
+            output = out.getvalue()
+            # table is not committed yet, so it's reported by oid.
+            self.assertRegexpMatches(output, r'\n      index on \d+: building index')
+            self.assertIn('\n    SQL item 2/2 test_app.numbers_md5... ', output)
+            self.assertNotIn('index on ', output.split('numbers_md5')[0])
+
+    def test_index_progress_format(self):
+        self.assertTrue(builds_index([('CREATE UNIQUE INDEX a ON b (c)', None)]))
+        self.assertFalse(builds_index('DROP INDEX a'))
+
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, 'numbers.sql')
+        with io.open(path, 'w', encoding='utf-8') as sql_file:
+            sql_file.write('INSERT INTO numbers VALUES (1);\n' * 1000 +
+                           'CREATE INDEX numbers_idx ON numbers (n);')
+        sql_file = SQLFile(path)
+        # script is streamed, rather than read entirely.
+        sql_file.read = None
+        self.assertTrue(builds_index(sql_file))
+        self.assertTrue(builds_index([(sql_file, [])]))
+        self.assertFalse(builds_index(SQLFile(path, length=32)))
+        self.assertEqual(str(IndexProgress('book', None, 'initializing', 0, 0, 0, 0)),
+                         'index on book: initializing, blocks 0/0, tuples 0/0')
+        self.assertEqual(str(IndexProgress('book', 'book_name', 'building index', 1, 2, 3, 4)),
+                         'index book_name on book: building index, blocks 1/2, tuples 3/4')
@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import threading
+
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connections
+from django.utils.six import StringIO
+
+from migrate_sql.config import MaterializedView, SQLItem
+from migrate_sql.parallel import DependencyFailed, run_ordered, run_parallel
+
+from test_app.test_migrations import BaseMigrateSQLTestCase
+from test_app.test_parallel import execute_committed
+
+
+def query_committed(sql):
+    """
+    Run query in a separate connection, so that views read are not locked by test transaction.
+    """
+    def query(_):
+        with connections['default'].cursor() as cursor:
+            cursor.execute(sql)
+            return cursor.fetchall()
+
+    def close():
+        connections['default'].close()
+
+    (result, error), = run_parallel(query, [None], 1, close)
+    if error is not None:
+        raise error
+    return result
+
+
+class RefreshViewsTestCase(BaseMigrateSQLTestCase):
+    """
+    Tests refreshing materialized views in order of dependencies.
+
+    NOTE: views are refreshed in separate threads and connections, so they are created and
+    dropped in committed transactions.
+    """
+    def setUp(self):
+        super(RefreshViewsTestCase, self).setUp()
+        self.config.sql_items = [
+            MaterializedView('book_names', 'SELECT id, name FROM test_app_book',
+                             indexes=[('book_names_id',
+                                       'CREATE UNIQUE INDEX {index} ON {view} (id)')]),
+            SQLItem('upper_names', 'CREATE VIEW upper_names AS SELECT upper(name) AS name '
+                                   'FROM book_names', 'DROP VIEW upper_names',
+                    dependencies=[('test_app', 'book_names')]),
+            MaterializedView('upper_counts',
+                             'SELECT name, count(*) FROM upper_names GROUP BY name',
+                             dependencies=[('test_app', 'upper_names')]),
+            MaterializedView('author_names', 'SELECT DISTINCT author FROM test_app_book'),
+        ]
+        for sql_item in self.config.sql_items:
+            for sql in (sql_item.sql if isinstance(sql_item.sql, list) else [sql_item.sql]):
+                execute_committed(sql)
+        for sql_item in self.config.sql_items:
+            self.addCleanup(execute_committed, sql_item.reverse_sql)
+        execute_committed("INSERT INTO test_app_book (name, author, published) "
+                          "VALUES ('Dune', 'Frank Herbert', true)")
+        self.addCleanup(execute_committed, 'DELETE FROM test_app_book')
+
+    def refresh(self, *app_labels):
+        out = StringIO()
+        call_command('refreshsqlviews', *app_labels, stdout=out)
+        return out.getvalue()
+
+    def test_refresh(self):
+        output = self.refresh()
+        self.assertIn('test_app.book_names: refreshed concurrently in ', output)
+        self.assertIn('test_app.upper_counts: refreshed in ', output)
+        self.assertIn('test_app.author_names: refreshed in ', output)
+        # upper_counts is refreshed after book_names, which it reads through upper_names.
+        self.assertEqual(query_committed('SELECT name, count FROM upper_counts'), [('DUNE', 1)])
+
+    def test_mixed_case(self):
+        """
+        View of item named in mixed case should be refreshed by name it's created by.
+        """
+        view = MaterializedView('Book_Ids', 'SELECT id FROM test_app_book', indexes=[
+            ('book_ids_id', 'CREATE UNIQUE INDEX {index} ON {view} (id)'),
+        ])
+        for sql in view.sql:
+            execute_committed(sql)
+        self.addCleanup(execute_committed, view.reverse_sql)
+        self.config.sql_items = [view]
+        self.assertIn('test_app.Book_Ids: refreshed concurrently in ', self.refresh())
+
+    def test_failed(self):
+        execute_committed('ALTER MATERIALIZED VIEW book_names RENAME TO book_names_old')
+        self.addCleanup(execute_committed,
+                        'ALTER MATERIALIZED VIEW book_names_old RENAME TO book_names')
+        with self.assertRaisesRegexp(CommandError, 'Refresh failed for views: '
+                                                   'test_app.book_names, test_app.upper_counts.'):
+            self.refresh('test_app')
+        self.assertEqual(query_committed('SELECT author FROM author_names'),
+                         [('Frank Herbert',)])
+
+    def test_run_ordered(self):
+        lock = threading.Lock()
+        started = []
+
+        def task(number):
+            with lock:
+                started.append(number)
+            if number == 2:
+                raise ValueError(number)
+            return number
+
+        dependencies = {3: [1], 4: [2], 5: [4, 1], 6: [7]}
+        results = run_ordered(task, list(range(1, 7)), dependencies, 3)
+        self.assertEqual([result for result, _ in results], [1, None, 3, None, None, 6])
+        self.assertIsInstance(results[1][1], ValueError)
+        self.assertIsInstance(results[3][1], DependencyFailed)
+        self.assertIsInstance(results[4][1], DependencyFailed)
+        self.assertEqual(sorted(started), [1, 2, 3, 6])
+        self.assertLess(started.index(1), started.index(3))
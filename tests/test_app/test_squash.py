@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import os
+
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db.migrations.loader import MigrationLoader
+
+from migrate_sql.graph import SQLStateGraph
+from migrate_sql.squash import SquashError, verify_baseline
+
+from test_app.test_migrations import BaseMigrateSQLTestCase, item, run_query
+
+
+class SquashSQLTestCase(BaseMigrateSQLTestCase):
+    """
+    Tests collapsing SQL item migrations into a baseline migration.
+    """
+    def test_squash(self):
+        with self.temporary_migration_module(app_label='test_app2') as path:
+            self.config2.sql_items = [item('sale', 1), item('product', 1, [('test_app2', 'sale')])]
+            call_command('makemigrations', 'test_app2', stdout=self.out)
+            self.config2.sql_items = [item('sale', 2), item('product', 1, [('test_app2', 'sale')])]
+            call_command('makemigrations', 'test_app2', stdout=self.out)
+            self.config2.sql_items = [item('sale', 2), item('rating', 1)]
+            call_command('makemigrations', 'test_app2', stdout=self.out)
+
+            call_command('squashsql', 'test_app2', stdout=self.out)
+            loader = MigrationLoader(None, load=True)
+            baseline = loader.get_migration_by_prefix('test_app2', '0001_squashed_sql')
+            self.assertEqual(len(baseline.replaces), 3)
+            self.assertEqual([(op.__class__.__name__, op.name) for op in baseline.operations],
+                             [('CreateSQL', 'rating'), ('CreateSQL', 'sale')])
+            self.assertEqual(len(os.listdir(path)), 5)
+
+            # fresh database runs baseline, which results in the same state.
+            call_command('migrate', 'test_app2', stdout=self.out)
+            self.assertEqual(run_query("SELECT typname FROM pg_type WHERE typname IN "
+                                       "('sale', 'product', 'rating') ORDER BY typname"),
+                             [('rating',), ('sale',)])
+            self.assertEqual(run_query('SELECT (ROW(1, 2)::sale).arg2'), [(2,)])
+            out = self.out.getvalue()
+            self.assertIn('Applying test_app2.0001_squashed_sql_', out)
+            self.assertNotIn('Applying test_app2.0003_', out)
+            call_command('makemigrations', 'test_app2', stdout=self.out)
+            self.assertIn('No changes detected', self.out.getvalue())
+
+            with self.assertRaisesRegexp(CommandError, 'squashed already'):
+                call_command('squashsql', 'test_app2', '0001_squashed', stdout=self.out)
+
+    def test_verbose(self):
+        with self.temporary_migration_module(app_label='test_app2') as path:
+            self.config2.sql_items = [item('sale', 1)]
+            call_command('makemigrations', 'test_app2', stdout=self.out)
+            self.config2.sql_items = [item('sale', 2)]
+            call_command('makemigrations', 'test_app2', stdout=self.out)
+
+            call_command('squashsql', 'test_app2', dry_run=True, verbosity=3, stdout=self.out)
+            self.assertIn("migrate_sql.operations.CreateSQL(\n            name='sale',",
+                          self.out.getvalue())
+            self.assertFalse(any(name.startswith('0001_squashed') for name in os.listdir(path)))
+
+    def test_not_sql(self):
+        with self.temporary_migration_module():
+            with self.assertRaisesRegexp(CommandError, r'operations other than SQL item ones '
+                                                       r'\(CreateModel\)'):
+                call_command('squashsql', 'test_app', stdout=self.out)
+
+    def test_verify(self):
+        sql_state = SQLStateGraph()
+        sql_state.add_node(('test_app', 'sale'), item('sale', 1))
+        with self.assertRaisesRegexp(SquashError, 'differs from migrations in SQL items: '
+                                                  'test_app.sale.'):
+            verify_baseline([], sql_state, 'test_app')
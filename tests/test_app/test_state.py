@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.test import TestCase
+from django.db.migrations.state import ProjectState
+
+from migrate_sql.config import SQLItem
+from migrate_sql.graph import PersistentDict, SQLStateGraph
+from migrate_sql.operations import AlterSQL, AlterSQLState, CreateSQL, DeleteSQL
+
+
+class SQLStateGraphCloneTestCase(TestCase):
+    """
+    Tests copy-on-write behavior of SQL state graph.
+    """
+    def setUp(self):
+        super(SQLStateGraphCloneTestCase, self).setUp()
+        self.graph = SQLStateGraph()
+        self.graph.add_node(('app', 'a'), SQLItem('a', 'CREATE a', 'DROP a'))
+        self.graph.add_node(('app', 'b'), SQLItem('b', 'CREATE b', 'DROP b', [('app', 'a')]))
+        self.graph.add_lazy_dependency(('app', 'b'), ('app', 'a'))
+
+    def test_clone_shares_structure(self):
+        clone = self.graph.clone()
+        self.assertIs(clone.nodes._parent, self.graph.nodes._parent)
+        self.assertIs(clone.dependencies._parent, self.graph.dependencies._parent)
+        self.assertEqual(clone.nodes, self.graph.nodes)
+        self.assertEqual(clone.dependencies, self.graph.dependencies)
+
+    def test_changes_are_isolated(self):
+        clone = self.graph.clone()
+        clone.add_node(('app', 'c'), SQLItem('c', 'CREATE c'))
+        clone.add_lazy_dependency(('app', 'c'), ('app', 'b'))
+        clone.remove_lazy_dependency(('app', 'b'), ('app', 'a'))
+        clone.update_node(('app', 'a'), sql='CREATE a2')
+        self.graph.remove_node(('app', 'b'))
+        self.graph.remove_lazy_for_child(('app', 'b'))
+
+        self.assertEqual(set(self.graph.nodes), {('app', 'a')})
+        self.assertEqual(self.graph.nodes[('app', 'a')].sql, 'CREATE a')
+        self.assertNotIn(('app', 'b'), self.graph.dependencies)
+
+        self.assertEqual(set(clone.nodes), {('app', 'a'), ('app', 'b'), ('app', 'c')})
+        self.assertEqual(clone.nodes[('app', 'a')].sql, 'CREATE a2')
+        self.assertEqual(clone.dependencies[('app', 'b')], set())
+        self.assertEqual(clone.dependencies[('app', 'c')], {('app', 'b')})
+
+    def test_build_graph_does_not_leak(self):
+        clone = self.graph.clone()
+        clone.add_node(('app', 'c'), SQLItem('c', 'CREATE c'))
+        clone.add_lazy_dependency(('app', 'c'), ('app', 'a'))
+        clone.build_graph()
+        self.graph.build_graph()
+        self.assertEqual({n.key for n in clone.node_map[('app', 'a')].children},
+                         {('app', 'b'), ('app', 'c')})
+        self.assertEqual({n.key for n in self.graph.node_map[('app', 'a')].children},
+                         {('app', 'b')})
+
+    def test_reachability(self):
+        self.graph.add_node(('app', 'c'), SQLItem('c', 'CREATE c'))
+        self.graph.add_lazy_dependency(('app', 'c'), ('app', 'b'))
+        self.graph.add_node(('app', 'd'), SQLItem('d', 'CREATE d'))
+        self.graph.add_lazy_dependency(('app', 'd'), ('app', 'a'))
+        self.graph.build_graph()
+        self.assertEqual(self.graph.descendants_of([('app', 'b')]), [('app', 'c'), ('app', 'b')])
+        self.assertEqual(self.graph.descendants_of([('app', 'a')])[-1], ('app', 'a'))
+        self.assertEqual(set(self.graph.descendants_of([('app', 'a')])),
+                         {('app', 'a'), ('app', 'b'), ('app', 'c'), ('app', 'd')})
+        self.assertEqual(self.graph.ancestors_of([('app', 'c'), ('app', 'd')]),
+                         [('app', 'd'), ('app', 'c'), ('app', 'b'), ('app', 'a')])
+
+
+class PersistentDictTestCase(TestCase):
+    """
+    Tests versions of persistent dictionary.
+    """
+    def test_versions(self):
+        versions = [PersistentDict({'a': 0})]
+        for i in range(1, 3 * PersistentDict.MAX_DEPTH):
+            version = versions[-1].clone()
+            version['a'] = i
+            version[i] = i
+            if i % 3 == 0:
+                del version[i - 1]
+            versions.append(version)
+            self.assertLessEqual(version._parent.depth, PersistentDict.MAX_DEPTH)
+
+        for i, version in enumerate(versions):
+            expected = {'a': i}
+            expected.update((k, k) for k in range(1, i + 1) if k % 3 != 2 or k == i)
+            self.assertEqual(dict(version), expected)
+            self.assertEqual(len(version), len(expected))
+
+    def test_default(self):
+        data = PersistentDict(default=frozenset)
+        self.assertEqual(data['missing'], frozenset())
+        self.assertNotIn('missing', data)
+        with self.assertRaises(KeyError):
+            PersistentDict()['missing']
+
+
+class ProjectStateCloneTestCase(TestCase):
+    """
+    Tests SQL state preserved by operations through cloning of project state.
+    """
+    def test_clone_preserves_sql_state(self):
+        state = ProjectState()
+        CreateSQL('a', 'CREATE a', 'DROP a').state_forwards('app', state)
+        CreateSQL('b', 'CREATE b', 'DROP b').state_forwards('app', state)
+
+        cloned = state.clone()
+        self.assertEqual(set(cloned.sql_state.nodes), {('app', 'a'), ('app', 'b')})
+
+        AlterSQL('a', 'CREATE a2', 'DROP a2').state_forwards('app', cloned)
+        AlterSQLState('b', add_dependencies=(('app', 'a'),)).state_forwards('app', cloned)
+        DeleteSQL('a', 'DROP a', 'CREATE a').state_forwards('app', state)
+
+        # clones of clones keep SQL state too.
+        cloned = cloned.clone()
+        self.assertEqual(cloned.sql_state.nodes[('app', 'a')].sql, 'CREATE a2')
+        self.assertEqual(cloned.sql_state.nodes[('app', 'b')].dependencies, [('app', 'a')])
+        self.assertEqual(cloned.sql_state.dependencies[('app', 'b')], {('app', 'a')})
+        self.assertEqual(set(state.sql_state.nodes), {('app', 'b')})
+        self.assertEqual(state.sql_state.nodes[('app', 'b')].dependencies, [])
+
+    def test_alter_dependencies(self):
+        """
+        Dependencies added by `AlterSQLState` should be appended to item, removed ones should be
+        removed from it.
+        """
+        state = ProjectState()
+        CreateSQL('a', 'CREATE a', 'DROP a').state_forwards('app', state)
+        CreateSQL('b', 'CREATE b', 'DROP b').state_forwards('app', state)
+        CreateSQL('c', 'CREATE c', 'DROP c', dependencies=[('app', 'a')]).state_forwards(
+            'app', state)
+
+        AlterSQLState('c', add_dependencies=(('app', 'b'), ('app', 'a')),
+                      remove_dependencies=(('app', 'a'),)).state_forwards('app', state)
+        self.assertEqual(state.sql_state.nodes[('app', 'c')].dependencies, [('app', 'b')])
+        self.assertEqual(state.sql_state.dependencies[('app', 'c')], {('app', 'b')})
+
+        AlterSQLState('c', add_dependencies=(('app', 'a'), ('app', 'b'))).state_forwards(
+            'app', state)
+        self.assertEqual(state.sql_state.nodes[('app', 'c')].dependencies,
+                         [('app', 'b'), ('app', 'a')])
+        self.assertEqual(state.sql_state.dependencies[('app', 'c')],
+                         {('app', 'a'), ('app', 'b')})
@@ -1,9 +1,24 @@
 # -*- coding: utf-8 -*-
 from __future__ import unicode_literals
 
+import io
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+from importlib import import_module
+
+from django.db import connection
+from django.db.migrations.state import ProjectState
 from django.test import TestCase
 
+import migrate_sql
 from migrate_sql.autodetector import is_sql_equal
+from migrate_sql.config import MaterializedView, SQLFile, SQLItem, resolve_sql, sql_fingerprint
+from migrate_sql.graph import build_current_graph
+from migrate_sql.operations import CreateSQL
+from migrate_sql.splitter import SplitCache, iter_statements, split_cache, split_sql
 
 
 class SQLComparisonTestCase(TestCase):
@@ -24,6 +39,12 @@ class SQLComparisonTestCase(TestCase):
         self.assertFalse(is_sql_equal([('SELECT %s', [1]), ('SELECT %s', [2])],
                                       [('SELECT %s', [1]), ('SELECT %s', [3])]))
 
+    def test_params_sequences(self):
+        self.assertTrue(is_sql_equal([('SELECT %s', (1,))], [('SELECT %s', [1])]))
+        self.assertTrue(is_sql_equal([('SELECT %(a)s', {'a': (1,)})],
+                                     [('SELECT %(a)s', {'a': [1]})]))
+        self.assertFalse(is_sql_equal([('SELECT %s', (1,))], [('SELECT %s', [1, 2])]))
+
     def test_mixed_with_params(self):
         self.assertFalse(is_sql_equal([('SELECT %s', [1]), ('SELECT %s', [2])],
                                       ['SELECT 1', ('SELECT %s', [2])]))
@@ -33,3 +54,216 @@ class SQLComparisonTestCase(TestCase):
     def test_mixed_nesting(self):
         self.assertTrue(is_sql_equal('SELECT 1', ['SELECT 1']))
         self.assertFalse(is_sql_equal('SELECT 1', [('SELECT %s', [1])]))
+
+
+class SQLFileTestCase(TestCase):
+    """
+    Tests SQL items stored in separate files.
+    """
+    def setUp(self):
+        super(SQLFileTestCase, self).setUp()
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def make_file(self, name, content, encoding='utf-8'):
+        path = os.path.join(self.directory, name)
+        with io.open(path, 'w', encoding=encoding, newline='') as sql_file:
+            sql_file.write(content)
+        return SQLFile(path, encoding=encoding)
+
+    def test_fingerprint(self):
+        sql_file = self.make_file('a.sql', 'SELECT \'\u0444\';\r\n')
+        self.assertEqual(sql_file.fingerprint, sql_fingerprint('SELECT \'\u0444\';\r\n'))
+        self.assertEqual(sql_file.read(), 'SELECT \'\u0444\';\r\n')
+
+        latin = self.make_file('b.sql', 'SELECT \'\xe9\'', encoding='latin-1')
+        self.assertEqual(latin.fingerprint, sql_fingerprint('SELECT \'\xe9\''))
+
+        empty = self.make_file('c.sql', '')
+        self.assertEqual(empty.fingerprint, sql_fingerprint(''))
+
+    def test_mmap(self):
+        content = 'SELECT 1;\n' * 1000
+        sql_file = self.make_file('a.sql', content)
+        sql_file.MMAP_THRESHOLD = 100
+        self.assertEqual(sql_file.fingerprint, sql_fingerprint(content))
+
+    def test_is_sql_equal(self):
+        sql_file = self.make_file('a.sql', 'SELECT %s')
+        self.assertTrue(is_sql_equal(sql_file, 'SELECT %s'))
+        self.assertTrue(is_sql_equal(['SELECT %s'], [sql_file]))
+        self.assertTrue(is_sql_equal([(sql_file, [1])], [('SELECT %s', [1])]))
+        self.assertFalse(is_sql_equal([(sql_file, [1])], [('SELECT %s', [2])]))
+        self.assertFalse(is_sql_equal(sql_file, 'SELECT 1'))
+        self.assertTrue(is_sql_equal(sql_file, self.make_file('b.sql', 'SELECT %s')))
+
+    def test_resolve_sql(self):
+        sql_file = self.make_file('a.sql', 'SELECT %s')
+        self.assertEqual(resolve_sql(sql_file), 'SELECT %s')
+        self.assertEqual(resolve_sql(['SELECT 1', (sql_file, [1])]),
+                         ['SELECT 1', ('SELECT %s', [1])])
+        self.assertIsNone(resolve_sql(None))
+
+    def test_iter_chunks(self):
+        sql_file = self.make_file('a.sql', 'SELECT \'\u0444\u0444\u0444\';')
+        # multibyte characters are split by chunks of bytes.
+        self.assertEqual(list(sql_file.iter_chunks(3)),
+                         ['SEL', 'ECT', " '", '\u0444\u0444', "\u0444'", ';'])
+        part = SQLFile(sql_file.path, offset=8, length=6)
+        self.assertEqual(''.join(part.iter_chunks(4)), '\u0444\u0444\u0444')
+
+    def test_materialized_view(self):
+        """
+        Query of view stored in a file should not be read until SQL of view is needed.
+        """
+        path = os.path.join(self.directory, 'view.sql')
+        view = MaterializedView('top_books', SQLFile(path))
+        self.make_file('view.sql', 'SELECT 1')
+        self.assertEqual(view.sql, ['CREATE MATERIALIZED VIEW top_books AS SELECT 1'])
+
+    def test_streaming(self):
+        sql_file = self.make_file('a.sql', 'CREATE TABLE a (id int); -- a\nCREATE TABLE b (id int)')
+        state = ProjectState()
+        with connection.schema_editor(collect_sql=True) as schema_editor:
+            operation = CreateSQL('a', sql_file)
+            operation.database_forwards('test_app', schema_editor, state, state)
+            operation = CreateSQL('b', ['SELECT 1', (sql_file, [])])
+            operation.database_forwards('test_app', schema_editor, state, state)
+        self.assertEqual(schema_editor.collected_sql, [
+            'CREATE TABLE a (id int);',
+            '-- a\nCREATE TABLE b (id int);',
+            'SELECT 1;',
+            'CREATE TABLE a (id int); -- a\nCREATE TABLE b (id int);',
+        ])
+
+
+class StatementSplitterTestCase(TestCase):
+    """
+    Tests splitting of SQL scripts into statements.
+    """
+    SCRIPT = (
+        '-- comment; with semicolon\n'
+        'CREATE FUNCTION f() RETURNS int AS $$\n'
+        'BEGIN\n'
+        '    RETURN 1; /* nested /* ; */ comment ; */\n'
+        'END;\n'
+        '$$ LANGUAGE plpgsql;\n'
+        '/* comment only; */ ;\n'
+        'SELECT \'a;\'\'b\', "c;""d", E\'e\\\';f\', $tag$ $$ ; $tag$, $1, g$h;\n'
+        'SELECT 1 - 2 / 3'
+    )
+    STATEMENTS = [
+        '-- comment; with semicolon\n'
+        'CREATE FUNCTION f() RETURNS int AS $$\n'
+        'BEGIN\n'
+        '    RETURN 1; /* nested /* ; */ comment ; */\n'
+        'END;\n'
+        '$$ LANGUAGE plpgsql;',
+        'SELECT \'a;\'\'b\', "c;""d", E\'e\\\';f\', $tag$ $$ ; $tag$, $1, g$h;',
+        'SELECT 1 - 2 / 3',
+    ]
+
+    def test_split(self):
+        self.assertEqual(split_sql(self.SCRIPT), self.STATEMENTS)
+        self.assertEqual(split_sql(' -- nothing\n; '), [])
+
+    def test_chunks(self):
+        for size in range(1, 20):
+            chunks = [self.SCRIPT[i:i + size] for i in range(0, len(self.SCRIPT), size)]
+            self.assertEqual(list(iter_statements(chunks)), self.STATEMENTS)
+
+    def test_mysql(self):
+        script = ('# don\'t; do this\n'
+                  'INSERT INTO t VALUES (\'it\\\'s; ok\', "a\\";b");\n'
+                  'SELECT 1; SELECT 2 # last;')
+        statements = ['# don\'t; do this\nINSERT INTO t VALUES (\'it\\\'s; ok\', "a\\";b");',
+                      'SELECT 1;', 'SELECT 2 # last;']
+        self.assertEqual(split_sql(script, 'mysql'), statements)
+        for size in range(1, 10):
+            chunks = [script[i:i + size] for i in range(0, len(script), size)]
+            self.assertEqual(list(iter_statements(chunks, 'mysql')), statements)
+        # backslash is not an escape and `#` is an operator in other dialects.
+        self.assertEqual(split_sql('SELECT \'a\\\'; SELECT 1 # 2;'),
+                         ['SELECT \'a\\\';', 'SELECT 1 # 2;'])
+        self.assertEqual(split_sql('SELECT \'a\\\'; SELECT 1', 'sqlite'),
+                         ['SELECT \'a\\\';', 'SELECT 1'])
+
+    def test_cache(self):
+        cache = SplitCache(size=2)
+        statements = cache.split(self.SCRIPT)
+        self.assertEqual(list(statements), self.STATEMENTS)
+        self.assertIs(cache.split(self.SCRIPT), statements)
+        cache.split('SELECT 1')
+        cache.split('SELECT 2')
+        self.assertIsNot(cache.split(self.SCRIPT), statements)
+        self.assertEqual(cache.split("SELECT 'a\\'; b';"), ("SELECT 'a\\';", "b';"))
+        self.assertEqual(cache.split("SELECT 'a\\'; b';", 'mysql'), ("SELECT 'a\\'; b';",))
+
+    def test_operation(self):
+        """
+        Scripts are split on backends using Django's default (`sqlparse`) implementation.
+        """
+        from django.db.backends.base.operations import BaseDatabaseOperations
+
+        ops_class = connection.ops.__class__
+        state = ProjectState()
+        with connection.schema_editor(collect_sql=True) as schema_editor:
+            CreateSQL('a', self.SCRIPT).database_forwards('test_app', schema_editor, state, state)
+            connection.ops.__class__ = type(str('DefaultSplitOperations'), (ops_class,), {
+                'prepare_sql_script': BaseDatabaseOperations.__dict__['prepare_sql_script'],
+            })
+            try:
+                split_cache.clear()
+                CreateSQL('a', self.SCRIPT).database_forwards(
+                    'test_app', schema_editor, state, state)
+            finally:
+                connection.ops.__class__ = ops_class
+        self.assertEqual(schema_editor.collected_sql[0], self.SCRIPT + ';')
+        self.assertEqual(schema_editor.collected_sql[1:], self.STATEMENTS[:2] + [
+            self.STATEMENTS[2] + ';'])
+
+    def test_operation_vendor(self):
+        """
+        Scripts are split in dialect of database vendor.
+        """
+        from django.db.backends.base.operations import BaseDatabaseOperations
+
+        ops_class = connection.ops.__class__
+        state = ProjectState()
+        script = "INSERT INTO t VALUES ('it\\'s; ok'); # don't;\nSELECT 1;"
+        connection.ops.__class__ = type(str('DefaultSplitOperations'), (ops_class,), {
+            'prepare_sql_script': BaseDatabaseOperations.__dict__['prepare_sql_script'],
+        })
+        connection.vendor = 'mysql'
+        try:
+            with connection.schema_editor(collect_sql=True) as schema_editor:
+                CreateSQL('a', script).database_forwards('test_app', schema_editor, state, state)
+        finally:
+            del connection.vendor
+            connection.ops.__class__ = ops_class
+        self.assertEqual(schema_editor.collected_sql, [
+            "INSERT INTO t VALUES ('it\\'s; ok');", "# don't;\nSELECT 1;"])
+
+
+class LazyImportTestCase(TestCase):
+    """
+    Tests settings and Django internals are not touched when migrations are imported.
+    """
+    def test_operations_import(self):
+        code = (
+            'import sys; import migrate_sql.operations; '
+            'assert "django.db.migrations.graph" not in sys.modules; '
+            'assert "migrate_sql.graph" not in sys.modules'
+        )
+        env = dict(os.environ)
+        env.pop('DJANGO_SETTINGS_MODULE', None)
+        root = os.path.dirname(os.path.dirname(os.path.abspath(migrate_sql.__file__)))
+        subprocess.check_call([sys.executable, '-c', code], cwd=root, env=env)
+
+    def test_config_module_setting(self):
+        config = import_module('test_app.sql_config')
+        config.sql_items = [SQLItem('top_books', 'SELECT 1')]
+        self.addCleanup(delattr, config, 'sql_items')
+        self.assertEqual(set(build_current_graph().nodes), {('test_app', 'top_books')})
+        with self.settings(SQL_CONFIG_MODULE='missing_sql_config'):
+            self.assertEqual(set(build_current_graph().nodes), set())
@@ -0,0 +1,156 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import io
+import os
+import shutil
+import sys
+import tempfile
+from importlib import import_module
+
+from django.db.migrations.graph import NodeNotFoundError
+from django.db.migrations.loader import MigrationLoader
+
+from migrate_sql.config import SQLFile, SQLItem
+from migrate_sql.watch import SQLWatcher
+
+from test_app.test_migrations import BaseMigrateSQLTestCase, item
+
+
+class SQLWatcherTestCase(BaseMigrateSQLTestCase):
+    """
+    Tests incremental detection of SQL item changes by `makemigrations --watch`.
+    """
+    def setUp(self):
+        super(SQLWatcherTestCase, self).setUp()
+        self.config.sql_items = [
+            item('book', 1),
+            item('rating', 1),
+            item('narration', 1, [('test_app2', 'sale'), ('test_app', 'book')]),
+        ]
+        self.config2.sql_items = [item('sale', 1)]
+
+    def get_changes(self, watcher):
+        return {app_label: [(op.__class__.__name__, op.name) for op in operations]
+                for app_label, operations in watcher.changes().items()}
+
+    def test_refresh(self):
+        with self.temporary_migration_module(module='test_app.migrations_deps_update'):
+            with self.temporary_migration_module(app_label='test_app2',
+                                                 module='test_app2.migrations_deps_update'):
+                watcher = SQLWatcher(MigrationLoader(None, load=True))
+                self.assertEqual(watcher.changes(), {})
+
+                # dependents in other apps are changed too.
+                self.config2.sql_items = [item('sale', 2)]
+                watcher.refresh(['test_app2'])
+                self.assertEqual(self.get_changes(watcher), {
+                    'test_app': [('ReverseAlterSQL', 'narration'), ('AlterSQL', 'narration')],
+                    'test_app2': [('ReverseAlterSQL', 'sale'), ('AlterSQL', 'sale')],
+                })
+
+                self.config.sql_items.pop(1)
+                watcher.refresh(['test_app'])
+                self.assertEqual(self.get_changes(watcher)['test_app'],
+                                 [('ReverseAlterSQL', 'narration'), ('AlterSQL', 'narration'),
+                                  ('DeleteSQL', 'rating')])
+
+                self.config2.sql_items = [item('sale', 1)]
+                watcher.refresh(['test_app2'])
+                self.assertEqual(self.get_changes(watcher), {'test_app': [('DeleteSQL', 'rating')]})
+
+                # module changed on disk is reloaded, it has no SQL items.
+                watcher.mtimes['test_app'] = None
+                self.assertEqual(watcher.poll(), ['test_app'])
+                watcher.refresh(['test_app'])
+                self.assertEqual(
+                    sorted(self.get_changes(watcher)['test_app']),
+                    [('DeleteSQL', 'book'), ('DeleteSQL', 'narration'), ('DeleteSQL', 'rating')])
+                self.assertEqual(watcher.poll(), [])
+
+    def test_sql_file(self):
+        """
+        Items of app are refreshed, when files they are stored in change.
+        """
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, 'book.sql')
+
+        def write(sql):
+            with io.open(path, 'w', encoding='utf-8') as sql_file:
+                sql_file.write(sql)
+
+        book = item('book', 1)
+        write(book.sql)
+        self.config.sql_items[0] = SQLItem('book', SQLFile(path), book.reverse_sql)
+        with self.temporary_migration_module(module='test_app.migrations_deps_update'):
+            with self.temporary_migration_module(app_label='test_app2',
+                                                 module='test_app2.migrations_deps_update'):
+                watcher = SQLWatcher(MigrationLoader(None, load=True))
+                self.assertEqual(watcher.changes(), {})
+                self.assertEqual(watcher.poll(), [])
+
+                write(item('book', 2).sql)
+                # modification time may not change within resolution of file system.
+                os.utime(path, (0, 0))
+                self.assertEqual(watcher.poll(), ['test_app'])
+                watcher.refresh(['test_app'])
+                self.assertEqual(self.get_changes(watcher)['test_app'],
+                                 [('ReverseAlterSQL', 'narration'), ('ReverseAlterSQL', 'book'),
+                                  ('AlterSQL', 'book'), ('AlterSQL', 'narration')])
+                self.assertEqual(watcher.poll(), [])
+
+    def test_errors(self):
+        """
+        Errors of SQL items are reported, previous items are kept until errors are fixed.
+        """
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        sys.path.insert(0, directory)
+        self.addCleanup(sys.path.remove, directory)
+        self.addCleanup(sys.modules.pop, 'watched_sql_config', None)
+        path = os.path.join(directory, 'watched_sql_config.py')
+        mtimes = iter(range(1, 10))
+
+        def write(*lines):
+            with io.open(path, 'w', encoding='utf-8') as module_file:
+                module_file.write('\n'.join(
+                    ('from test_app.test_migrations import item',) + lines + ('',)))
+            # modification time may not change within resolution of file system.
+            mtime = next(mtimes)
+            os.utime(path, (mtime, mtime))
+
+        write("sql_items = [item('book', 1), item('rating', 1),",
+              "             item('narration', 1, [('test_app2', 'sale'), ('test_app', 'book')])]")
+        with self.temporary_migration_module(module='test_app.migrations_deps_update'):
+            with self.temporary_migration_module(app_label='test_app2',
+                                                 module='test_app2.migrations_deps_update'):
+                watcher = SQLWatcher(MigrationLoader(None, load=True))
+                # module of the same SQL items is read on next update.
+                watcher.modules['test_app'] = import_module('watched_sql_config')
+                self.assertEqual(watcher.update(), {})
+                errors = []
+
+                write("sql_items = [item('book', 2)")
+                self.assertEqual(watcher.update(errors.append), None)
+                self.assertIsInstance(errors.pop(), SyntaxError)
+                self.assertEqual(watcher.update(errors.append), None)
+                self.assertEqual(errors, [])
+
+                write("sql_items = [item('book', 2, [('test_app', 'missing')])]")
+                self.assertEqual(watcher.update(errors.append), None)
+                self.assertIsInstance(errors.pop(), NodeNotFoundError)
+                self.assertEqual(watcher.changes(), {})
+                write("sql_items = [item('book', 3, [('test_app', 'missing')])]")
+                with self.assertRaises(NodeNotFoundError):
+                    watcher.update()
+                self.assertEqual(watcher.changes(), {})
+
+                write("sql_items = [item('book', 2), item('rating', 1),",
+                      "             item('narration', 1, [('test_app2', 'sale'),",
+                      "                                   ('test_app', 'book')])]")
+                self.assertIsNotNone(watcher.update(errors.append))
+                self.assertEqual(errors, [])
+                self.assertEqual(self.get_changes(watcher)['test_app'],
+                                 [('ReverseAlterSQL', 'narration'), ('ReverseAlterSQL', 'book'),
+                                  ('AlterSQL', 'book'), ('AlterSQL', 'narration')])